@@ -0,0 +1,84 @@
+"""Benchmark memori baris dict vs record compact (fetch_query(compact=True))
+
+Contoh:
+    python bench_rows.py --rows 100000            # database SQLite sementara
+    python bench_rows.py --use-config --rows 50000  # database dari .env (tabel pasien)
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark memori baris dict vs compact")
+    parser.add_argument('--rows', type=int, default=100000, help="jumlah baris yang diambil")
+    parser.add_argument('--use-config', action='store_true',
+                        help="pakai database dari .env, bukan SQLite sementara berisi data sintetis")
+    return parser.parse_args()
+
+
+def measure(db, query, params, compact):
+    """Mengembalikan (jumlah baris, byte yang ditahan hasil, detik)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    rows = db.fetch_query(query, params, compact=compact)
+    elapsed = time.perf_counter() - started
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return len(rows or []), held, elapsed
+
+
+def main():
+    args = parse_args()
+    temp_dir = None
+    if not args.use_config:
+        temp_dir = tempfile.TemporaryDirectory()
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = os.path.join(temp_dir.name, 'bench.db')
+    os.environ.setdefault('DB_SLOW_QUERY_MS', '0')
+
+    from tabulate import tabulate
+    from database import db
+    from log_config import setup_logging
+    from models import Pasien
+
+    setup_logging(quiet=True)
+    if not db.create_database_and_tables():
+        return 1
+
+    if temp_dir:
+        Pasien.save_many(({
+            'nomor_rm': f"RM{i:08d}",
+            'nama_lengkap': f"Pasien Benchmark {i}",
+            'nik': f"{3200000000000000 + i}",
+            'tanggal_lahir': '1990-01-01',
+            'jenis_kelamin': 'LP'[i % 2],
+            'alamat': f"Jl. Contoh No. {i}",
+            'nomor_telepon': f"08{i:010d}",
+        } for i in range(args.rows)), chunk_size=5000)
+
+    query = "SELECT * FROM pasien ORDER BY id LIMIT %s"
+    results = []
+    for label, compact in (("dict", False), ("compact", True)):
+        count, held, elapsed = measure(db, query, (args.rows,), compact)
+        results.append([label, count, f"{held / 1024 / 1024:.1f}", f"{held / max(count, 1):.0f}", f"{elapsed:.2f}"])
+
+    print(tabulate(results, headers=['Baris', 'Jumlah', 'MiB', 'Byte/baris', 'Detik'],
+                   tablefmt='grid', disable_numparse=True))
+    dict_bytes = float(results[0][3])
+    compact_bytes = float(results[1][3])
+    if compact_bytes:
+        print(f"\nRecord compact {dict_bytes / compact_bytes:.1f}x lebih hemat memori per baris")
+
+    db.disconnect()
+    if temp_dir:
+        temp_dir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Benchmark sinkronisasi IHS pasien: --workers 1 vs N worker terhadap gateway tiruan
+
+Gateway Satu Sehat diganti server HTTP lokal dengan latensi tetap per
+request, rate limiter HTTP tetap aktif. Setiap run memakai data dan cache
+NIK yang sama-sama kosong sehingga semua NIK benar-benar diminta ke gateway.
+
+Contoh:
+    python bench_sync.py                                   # 100 pasien, 1 vs 16 worker, 100 req/detik
+    python bench_sync.py --pasien 500 --workers 1 8 32 --latency 0.2 --rate 50
+"""
+import argparse
+import builtins
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark singkron_pasien dengan gateway tiruan")
+    parser.add_argument('--pasien', type=int, default=100, help="jumlah pasien yang disinkronkan per run")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 16],
+                        help="jumlah worker yang dibandingkan (default 1 16)")
+    parser.add_argument('--latency', type=float, default=0.1, help="latensi gateway per request (detik)")
+    parser.add_argument('--rate', type=float, default=100,
+                        help="HTTP_RATE_LIMIT selama benchmark (request/detik, 0 = tanpa batas)")
+    return parser.parse_args()
+
+
+def start_gateway(latency):
+    """Menjalankan gateway tiruan di thread latar, mengembalikan (server, penghitung request)"""
+    hits = [0]
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            nik = self.path.rstrip('/').rsplit('/', 1)[-1]
+            body = json.dumps({"data": {"entry": [{"resource": {"id": f"P{nik}"}}]}}).encode()
+            with lock:
+                hits[0] += 1
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, hits
+
+
+def main():
+    args = parse_args()
+    server, hits = start_gateway(args.latency)
+    temp_dir = tempfile.TemporaryDirectory()
+    # Harus di-set sebelum http_client dan database diimport
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['DB_SQLITE_PATH'] = os.path.join(temp_dir.name, 'bench_sync.db')
+    os.environ['SATUSEHAT_GATEWAY_URL'] = f"http://127.0.0.1:{server.server_port}"
+    os.environ['HTTP_RATE_LIMIT'] = str(args.rate)
+    os.environ.setdefault('DB_SLOW_QUERY_MS', '0')
+
+    from tabulate import tabulate
+    from database import db
+    from log_config import setup_logging
+    import singkron_pasien
+
+    setup_logging(quiet=True)
+    # singkron_pasien menunggu Enter di akhir run
+    builtins.input = lambda *a: ''
+    if not db.connect():
+        return 1
+
+    # Tabel pasien sistem lama yang dibaca singkron_pasien
+    db.execute_query("CREATE TABLE pasien (id INTEGER PRIMARY KEY, no_rm TEXT, nik TEXT, "
+                     "nama_pasien TEXT, ihs TEXT, tgldaftar TEXT)")
+    db.execute_many("INSERT INTO pasien (id, no_rm, nik, nama_pasien) VALUES (%s, %s, %s, %s)",
+                    [(i, f"RM{i:08d}", f"{3200000000000000 + i}", f"Pasien Benchmark {i}")
+                     for i in range(1, args.pasien + 1)])
+
+    results = []
+    baseline = None
+    for workers in args.workers:
+        # Mulai dari kondisi yang sama: belum ada IHS dan cache NIK kosong
+        db.execute_query("UPDATE pasien SET ihs = NULL")
+        if db.table_columns('nik_ihs_cache'):
+            db.execute_query("DELETE FROM nik_ihs_cache")
+        hits_before = hits[0]
+        started = time.perf_counter()
+        singkron_pasien.singkron_pasien(workers)
+        elapsed = time.perf_counter() - started
+        synced = db.fetch_query("SELECT COUNT(*) AS n FROM pasien WHERE ihs LIKE 'P%'")[0]['n']
+        baseline = baseline or elapsed
+        results.append([workers, synced, hits[0] - hits_before, f"{elapsed:.2f}",
+                        f"{synced / elapsed:.1f}", f"{baseline / elapsed:.1f}x"])
+
+    print(tabulate(results, headers=['Worker', 'Pasien', 'Request', 'Detik', 'Pasien/detik', 'Speedup'],
+                   tablefmt='grid', disable_numparse=True))
+    print(f"\nLatensi gateway {args.latency * 1000:.0f} ms, rate limit "
+          f"{f'{args.rate:g} request/detik' if args.rate > 0 else 'tidak aktif'}")
+
+    db.disconnect()
+    server.shutdown()
+    temp_dir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
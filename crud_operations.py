@@ -1,10 +1,66 @@
+import os
 from tabulate import tabulate
-from models import Pasien, Dokter, Poliklinik, Antrian
+from models import Pasien, Dokter, Poliklinik, Antrian, identity_scope
 from datetime import datetime
 
+# Jumlah baris per halaman pada daftar pasien/antrian
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 20))
+# Jumlah hasil maksimal pada picker pasien
+PICKER_LIMIT = 10
+
 class CRUDOperations:
     """Class untuk menangani operasi CRUD pada setiap model"""
 
+    @staticmethod
+    def _pager(fetch_page, key_of, render, total, jump_prompt, jump_key):
+        """Menampilkan data per halaman: [n] berikutnya, [p] sebelumnya, [j] lompat
+
+        fetch_page(after=, before=, limit=) mengambil satu halaman keyset,
+        key_of(row) menghasilkan key baris dan jump_key(teks) mengubah input
+        lompat menjadi key awal (None = input tidak valid). Hanya halaman yang
+        sedang tampil yang disimpan di memori.
+        """
+        rows = fetch_page(limit=PAGE_SIZE)
+        if not rows:
+            return False
+        page = 1
+
+        while True:
+            print("\n" + render(rows, (page - 1) * PAGE_SIZE if page else 0))
+            position = f"Halaman {page}" if page else "Hasil lompat"
+            print(f"\n{position} - {len(rows)} baris (total: {total})")
+
+            choice = input("[n] Berikutnya  [p] Sebelumnya  [j] Lompat  [0] Kembali: ").strip().lower()
+            if choice == 'n':
+                new_rows = fetch_page(after=key_of(rows[-1]), limit=PAGE_SIZE)
+                if not new_rows:
+                    print("\n📄 Sudah di halaman terakhir.")
+                    continue
+                rows = new_rows
+                page = page + 1 if page else None
+            elif choice == 'p':
+                new_rows = fetch_page(before=key_of(rows[0]), limit=PAGE_SIZE)
+                if not new_rows:
+                    print("\n📄 Sudah di halaman pertama.")
+                    continue
+                rows = new_rows
+                page = page - 1 if page else None
+            elif choice == 'j':
+                key = jump_key(input(jump_prompt).strip())
+                if key is None:
+                    print("\n❌ Input tidak valid!")
+                    continue
+                new_rows = fetch_page(after=key, limit=PAGE_SIZE)
+                if not new_rows:
+                    print("\n📭 Tidak ada data setelah posisi tersebut.")
+                    continue
+                rows = new_rows
+                page = None
+            elif choice == '0':
+                return True
+            else:
+                print("\n❌ Pilihan tidak valid. Silakan coba lagi.")
+
     # ================= PASIEN OPERATIONS =================
     @staticmethod
     def pasien_menu():
@@ -22,20 +78,22 @@ class CRUDOperations:
 
             choice = input("\nPilih menu [0-5]: ")
 
-            if choice == '1':
-                CRUDOperations.tambah_pasien()
-            elif choice == '2':
-                CRUDOperations.lihat_semua_pasien()
-            elif choice == '3':
-                CRUDOperations.cari_pasien()
-            elif choice == '4':
-                CRUDOperations.update_pasien()
-            elif choice == '5':
-                CRUDOperations.hapus_pasien()
-            elif choice == '0':
-                break
-            else:
-                print("\n❌ Pilihan tidak valid. Silakan coba lagi.")
+            # Satu aksi = satu scope identity map
+            with identity_scope():
+                if choice == '1':
+                    CRUDOperations.tambah_pasien()
+                elif choice == '2':
+                    CRUDOperations.lihat_semua_pasien()
+                elif choice == '3':
+                    CRUDOperations.cari_pasien()
+                elif choice == '4':
+                    CRUDOperations.update_pasien()
+                elif choice == '5':
+                    CRUDOperations.hapus_pasien()
+                elif choice == '0':
+                    break
+                else:
+                    print("\n❌ Pilihan tidak valid. Silakan coba lagi.")
 
     @staticmethod
     def tambah_pasien():
@@ -77,53 +135,88 @@ class CRUDOperations:
 
     @staticmethod
     def lihat_semua_pasien():
-        """Menampilkan semua pasien"""
+        """Menampilkan semua pasien per halaman, urut nama"""
         print("\n--- DAFTAR SEMUA PASIEN ---")
 
-        pasiens = Pasien.get_all()
+        def render(pasiens, offset):
+            # Format data untuk tabulasi
+            headers = ['ID', 'No. RM', 'Nama Lengkap', 'Tanggal Lahir', 'Jenis Kelamin', 'Telepon']
+            rows = []
 
-        if not pasiens:
-            print("\n📭 Belum ada data pasien.")
-            return
+            for pasien in pasiens:
+                rows.append([
+                    pasien['id'],
+                    pasien['nomor_rm'],
+                    pasien['nama_lengkap'],
+                    pasien['tanggal_lahir'],
+                    pasien['jenis_kelamin'],
+                    pasien['nomor_telepon'] or '-'
+                ])
+            return tabulate(rows, headers=headers, tablefmt='grid')
 
-        # Format data untuk tabulasi
-        headers = ['ID', 'No. RM', 'Nama Lengkap', 'Tanggal Lahir', 'Jenis Kelamin', 'Telepon']
-        rows = []
+        def jump_key(text):
+            # Nama diawali teks ini ada di urutan >= (teks, 0)
+            return (text, 0) if text else None
 
-        for pasien in pasiens:
-            rows.append([
-                pasien['id'],
-                pasien['nomor_rm'],
-                pasien['nama_lengkap'],
-                pasien['tanggal_lahir'],
-                pasien['jenis_kelamin'],
-                pasien['nomor_telepon'] or '-'
-            ])
+        if not CRUDOperations._pager(Pasien.page, Pasien.page_key, render, f"{Pasien.count()} pasien",
+                                     "Lompat ke nama (awalan): ", jump_key):
+            print("\n📭 Belum ada data pasien.")
 
-        print("\n" + tabulate(rows, headers=headers, tablefmt='grid'))
-        print(f"\nTotal: {len(pasiens)} pasien")
+    @staticmethod
+    def pilih_pasien():
+        """Picker pasien: cari berdasarkan awalan No. RM, NIK atau nama lalu pilih satu"""
+        while True:
+            keyword = input("\nCari pasien (No. RM / NIK / nama, kosongkan untuk batal): ").strip()
+            if not keyword:
+                return None
+
+            pasiens = Pasien.lookup(keyword, limit=PICKER_LIMIT)
+            if not pasiens:
+                print(f"\n❌ Pasien dengan RM, NIK atau nama '{keyword}' tidak ditemukan!")
+                continue
+
+            print("\nHasil Pencarian:")
+            for i, pasien in enumerate(pasiens, 1):
+                print(f"{i}. {pasien['nama_lengkap']} ({pasien['nomor_rm']}) - NIK {pasien['nik'] or '-'}, lahir {pasien['tanggal_lahir'] or '-'}")
+            if len(pasiens) == PICKER_LIMIT:
+                print("... (perjelas kata kunci untuk mempersempit hasil)")
+
+            choice = input("\nPilih pasien (nomor, kosongkan untuk cari lagi): ").strip()
+            if not choice:
+                continue
+            if not choice.isdigit() or not 1 <= int(choice) <= len(pasiens):
+                print("\n❌ Pilihan tidak valid!")
+                continue
+            return pasiens[int(choice) - 1]
 
     @staticmethod
     def cari_pasien():
         """Mencari pasien berdasarkan nama atau nomor RM"""
         print("\n--- CARI PASIEN ---")
-        keyword = input("Masukkan nama atau nomor RM: ")
+        keyword = input("Masukkan nama atau nomor RM: ").strip()
+        if not keyword:
+            return None
 
-        # Cari berdasarkan nomor RM
+        # Nomor RM persis didahulukan, selain itu cari berdasarkan nama
         pasien = Pasien.get_by_nomor_rm(keyword)
-        if pasien:
+        pasiens = [pasien] if pasien else Pasien.search(keyword, limit=PAGE_SIZE)
+
+        if pasiens:
             headers = ['ID', 'No. RM', 'Nama Lengkap', 'Tanggal Lahir', 'Jenis Kelamin', 'Alamat', 'Telepon']
-            rows = [[
-                pasien['id'],
-                pasien['nomor_rm'],
-                pasien['nama_lengkap'],
-                pasien['tanggal_lahir'],
-                pasien['jenis_kelamin'],
-                pasien['alamat'] or '-',
-                pasien['nomor_telepon'] or '-'
-            ]]
+            rows = []
+            for pasien in pasiens:
+                rows.append([
+                    pasien['id'],
+                    pasien['nomor_rm'],
+                    pasien['nama_lengkap'],
+                    pasien['tanggal_lahir'],
+                    pasien['jenis_kelamin'],
+                    pasien['alamat'] or '-',
+                    pasien['nomor_telepon'] or '-'
+                ])
             print("\n" + tabulate(rows, headers=headers, tablefmt='grid'))
-            return pasien
+            print(f"\nDitemukan: {len(pasiens)} pasien")
+            return pasiens[0]
 
         # Jika tidak ketemu, beri pesan
         print(f"\n❌ Pasien dengan nama atau RM '{keyword}' tidak ditemukan!")
@@ -135,29 +228,24 @@ class CRUDOperations:
         print("\n--- UPDATE DATA PASIEN ---")
 
         # Cari pasien dulu
-        pasien = CRUDOperations.cari_pasien()
+        pasien = CRUDOperations.pilih_pasien()
         if not pasien:
             return
 
         print("\nMasukkan data baru (kosongkan jika tidak ingin mengubah):")
 
-        nama_lengkap = input(f"Nama Lengkap [{pasien['nama_lengkap']}]: ") or pasien['nama_lengkap']
-        tanggal_lahir = input(f"Tanggal Lahir [{pasien['tanggal_lahir']}]: ") or pasien['tanggal_lahir']
-        jenis_kelamin = input(f"Jenis Kelamin (L/P) [{pasien['jenis_kelamin']}]: ").upper() or pasien['jenis_kelamin']
-        alamat = input(f"Alamat [{pasien['alamat'] or '-'}]: ") or pasien['alamat']
-        nomor_telepon = input(f"Nomor Telepon [{pasien['nomor_telepon'] or '-'}]: ") or pasien['nomor_telepon']
-
-        # Buat objek pasien baru
-        pasien_update = Pasien(
-            nama_lengkap=nama_lengkap,
-            tanggal_lahir=tanggal_lahir,
-            jenis_kelamin=jenis_kelamin,
-            alamat=alamat,
-            nomor_telepon=nomor_telepon
-        )
-
-        if pasien_update.update(pasien['id']):
-            print(f"\n✅ Data pasien {nama_lengkap} berhasil diupdate!")
+        # Objek dari baris database mencatat kolom mana yang diubah
+        pasien = Pasien.from_row(pasien)
+        pasien.nama_lengkap = input(f"Nama Lengkap [{pasien.nama_lengkap}]: ") or pasien.nama_lengkap
+        pasien.tanggal_lahir = input(f"Tanggal Lahir [{pasien.tanggal_lahir}]: ") or pasien.tanggal_lahir
+        pasien.jenis_kelamin = input(f"Jenis Kelamin (L/P) [{pasien.jenis_kelamin}]: ").upper() or pasien.jenis_kelamin
+        pasien.alamat = input(f"Alamat [{pasien.alamat or '-'}]: ") or pasien.alamat
+        pasien.nomor_telepon = input(f"Nomor Telepon [{pasien.nomor_telepon or '-'}]: ") or pasien.nomor_telepon
+
+        if not pasien.dirty_fields():
+            print("\nℹ️  Tidak ada perubahan data.")
+        elif pasien.update() is not None:
+            print(f"\n✅ Data pasien {pasien.nama_lengkap} berhasil diupdate!")
         else:
             print("\n❌ Gagal mengupdate data pasien!")
 
@@ -167,7 +255,7 @@ class CRUDOperations:
         print("\n--- HAPUS DATA PASIEN ---")
 
         # Cari pasien dulu
-        pasien = CRUDOperations.cari_pasien()
+        pasien = CRUDOperations.pilih_pasien()
         if not pasien:
             return
 
@@ -197,18 +285,20 @@ class CRUDOperations:
 
             choice = input("\nPilih menu [0-4]: ")
 
-            if choice == '1':
-                CRUDOperations.tambah_dokter()
-            elif choice == '2':
-                CRUDOperations.lihat_semua_dokter()
-            elif choice == '3':
-                CRUDOperations.update_dokter()
-            elif choice == '4':
-                CRUDOperations.hapus_dokter()
-            elif choice == '0':
-                break
-            else:
-                print("\n❌ Pilihan tidak valid. Silakan coba lagi.")
+            # Satu aksi = satu scope identity map
+            with identity_scope():
+                if choice == '1':
+                    CRUDOperations.tambah_dokter()
+                elif choice == '2':
+                    CRUDOperations.lihat_semua_dokter()
+                elif choice == '3':
+                    CRUDOperations.update_dokter()
+                elif choice == '4':
+                    CRUDOperations.hapus_dokter()
+                elif choice == '0':
+                    break
+                else:
+                    print("\n❌ Pilihan tidak valid. Silakan coba lagi.")
 
     @staticmethod
     def tambah_dokter():
@@ -283,21 +373,17 @@ class CRUDOperations:
                 print("\n❌ Pilihan tidak valid!")
                 return
 
-            dokter = dokters[choice]
+            dokter = Dokter.from_row(dokters[choice])
 
             print("\nMasukkan data baru (kosongkan jika tidak ingin mengubah):")
-            nama_dokter = input(f"Nama Dokter [{dokter['nama_dokter']}]: ") or dokter['nama_dokter']
-            spesialisasi = input(f"Spesialisasi [{dokter['spesialisasi'] or '-'}]: ") or dokter['spesialisasi']
-            nomor_telepon = input(f"Nomor Telepon [{dokter['nomor_telepon'] or '-'}]: ") or dokter['nomor_telepon']
-
-            dokter_update = Dokter(
-                nama_dokter=nama_dokter,
-                spesialisasi=spesialisasi,
-                nomor_telepon=nomor_telepon
-            )
-
-            if dokter_update.update(dokter['id']):
-                print(f"\n✅ Data dokter {nama_dokter} berhasil diupdate!")
+            dokter.nama_dokter = input(f"Nama Dokter [{dokter.nama_dokter}]: ") or dokter.nama_dokter
+            dokter.spesialisasi = input(f"Spesialisasi [{dokter.spesialisasi or '-'}]: ") or dokter.spesialisasi
+            dokter.nomor_telepon = input(f"Nomor Telepon [{dokter.nomor_telepon or '-'}]: ") or dokter.nomor_telepon
+
+            if not dokter.dirty_fields():
+                print("\nℹ️  Tidak ada perubahan data.")
+            elif dokter.update() is not None:
+                print(f"\n✅ Data dokter {dokter.nama_dokter} berhasil diupdate!")
             else:
                 print("\n❌ Gagal mengupdate data dokter!")
 
@@ -355,18 +441,20 @@ class CRUDOperations:
 
             choice = input("\nPilih menu [0-4]: ")
 
-            if choice == '1':
-                CRUDOperations.tambah_poliklinik()
-            elif choice == '2':
-                CRUDOperations.lihat_semua_poliklinik()
-            elif choice == '3':
-                CRUDOperations.update_poliklinik()
-            elif choice == '4':
-                CRUDOperations.hapus_poliklinik()
-            elif choice == '0':
-                break
-            else:
-                print("\n❌ Pilihan tidak valid. Silakan coba lagi.")
+            # Satu aksi = satu scope identity map
+            with identity_scope():
+                if choice == '1':
+                    CRUDOperations.tambah_poliklinik()
+                elif choice == '2':
+                    CRUDOperations.lihat_semua_poliklinik()
+                elif choice == '3':
+                    CRUDOperations.update_poliklinik()
+                elif choice == '4':
+                    CRUDOperations.hapus_poliklinik()
+                elif choice == '0':
+                    break
+                else:
+                    print("\n❌ Pilihan tidak valid. Silakan coba lagi.")
 
     @staticmethod
     def tambah_poliklinik():
@@ -437,21 +525,18 @@ class CRUDOperations:
                 print("\n❌ Pilihan tidak valid!")
                 return
 
-            pol = polikliniks[choice]
+            pol = Poliklinik.from_row(polikliniks[choice])
 
             print("\nMasukkan data baru (kosongkan jika tidak ingin mengubah):")
-            nama_poli = input(f"Nama Poliklinik [{pol['nama_poli']}]: ") or pol['nama_poli']
-            gedung = input(f"Gedung [{pol['gedung'] or '-'}]: ") or pol['gedung']
-            lantai = input(f"Lantai [{pol['lantai'] or '-'}]: ")
-
-            pol_update = Poliklinik(
-                nama_poli=nama_poli,
-                gedung=gedung,
-                lantai=int(lantai) if lantai else pol['lantai']
-            )
-
-            if pol_update.update(pol['id']):
-                print(f"\n✅ Data poliklinik {nama_poli} berhasil diupdate!")
+            pol.nama_poli = input(f"Nama Poliklinik [{pol.nama_poli}]: ") or pol.nama_poli
+            pol.gedung = input(f"Gedung [{pol.gedung or '-'}]: ") or pol.gedung
+            lantai = input(f"Lantai [{pol.lantai or '-'}]: ")
+            pol.lantai = int(lantai) if lantai else pol.lantai
+
+            if not pol.dirty_fields():
+                print("\nℹ️  Tidak ada perubahan data.")
+            elif pol.update() is not None:
+                print(f"\n✅ Data poliklinik {pol.nama_poli} berhasil diupdate!")
             else:
                 print("\n❌ Gagal mengupdate data poliklinik!")
 
@@ -510,22 +595,24 @@ class CRUDOperations:
 
             choice = input("\nPilih menu [0-6]: ")
 
-            if choice == '1':
-                CRUDOperations.ambil_antrian()
-            elif choice == '2':
-                CRUDOperations.lihat_semua_antrian()
-            elif choice == '3':
-                CRUDOperations.lihat_antrian_hari_ini()
-            elif choice == '4':
-                CRUDOperations.lihat_antrian_per_poli()
-            elif choice == '5':
-                CRUDOperations.update_status_antrian()
-            elif choice == '6':
-                CRUDOperations.hapus_antrian()
-            elif choice == '0':
-                break
-            else:
-                print("\n❌ Pilihan tidak valid. Silakan coba lagi.")
+            # Satu aksi = satu scope identity map
+            with identity_scope():
+                if choice == '1':
+                    CRUDOperations.ambil_antrian()
+                elif choice == '2':
+                    CRUDOperations.lihat_semua_antrian()
+                elif choice == '3':
+                    CRUDOperations.lihat_antrian_hari_ini()
+                elif choice == '4':
+                    CRUDOperations.lihat_antrian_per_poli()
+                elif choice == '5':
+                    CRUDOperations.update_status_antrian()
+                elif choice == '6':
+                    CRUDOperations.hapus_antrian()
+                elif choice == '0':
+                    break
+                else:
+                    print("\n❌ Pilihan tidak valid. Silakan coba lagi.")
 
     @staticmethod
     def ambil_antrian():
@@ -534,25 +621,10 @@ class CRUDOperations:
 
         try:
             # Pilih pasien
-            pasiens = Pasien.get_all()
-            if not pasiens:
-                print("\n📭 Belum ada data pasien. Silakan tambahkan pasien terlebih dahulu.")
+            pasien = CRUDOperations.pilih_pasien()
+            if not pasien:
                 return
 
-            print("\nDaftar Pasien:")
-            for i, pasien in enumerate(pasiens[:10], 1):  # Tampilkan 10 pasien pertama
-                print(f"{i}. {pasien['nama_lengkap']} ({pasien['nomor_rm']})")
-
-            if len(pasiens) > 10:
-                print("... (dan lainnya)")
-
-            choice_pasien = int(input("\nPilih pasien (nomor): ")) - 1
-            if choice_pasien < 0 or choice_pasien >= len(pasiens):
-                print("\n❌ Pilihan tidak valid!")
-                return
-
-            pasien = pasiens[choice_pasien]
-
             # Pilih poliklinik
             polikliniks = Poliklinik.get_all()
             if not polikliniks:
@@ -591,12 +663,8 @@ class CRUDOperations:
             tanggal = input("Tanggal Kunjungan (YYYY-MM-DD, kosongkan untuk hari ini): ") or datetime.now().date()
             keluhan = input("Keluhan: ")
 
-            # Ambil nomor antrian
-            nomor_antrian = Antrian.get_next_queue_number(poliklinik['id'], tanggal)
-
-            # Buat antrian
+            # Nomor antrian dialokasikan dari counter saat disimpan
             antrian = Antrian(
-                nomor_antrian=nomor_antrian,
                 id_pasien=pasien['id'],
                 id_dokter=dokter['id'],
                 id_poliklinik=poliklinik['id'],
@@ -606,7 +674,7 @@ class CRUDOperations:
 
             if antrian.save():
                 print(f"\n✅ Antrian berhasil dibuat!")
-                print(f"   Nomor Antrian: {nomor_antrian}")
+                print(f"   Nomor Antrian: {antrian.nomor_antrian}")
                 print(f"   Pasien: {pasien['nama_lengkap']}")
                 print(f"   Poliklinik: {poliklinik['nama_poli']}")
                 print(f"   Dokter: dr. {dokter['nama_dokter']}")
@@ -621,33 +689,38 @@ class CRUDOperations:
 
     @staticmethod
     def lihat_semua_antrian():
-        """Menampilkan semua antrian"""
+        """Menampilkan semua antrian per halaman, urut tanggal kunjungan"""
         print("\n--- DAFTAR SEMUA ANTRIAN ---")
 
-        antrians = Antrian.get_all()
+        def render(antrians, offset):
+            headers = ['No.', 'RM', 'Pasien', 'Dokter', 'Poliklinik', 'Tanggal', 'No. Antrian', 'Status']
+            rows = []
 
-        if not antrians:
+            for i, antrian in enumerate(antrians, offset + 1):
+                status_icon = "⏳" if antrian['status'] == 'menunggu' else "👨‍⚕️" if antrian['status'] == 'dilayani' else "✅"
+                rows.append([
+                    i,
+                    antrian.get('nomor_rm', '-'),
+                    antrian['nama_lengkap'],
+                    f"dr. {antrian['nama_dokter']}",
+                    antrian['nama_poli'],
+                    antrian['tanggal_kunjungan'],
+                    antrian['nomor_antrian'],
+                    f"{status_icon} {antrian['status'].title()}"
+                ])
+            return tabulate(rows, headers=headers, tablefmt='grid')
+
+        def jump_key(text):
+            try:
+                tanggal = datetime.strptime(text, "%Y-%m-%d").date()
+            except ValueError:
+                return None
+            # Antrian pertama pada tanggal tersebut
+            return (tanggal, 0, 0)
+
+        if not CRUDOperations._pager(Antrian.page, Antrian.page_key, render, f"{Antrian.page_count()} antrian",
+                                     "Lompat ke tanggal (YYYY-MM-DD): ", jump_key):
             print("\n📭 Belum ada data antrian.")
-            return
-
-        headers = ['No.', 'RM', 'Pasien', 'Dokter', 'Poliklinik', 'Tanggal', 'No. Antrian', 'Status']
-        rows = []
-
-        for i, antrian in enumerate(antrians, 1):
-            status_icon = "⏳" if antrian['status'] == 'menunggu' else "👨‍⚕️" if antrian['status'] == 'dilayani' else "✅"
-            rows.append([
-                i,
-                antrian.get('nomor_rm', '-'),
-                antrian['nama_lengkap'],
-                f"dr. {antrian['nama_dokter']}",
-                antrian['nama_poli'],
-                antrian['tanggal_kunjungan'],
-                antrian['nomor_antrian'],
-                f"{status_icon} {antrian['status'].title()}"
-            ])
-
-        print("\n" + tabulate(rows, headers=headers, tablefmt='grid'))
-        print(f"\nTotal: {len(antrians)} antrian")
 
     @staticmethod
     def lihat_antrian_hari_ini():
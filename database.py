@@ -1,176 +1,607 @@
-import mysql.connector
-from mysql.connector import Error
+import atexit
+import logging
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
+from db_backends import BACKEND_ERRORS, get_backend
+from migrations import MigrationError, run_migrations
+from query_stats import QueryEvent, QueryStats, SlowQueryLog
+from records import compact_rows
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+class PoolError(Exception):
+    """Error ketika pool koneksi tidak bisa memberikan koneksi"""
+
+
+# Exception yang ditangani sebagai error database, apa pun backend-nya
+DB_ERRORS = BACKEND_ERRORS + (PoolError,)
+
+
+class ConnectionPool:
+    """Pool koneksi dengan semantik checkout/return dan health check
+
+    Health check (ping ke server) hanya dilakukan untuk koneksi yang sudah
+    idle lebih dari check_idle detik; koneksi yang baru dipakai dianggap
+    masih hidup sehingga statement biasa tidak membayar round trip tambahan.
+    """
+
+    def __init__(self, factory, size=5, timeout=30, check=None, check_idle=30):
+        self.factory = factory
+        self.check = check or (lambda conn: conn.is_connected())
+        self.size = size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        # Isi antrian: (koneksi, waktu dikembalikan)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def checkout(self):
+        """Meminjam koneksi dari pool, menunggu jika semua sedang dipakai"""
+        if self._closed:
+            raise PoolError("Pool koneksi sudah ditutup")
+        try:
+            conn, returned_at = self._idle.get_nowait()
+        except queue.Empty:
+            conn, returned_at = self._create_or_wait()
+        if returned_at is None or time.monotonic() - returned_at < self.check_idle:
+            return conn
+        return self._ensure_healthy(conn)
+
+    def checkin(self, conn):
+        """Mengembalikan koneksi ke pool (ditutup jika pool sudah ditutup)"""
+        if self._closed:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def close(self):
+        """Menutup pool: koneksi idle ditutup, koneksi yang dikembalikan setelahnya dibuang"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def _create_or_wait(self):
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                # Koneksi baru tidak perlu health check
+                return self.factory(), None
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolError(f"Pool koneksi penuh ({self.size}), timeout setelah {self.timeout} detik")
+
+    def _ensure_healthy(self, conn):
+        """Health check koneksi yang lama idle, ganti jika sudah putus"""
+        try:
+            if self.check(conn):
+                return conn
+        except DB_ERRORS:
+            pass
+        self._discard(conn)
+        try:
+            return self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except DB_ERRORS:
+            pass
+
+
+def _chunked(items, size):
+    """Memecah iterable menjadi list berukuran maksimal size"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class UpdateBuffer:
+    """Menampung pasangan (id, nilai) lalu menulisnya lewat bulk_update per chunk"""
+
+    def __init__(self, database, table, column, key='id', chunk_size=None):
+        self.database = database
+        self.table = table
+        self.column = column
+        self.key = key
+        self.chunk_size = chunk_size or database.batch_size
+        self.pending = []
+        self.written = 0
+
+    def add(self, key_value, value):
+        """Menambahkan satu update, otomatis flush bila chunk sudah penuh"""
+        self.pending.append((key_value, value))
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Menulis semua update yang masih tertunda"""
+        if not self.pending:
+            return
+        pairs, self.pending = self.pending, []
+        counts = self.database.bulk_update(self.table, self.column, pairs,
+                                           key=self.key, chunk_size=self.chunk_size)
+        self.written += sum(c for c in counts if c)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Tetap tulis yang sudah terkumpul walaupun loop berhenti karena error
+        self.flush()
+        return False
+
+
 class DatabaseConnection:
     def __init__(self):
         self.connection = None
+        self.pool = None
         self.host = os.getenv('DB_HOST', 'localhost')
         self.port = os.getenv('DB_PORT', 3306)
         self.user = os.getenv('DB_USER', 'root')
         self.password = os.getenv('DB_PASSWORD', '')
         self.database = os.getenv('DB_NAME', 'simrs')
+        # DB_BACKEND=sqlite memakai file lokal DB_SQLITE_PATH, tanpa server MySQL
+        self.backend = get_backend(os.getenv('DB_BACKEND', 'mysql'))
+        self.sqlite_path = os.getenv('DB_SQLITE_PATH', 'simrs.db')
+        # DB_POOL_SIZE > 0 mengaktifkan mode pool, 0 = satu koneksi global
+        self.pool_size = int(os.getenv('DB_POOL_SIZE', 0))
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', 30))
+        # Koneksi pool yang idle lebih lama dari ini (detik) di-ping sebelum dipakai
+        self.pool_check_idle = float(os.getenv('DB_POOL_CHECK_IDLE', 30))
+        self.stream_batch_size = int(os.getenv('DB_STREAM_BATCH_SIZE', 500))
+        self.batch_size = int(os.getenv('DB_BATCH_SIZE', 200))
+        self._lease = ContextVar(f'db_lease_{id(self)}', default=None)
+        self._tx_depth = ContextVar(f'db_tx_depth_{id(self)}', default=0)
+
+        # Instrumentasi: setiap query selesai diteruskan ke hook(event)
+        self.stats = QueryStats()
+        self.query_hooks = [self.stats, SlowQueryLog()]
+        if os.getenv('DB_STATS_ON_EXIT', '0') == '1':
+            atexit.register(self.dump_stats)
+
+    def _new_connection(self):
+        """Membuka satu koneksi baru ke database lewat backend aktif"""
+        return self.backend.connect(self)
 
     def connect(self):
         """Membuat koneksi ke database MySQL"""
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
-            if self.connection.is_connected():
-                print("✅ Berhasil terkoneksi ke database MySQL")
+            if self.pool_size > 0:
+                if self.pool:
+                    self.pool.close()
+                self.pool = ConnectionPool(self._new_connection, self.pool_size, self.pool_timeout,
+                                           check=self.backend.is_connected, check_idle=self.pool_check_idle)
+                # Pastikan konfigurasi valid dengan meminjam satu koneksi
+                self.pool.checkin(self.pool.checkout())
+                logger.info(f"✅ Berhasil terkoneksi ke database {self.backend.label} (pool {self.pool_size} koneksi)")
                 return True
-        except Error as e:
-            print(f"❌ Gagal terkoneksi ke database: {e}")
+
+            self.connection = self._new_connection()
+            if self.backend.is_connected(self.connection):
+                logger.info(f"✅ Berhasil terkoneksi ke database {self.backend.label}")
+                return True
+        except (*DB_ERRORS, ImportError) as e:
+            logger.error(f"❌ Gagal terkoneksi ke database: {e}")
             return False
 
+    def is_connected(self):
+        """Memeriksa apakah database siap dipakai"""
+        if self.pool:
+            return True
+        return bool(self.connection and self.backend.is_connected(self.connection))
+
     def disconnect(self):
         """Menutup koneksi database"""
-        if self.connection and self.connection.is_connected():
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+            logger.info("✅ Pool koneksi database ditutup")
+        if self.connection and self.backend.is_connected(self.connection):
             self.connection.close()
-            print("✅ Koneksi database ditutup")
+            logger.info("✅ Koneksi database ditutup")
 
-    def execute_query(self, query, params=None):
-        """Menjalankan query INSERT, UPDATE, DELETE"""
-        cursor = None
+    @contextmanager
+    def lease(self):
+        """Menyewa satu koneksi untuk thread/task saat ini selama blok with"""
+        current = self._lease.get()
+        if current is not None:
+            # Lease bersarang memakai koneksi yang sama
+            yield current
+            return
+
+        if not self.pool:
+            conn = self.connection
+            token = self._lease.set(conn)
+            try:
+                yield conn
+            finally:
+                self._lease.reset(token)
+            return
+
+        conn = self.pool.checkout()
+        token = self._lease.set(conn)
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, params or ())
-            self.connection.commit()
-            print(f"✅ Query berhasil dieksekusi: {cursor.rowcount} baris terpengaruh")
-            return cursor.lastrowid if query.strip().upper().startswith('INSERT') else cursor.rowcount
-        except Error as e:
-            print(f"❌ Error saat mengeksekusi query: {e}")
-            self.connection.rollback()
-            return None
+            yield conn
         finally:
-            if cursor:
-                cursor.close()
+            self._lease.reset(token)
+            self.pool.checkin(conn)
+
+    def add_query_hook(self, hook):
+        """Mendaftarkan callable hook(event) yang dipanggil setiap query selesai"""
+        self.query_hooks.append(hook)
+
+    def remove_query_hook(self, hook):
+        """Melepas hook yang sebelumnya didaftarkan"""
+        self.query_hooks.remove(hook)
+
+    def _record(self, query, params, elapsed, rows):
+        """Meneruskan hasil timing query ke semua hook"""
+        if not self.query_hooks:
+            return
+        event = QueryEvent(query, params, elapsed, rows)
+        for hook in self.query_hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                logger.warning(f"⚠️  Hook query gagal: {e}")
 
-    def fetch_query(self, query, params=None):
-        """Menjalankan query SELECT dan mengembalikan hasilnya"""
-        cursor = None
+    def dump_stats(self, limit=20):
+        """Menampilkan statistik query per fingerprint"""
+        print("\n📊 Statistik query:")
+        print(self.stats.report(limit=limit))
+
+    def in_transaction(self):
+        """Apakah thread/task saat ini sedang berada di dalam db.transaction()"""
+        return self._tx_depth.get() > 0
+
+    @contextmanager
+    def transaction(self):
+        """Blok transaksi: commit sekali di akhir, rollback jika terjadi exception
+
+        Transaksi bersarang memakai SAVEPOINT, sehingga kegagalan blok dalam
+        hanya membatalkan perubahan blok tersebut.
+        """
+        with self.lease() as conn:
+            depth = self._tx_depth.get()
+            savepoint = f"sp_{depth}"
+            token = self._tx_depth.set(depth + 1)
+            try:
+                if depth == 0:
+                    self.backend.begin(conn)
+                else:
+                    self._run_raw(conn, f"SAVEPOINT {savepoint}")
+                yield conn
+                if depth == 0:
+                    conn.commit()
+                else:
+                    self._run_raw(conn, f"RELEASE SAVEPOINT {savepoint}")
+            except BaseException:
+                if depth == 0:
+                    conn.rollback()
+                else:
+                    self._run_raw(conn, f"ROLLBACK TO SAVEPOINT {savepoint}")
+                raise
+            finally:
+                self._tx_depth.reset(token)
+
+    def _run_raw(self, conn, statement):
+        cursor = self.backend.cursor(conn)
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query, params or ())
-            result = cursor.fetchall()
-            print(f"✅ Query berhasil, ditemukan {len(result)} baris")
-            return result
-        except Error as e:
-            print(f"❌ Error saat mengambil data: {e}")
-            return None
+            cursor.execute(statement)
         finally:
-            if cursor:
-                cursor.close()
+            cursor.close()
 
-    def create_database_and_tables(self):
-        """Membuat database dan tabel jika belum ada"""
+    def execute_query(self, query, params=None):
+        """Menjalankan query INSERT, UPDATE, DELETE
+
+        Di luar transaksi setiap statement langsung di-commit dan error
+        dikembalikan sebagai None. Di dalam db.transaction() commit ditunda
+        sampai blok selesai dan error dilempar agar transaksi di-rollback.
+        """
         try:
-            # Koneksi tanpa database dulu
-            temp_connection = mysql.connector.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password
-            )
-            cursor = temp_connection.cursor()
+            with self.lease() as conn:
+                cursor = None
+                rows = None
+                started = time.perf_counter()
+                try:
+                    cursor = self.backend.cursor(conn)
+                    cursor.execute(self.backend.translate(query), params or ())
+                    rows = cursor.rowcount
+                    logger.debug("✅ Query berhasil dieksekusi: %s baris terpengaruh", cursor.rowcount)
+                    return cursor.lastrowid if query.strip().upper().startswith('INSERT') else cursor.rowcount
+                except DB_ERRORS as e:
+                    logger.error(f"❌ Error saat mengeksekusi query: {e}")
+                    if self.in_transaction():
+                        raise
+                    return None
+                finally:
+                    self._record(query, params, time.perf_counter() - started, rows)
+                    if cursor:
+                        cursor.close()
+        except DB_ERRORS as e:
+            # Gagal meminjam koneksi (pool penuh/server putus): sama seperti error query
+            if self.in_transaction():
+                raise
+            logger.error(f"❌ Gagal mendapatkan koneksi untuk query: {e}")
+            return None
 
-            # Buat database jika belum ada
-            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.database}")
-            print(f"✅ Database '{self.database}' siap digunakan")
+    def execute_many(self, query, seq_params, chunk_size=None):
+        """Menjalankan satu query untuk banyak set parameter, per chunk dalam satu commit
 
-            cursor.close()
-            temp_connection.close()
+        Mengembalikan list jumlah baris terpengaruh per chunk (None untuk chunk
+        yang gagal dan di-rollback). Di dalam db.transaction() setiap chunk
+        menjadi savepoint.
+        """
+        chunk_size = chunk_size or self.batch_size
+        counts = []
+        for chunk in _chunked(seq_params, chunk_size):
+            started = time.perf_counter()
+            try:
+                with self.transaction() as conn:
+                    cursor = self.backend.cursor(conn)
+                    try:
+                        cursor.executemany(self.backend.translate(query), chunk)
+                        counts.append(cursor.rowcount)
+                    finally:
+                        cursor.close()
+            except DB_ERRORS as e:
+                logger.error(f"❌ Error saat mengeksekusi batch ({len(chunk)} baris): {e}")
+                counts.append(None)
+            self._record(query, None, time.perf_counter() - started, counts[-1])
+        logger.debug("✅ Batch selesai: %s chunk, %s baris terpengaruh", len(counts), sum(c for c in counts if c))
+        return counts
 
-            # Sekarang koneksi ke database yang sudah dibuat
-            self.connect()
+    def bulk_update(self, table, column, pairs, key='id', chunk_size=None):
+        """Update satu kolom untuk banyak baris, satu statement per chunk
 
-            # Buat tabel-tabel
-            self._create_tables()
+        pairs berisi (nilai_key, nilai_baru). Setiap chunk dikirim sebagai
+        UPDATE ... SET column = CASE key WHEN .. THEN .. END WHERE key IN (..).
+        Nama tabel/kolom harus berasal dari kode, bukan dari input user.
+        Mengembalikan list jumlah baris terpengaruh per chunk.
+        """
+        chunk_size = chunk_size or self.batch_size
+        counts = []
+        for chunk in _chunked(pairs, chunk_size):
+            cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+            placeholders = ", ".join(["%s"] * len(chunk))
+            query = (f"UPDATE {table} SET {column} = CASE {key} {cases} END "
+                     f"WHERE {key} IN ({placeholders})")
+            params = [v for pair in chunk for v in pair] + [k for k, _ in chunk]
+            counts.append(self.execute_query(query, params))
+        return counts
 
-        except Error as e:
-            print(f"❌ Error saat membuat database: {e}")
-            return False
+    def increment(self, table, keys, column, delta=1):
+        """Menaikkan counter secara atomik dan mengembalikan nilai barunya
 
-    def _create_tables(self):
-        """Membuat tabel-tabel yang diperlukan"""
-
-        # Tabel pasien
-        create_pasien_table = """
-        CREATE TABLE IF NOT EXISTS pasien (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            nomor_rm VARCHAR(20) UNIQUE NOT NULL,
-            nama_lengkap VARCHAR(100) NOT NULL,
-            nik VARCHAR(16),
-            tanggal_lahir DATE,
-            jenis_kelamin ENUM('L', 'P'),
-            alamat TEXT,
-            nomor_telepon VARCHAR(15),
-            ihs_number VARCHAR(100),
-            sync_ihs_at TIMESTAMP NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        keys adalah dict kolom -> nilai yang membentuk primary/unique key baris
+        counter; baris dibuat dengan nilai delta jika belum ada. Satu statement
+        upsert, sehingga aman dipanggil bersamaan dari banyak koneksi. Error
+        diperlakukan seperti execute_query (None, atau raise di dalam transaksi).
         """
+        statements = self.backend.increment_statements(table, list(keys), column)
+        params = [*keys.values(), delta, delta]
+        try:
+            with self.lease() as conn:
+                cursor = None
+                value = None
+                started = time.perf_counter()
+                try:
+                    cursor = self.backend.cursor(conn)
+                    for i, statement in enumerate(statements):
+                        cursor.execute(self.backend.translate(statement), params if i == 0 else ())
+                    value = cursor.fetchone()[0]
+                    return value
+                except DB_ERRORS as e:
+                    logger.error(f"❌ Error saat menaikkan counter {table}.{column}: {e}")
+                    if self.in_transaction():
+                        raise
+                    return None
+                finally:
+                    self._record(statements[0], params, time.perf_counter() - started, 1 if value is not None else None)
+                    if cursor:
+                        cursor.close()
+        except DB_ERRORS as e:
+            # Gagal meminjam koneksi (pool penuh/server putus): sama seperti error query
+            if self.in_transaction():
+                raise
+            logger.error(f"❌ Gagal mendapatkan koneksi untuk counter: {e}")
+            return None
+
+    def fetch_query(self, query, params=None, compact=False):
+        """Menjalankan query SELECT dan mengembalikan hasilnya
 
-        # Tabel dokter
-        create_dokter_table = """
-        CREATE TABLE IF NOT EXISTS dokter (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            nomor_sip VARCHAR(30) UNIQUE NOT NULL,
-            nama_dokter VARCHAR(100) NOT NULL,
-            spesialisasi VARCHAR(50),
-            nomor_telepon VARCHAR(15),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        Baris berupa dict; compact=True mengembalikan record berbasis tuple
+        (lihat records.record_class) yang jauh lebih hemat memori untuk hasil
+        besar dan tetap bisa diakses dengan row['kolom'] / row.get('kolom').
         """
+        try:
+            with self.lease() as conn:
+                cursor = None
+                rows = None
+                started = time.perf_counter()
+                try:
+                    cursor = self.backend.cursor(conn, dictionary=not compact)
+                    cursor.execute(self.backend.translate(query), params or ())
+                    result = cursor.fetchall()
+                    if compact:
+                        result = compact_rows(cursor, result)
+                    rows = len(result)
+                    logger.debug("✅ Query berhasil, ditemukan %s baris", rows)
+                    return result
+                except DB_ERRORS as e:
+                    logger.error(f"❌ Error saat mengambil data: {e}")
+                    return None
+                finally:
+                    self._record(query, params, time.perf_counter() - started, rows)
+                    if cursor:
+                        cursor.close()
+        except DB_ERRORS as e:
+            # Gagal meminjam koneksi (pool penuh/server putus): sama seperti error query
+            if self.in_transaction():
+                raise
+            logger.error(f"❌ Gagal mendapatkan koneksi untuk mengambil data: {e}")
+            return None
+
+    @contextmanager
+    def _dedicated_connection(self):
+        """Koneksi terpisah dari lease, dipakai cursor streaming yang menahan koneksi lama"""
+        if self.pool:
+            conn = self.pool.checkout()
+            try:
+                yield conn
+            finally:
+                self.pool.checkin(conn)
+            return
 
-        # Tabel poliklinik
-        create_poliklinik_table = """
-        CREATE TABLE IF NOT EXISTS poliklinik (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            nama_poli VARCHAR(50) UNIQUE NOT NULL,
-            gedung VARCHAR(20),
-            lantai INT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        conn = self._new_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stream_query(self, query, params=None, batch_size=None, compact=False, on_columns=None):
+        """Menjalankan query SELECT dan menghasilkan baris satu per satu (generator)
+
+        Memakai cursor unbuffered di koneksi tersendiri dan mengambil data per
+        batch_size baris, sehingga memori tetap datar dan koneksi utama bebas
+        dipakai untuk UPDATE selama iterasi berjalan. compact seperti di
+        fetch_query. on_columns dipanggil sekali dengan daftar nama kolom
+        sebelum baris pertama, juga bila hasilnya kosong.
         """
+        batch_size = batch_size or self.stream_batch_size
+        with self._dedicated_connection() as conn:
+            cursor = None
+            # Hanya waktu di database yang dihitung, bukan waktu pemrosesan di loop pemanggil
+            db_time = 0.0
+            total = 0
+            try:
+                started = time.perf_counter()
+                cursor = self.backend.cursor(conn, dictionary=not compact, buffered=False)
+                cursor.execute(self.backend.translate(query), params or ())
+                if on_columns:
+                    on_columns([col[0] for col in cursor.description or ()])
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    db_time += time.perf_counter() - started
+                    if not rows:
+                        break
+                    if compact:
+                        rows = compact_rows(cursor, rows)
+                    total += len(rows)
+                    yield from rows
+                    started = time.perf_counter()
+            except DB_ERRORS as e:
+                logger.error(f"❌ Error saat streaming data: {e}")
+                raise
+            finally:
+                self._record(query, params, db_time, total)
+                # Generator bisa dihentikan sebelum semua baris terbaca
+                self.backend.finish_stream(conn)
+                if cursor:
+                    cursor.close()
 
-        # Tabel antrian
-        create_antrian_table = """
-        CREATE TABLE IF NOT EXISTS antrian (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            nomor_antrian INT NOT NULL,
-            id_pasien INT,
-            id_dokter INT,
-            id_poliklinik INT,
-            tanggal_kunjungan DATE,
-            keluhan TEXT,
-            status ENUM('menunggu', 'dilayani', 'selesai') DEFAULT 'menunggu',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (id_pasien) REFERENCES pasien(id),
-            FOREIGN KEY (id_dokter) REFERENCES dokter(id),
-            FOREIGN KEY (id_poliklinik) REFERENCES poliklinik(id)
-        )
+    def keyset_query(self, query, params=None, key='id', batch_size=None, compact=False):
+        """Menghasilkan baris query SELECT per chunk keyset (generator)
+
+        Setiap chunk adalah query pendek `WHERE key > terakhir ORDER BY key
+        LIMIT n`, jadi tidak ada cursor yang tetap terbuka selama pemanggil
+        memproses baris. Cocok untuk loop yang lambat per baris (request HTTP)
+        yang dengan stream_query akan terkena net_write_timeout MySQL. query
+        tidak boleh memuat ORDER BY/LIMIT dan harus memilih kolom `key` yang
+        unik. Berbeda dengan fetch_query, error database dilempar (DB_ERRORS)
+        saat iterasi agar pemanggil bisa berhenti dengan rapi.
         """
+        batch_size = batch_size or self.stream_batch_size
+        first_query = f"SELECT * FROM ({query}) keyset_q ORDER BY {key} LIMIT %s"
+        next_query = f"SELECT * FROM ({query}) keyset_q WHERE {key} > %s ORDER BY {key} LIMIT %s"
+        last = None
+        while True:
+            if last is None:
+                chunk_query, chunk_params = first_query, (*(params or ()), batch_size)
+            else:
+                chunk_query, chunk_params = next_query, (*(params or ()), last, batch_size)
+            # Lease dilepas sebelum baris diserahkan ke pemanggil
+            with self.lease() as conn:
+                cursor = None
+                rows = None
+                started = time.perf_counter()
+                try:
+                    cursor = self.backend.cursor(conn, dictionary=not compact)
+                    cursor.execute(self.backend.translate(chunk_query), chunk_params)
+                    rows = cursor.fetchall()
+                    if compact:
+                        rows = compact_rows(cursor, rows)
+                except DB_ERRORS as e:
+                    logger.error(f"❌ Error saat mengambil data: {e}")
+                    raise
+                finally:
+                    self._record(query, params, time.perf_counter() - started, len(rows) if rows is not None else None)
+                    if cursor:
+                        cursor.close()
+            if not rows:
+                return
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][key]
+
+    def create_database_and_tables(self):
+        """Membuat database dan tabel jika belum ada"""
+        try:
+            # Buat database jika belum ada
+            self.backend.create_database(self)
+            logger.info(f"✅ Database '{self.database}' siap digunakan")
+
+            # Sekarang koneksi ke database yang sudah dibuat
+            self.connect()
+
+            # Buat/perbarui tabel lewat migrasi berversi
+            run_migrations(self)
+            return True
+
+        except (*DB_ERRORS, ImportError, MigrationError) as e:
+            logger.error(f"❌ Error saat membuat database: {e}")
+            return False
 
-        tables = [
-            create_pasien_table,
-            create_dokter_table,
-            create_poliklinik_table,
-            create_antrian_table
-        ]
+    def table_columns(self, table):
+        """Nama kolom sebuah tabel (set kosong jika tabel tidak ada)"""
+        return self.backend.table_columns(self, table)
 
-        for table_query in tables:
-            self.execute_query(table_query)
+    def index_exists(self, table, name):
+        """Memeriksa apakah index dengan nama tertentu sudah ada"""
+        return self.backend.index_exists(self, table, name)
 
-        print("✅ Semua tabel berhasil dibuat")
 
 # Singleton instance
 db = DatabaseConnection()
\ No newline at end of file
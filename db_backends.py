@@ -0,0 +1,236 @@
+import re
+import sqlite3
+from datetime import date, datetime
+from functools import lru_cache
+
+try:
+    import mysql.connector
+    from mysql.connector import Error as MySQLError
+except ImportError:  # backend SQLite tetap bisa dipakai tanpa mysql-connector
+    mysql = None
+    MySQLError = None
+
+# Semua exception database yang ditangani DatabaseConnection
+BACKEND_ERRORS = (sqlite3.Error,) + ((MySQLError,) if MySQLError else ())
+
+
+class MySQLBackend:
+    """Backend MySQL lewat mysql.connector"""
+
+    name = 'mysql'
+    label = 'MySQL'
+    # Mendukung FULLTEXT INDEX dan MATCH ... AGAINST
+    fulltext = True
+
+    def connect(self, config):
+        """Membuka satu koneksi baru ke database"""
+        if mysql is None:
+            raise ImportError("mysql-connector-python belum terinstall (pip install -r requirements.txt)")
+        connection = mysql.connector.connect(
+            host=config.host,
+            port=config.port,
+            user=config.user,
+            password=config.password,
+            database=config.database
+        )
+        # Setiap statement langsung di-commit, transaksi eksplisit memakai START TRANSACTION
+        connection.autocommit = True
+        return connection
+
+    def create_database(self, config):
+        """Membuat database jika belum ada (koneksi tanpa database dulu)"""
+        if mysql is None:
+            raise ImportError("mysql-connector-python belum terinstall (pip install -r requirements.txt)")
+        temp_connection = mysql.connector.connect(
+            host=config.host,
+            port=config.port,
+            user=config.user,
+            password=config.password
+        )
+        cursor = temp_connection.cursor()
+        try:
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {config.database}")
+        finally:
+            cursor.close()
+            temp_connection.close()
+
+    def translate(self, query):
+        return query
+
+    def cursor(self, conn, dictionary=False, buffered=True):
+        if buffered:
+            return conn.cursor(dictionary=dictionary)
+        return conn.cursor(dictionary=dictionary, buffered=False)
+
+    def is_connected(self, conn):
+        return conn.is_connected()
+
+    def begin(self, conn):
+        conn.start_transaction()
+
+    def increment_statements(self, table, keys, column):
+        """Statement counter atomik: upsert lalu baca nilai baru lewat LAST_INSERT_ID()"""
+        placeholders = ", ".join(["%s"] * len(keys))
+        return [
+            f"INSERT INTO {table} ({', '.join(keys)}, {column}) VALUES ({placeholders}, LAST_INSERT_ID(%s)) "
+            f"ON DUPLICATE KEY UPDATE {column} = LAST_INSERT_ID({column} + %s)",
+            "SELECT LAST_INSERT_ID()",
+        ]
+
+    def finish_stream(self, conn):
+        """Membuang sisa hasil cursor unbuffered yang belum dibaca"""
+        if conn.unread_result:
+            conn.consume_results()
+
+    def table_columns(self, db, table):
+        result = db.fetch_query("""
+        SELECT column_name AS name FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s
+        """, (table,))
+        return {r['name'] for r in result or []}
+
+    def index_exists(self, db, table, name):
+        result = db.fetch_query("""
+        SELECT 1 AS found FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+        """, (table, name))
+        return bool(result)
+
+    def drop_index_statement(self, table, name):
+        return f"DROP INDEX {name} ON {table}"
+
+
+def _dict_factory(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+def _year(value):
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.year
+    try:
+        return int(str(value)[:4])
+    except ValueError:
+        return None
+
+
+# Terjemahan dialek MySQL -> SQLite untuk query dan DDL yang dipakai aplikasi
+_SQLITE_REWRITES = [
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", re.I), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"\bENUM\s*\([^)]*\)", re.I), "TEXT"),
+    (re.compile(r"\s+FOR\s+UPDATE\b", re.I), ""),
+]
+
+_adapters_registered = False
+
+
+def _register_sqlite_types():
+    """Tipe DATE/TIMESTAMP dibaca sebagai date/datetime seperti di MySQL"""
+    global _adapters_registered
+    if _adapters_registered:
+        return
+    sqlite3.register_adapter(date, lambda d: d.isoformat())
+    sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+    sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()[:10]))
+    sqlite3.register_converter("TIMESTAMP", lambda b: datetime.fromisoformat(b.decode()))
+    sqlite3.register_converter("DATETIME", lambda b: datetime.fromisoformat(b.decode()))
+    _adapters_registered = True
+
+
+class SQLiteBackend:
+    """Backend SQLite berbasis file untuk benchmark dan pengujian offline
+
+    Placeholder %s diterjemahkan ke ?, CURDATE()/NOW()/YEAR() disediakan
+    sebagai fungsi SQLite, dan baris dikembalikan sebagai dict.
+    """
+
+    name = 'sqlite'
+    label = 'SQLite'
+    fulltext = False
+
+    def connect(self, config):
+        _register_sqlite_types()
+        connection = sqlite3.connect(
+            config.sqlite_path,
+            timeout=30,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # Koneksi dari pool bisa berpindah thread
+            check_same_thread=False,
+            # Autocommit; transaksi eksplisit memakai BEGIN
+            isolation_level=None,
+        )
+        connection.create_function("CURDATE", 0, lambda: date.today().isoformat())
+        connection.create_function("NOW", 0, lambda: datetime.now().replace(microsecond=0).isoformat(" "))
+        connection.create_function("YEAR", 1, _year, deterministic=True)
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.execute("PRAGMA journal_mode = WAL")
+        return connection
+
+    def create_database(self, config):
+        # File database dibuat otomatis saat koneksi pertama
+        pass
+
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def translate(query):
+        for pattern, replacement in _SQLITE_REWRITES:
+            query = pattern.sub(replacement, query)
+        return query
+
+    def cursor(self, conn, dictionary=False, buffered=True):
+        cursor = conn.cursor()
+        if dictionary:
+            cursor.row_factory = _dict_factory
+        return cursor
+
+    def is_connected(self, conn):
+        try:
+            conn.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def begin(self, conn):
+        conn.execute("BEGIN")
+
+    def increment_statements(self, table, keys, column):
+        """Statement counter atomik: upsert dengan RETURNING (SQLite >= 3.35)"""
+        placeholders = ", ".join(["%s"] * (len(keys) + 1))
+        return [
+            f"INSERT INTO {table} ({', '.join(keys)}, {column}) VALUES ({placeholders}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {column} = {column} + %s "
+            f"RETURNING {column}",
+        ]
+
+    def finish_stream(self, conn):
+        pass
+
+    def table_columns(self, db, table):
+        result = db.fetch_query(f"PRAGMA table_info({table})")
+        return {r['name'] for r in result or []}
+
+    def index_exists(self, db, table, name):
+        result = db.fetch_query(
+            "SELECT 1 AS found FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+            (table, name))
+        return bool(result)
+
+    def drop_index_statement(self, table, name):
+        return f"DROP INDEX {name}"
+
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def get_backend(name):
+    """Membuat instance backend berdasarkan nama (DB_BACKEND)"""
+    try:
+        return BACKENDS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"DB_BACKEND tidak dikenal: {name} (pilihan: {', '.join(BACKENDS)})")
@@ -0,0 +1,217 @@
+"""Export laporan ke file CSV atau NDJSON (opsional gzip)
+
+Contoh:
+    python export_laporan.py antrian --dari 2024-01-01 --sampai 2024-12-31 -o antrian_2024.csv.gz
+    python export_laporan.py kunjungan --poli 3 --format ndjson -o -
+
+Baris dibaca dengan db.stream_query dan langsung ditulis ke file, sehingga
+memori tetap datar berapa pun jumlah datanya.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timedelta
+
+from database import DB_ERRORS, db
+from log_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'ndjson')
+
+
+def _pasien_query(dari, sampai, id_poliklinik):
+    if id_poliklinik:
+        raise ValueError("Filter poliklinik tidak berlaku untuk laporan pasien")
+    conditions, params = [], []
+    # Rentang tanggal pendaftaran (created_at adalah TIMESTAMP)
+    if dari:
+        conditions.append("created_at >= %s")
+        params.append(dari)
+    if sampai:
+        conditions.append("created_at < %s")
+        params.append(sampai + timedelta(days=1))
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+    SELECT id, nomor_rm, nama_lengkap, nik, tanggal_lahir, jenis_kelamin,
+           alamat, nomor_telepon, ihs_number, created_at
+    FROM pasien{where}
+    ORDER BY id
+    """
+    return query, params
+
+
+def _antrian_filter(dari, sampai, id_poliklinik):
+    conditions, params = [], []
+    if dari:
+        conditions.append("a.tanggal_kunjungan >= %s")
+        params.append(dari)
+    if sampai:
+        conditions.append("a.tanggal_kunjungan <= %s")
+        params.append(sampai)
+    if id_poliklinik:
+        conditions.append("a.id_poliklinik = %s")
+        params.append(id_poliklinik)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+
+def _antrian_query(dari, sampai, id_poliklinik):
+    where, params = _antrian_filter(dari, sampai, id_poliklinik)
+    query = f"""
+    SELECT a.id, a.tanggal_kunjungan, a.nomor_antrian, pol.nama_poli, d.nama_dokter,
+           p.nomor_rm, p.nama_lengkap, a.status, a.keluhan, a.created_at
+    FROM antrian a
+    LEFT JOIN pasien p ON a.id_pasien = p.id
+    LEFT JOIN dokter d ON a.id_dokter = d.id
+    LEFT JOIN poliklinik pol ON a.id_poliklinik = pol.id{where}
+    ORDER BY a.tanggal_kunjungan, a.nomor_antrian, a.id
+    """
+    return query, params
+
+
+def _kunjungan_query(dari, sampai, id_poliklinik):
+    """Dibaca dari rollup antrian_harian, bukan scan seluruh tabel antrian"""
+    conditions, params = [], []
+    if dari:
+        conditions.append("h.tanggal >= %s")
+        params.append(dari)
+    if sampai:
+        conditions.append("h.tanggal <= %s")
+        params.append(sampai)
+    if id_poliklinik:
+        conditions.append("h.id_poliklinik = %s")
+        params.append(id_poliklinik)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+    SELECT h.tanggal AS tanggal_kunjungan, pol.nama_poli,
+           SUM(h.jumlah) AS total,
+           SUM(CASE WHEN h.status = 'menunggu' THEN h.jumlah ELSE 0 END) AS menunggu,
+           SUM(CASE WHEN h.status = 'dilayani' THEN h.jumlah ELSE 0 END) AS dilayani,
+           SUM(CASE WHEN h.status = 'selesai' THEN h.jumlah ELSE 0 END) AS selesai
+    FROM antrian_harian h
+    LEFT JOIN poliklinik pol ON h.id_poliklinik = pol.id{where}
+    GROUP BY h.tanggal, h.id_poliklinik, pol.nama_poli
+    HAVING SUM(h.jumlah) > 0
+    ORDER BY h.tanggal, pol.nama_poli
+    """
+    return query, params
+
+
+# Nama laporan -> (keterangan, pembuat query)
+REPORTS = {
+    'pasien': ("Data pasien (filter tanggal daftar)", _pasien_query),
+    'antrian': ("Riwayat antrian lengkap", _antrian_query),
+    'kunjungan': ("Statistik kunjungan per hari per poliklinik", _kunjungan_query),
+}
+
+
+def _open_output(path, compress):
+    if path == '-':
+        if compress:
+            # stdout tidak ditutup, hanya lapisan gzip di atasnya
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb'),
+                                    encoding='utf-8', newline=''), True
+        return sys.stdout, False
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline=''), True
+    return open(path, 'w', encoding='utf-8', newline=''), True
+
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def export(report, path, fmt=None, dari=None, sampai=None, id_poliklinik=None, compress=None):
+    """Menulis satu laporan ke path ('-' = stdout), mengembalikan jumlah baris
+
+    fmt dan compress ditebak dari ekstensi jika tidak diisi (.csv, .ndjson,
+    .jsonl, akhiran .gz untuk gzip).
+    """
+    if report not in REPORTS:
+        raise ValueError(f"Laporan tidak dikenal: {report} (pilihan: {', '.join(REPORTS)})")
+    name = path[:-3] if path.endswith('.gz') else path
+    if compress is None:
+        compress = path.endswith('.gz')
+    if fmt is None:
+        fmt = 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'csv'
+    if fmt not in FORMATS:
+        raise ValueError(f"Format tidak dikenal: {fmt} (pilihan: {', '.join(FORMATS)})")
+
+    query, params = REPORTS[report][1](dari, sampai, id_poliklinik)
+    out, should_close = _open_output(path, compress)
+    total = 0
+    try:
+        writer = csv.writer(out) if fmt == 'csv' else None
+        # Header CSV diambil dari nama kolom cursor, jadi laporan kosong tetap punya header
+        on_columns = writer.writerow if writer else None
+        for row in db.stream_query(query, params, compact=True, on_columns=on_columns):
+            if writer:
+                writer.writerow([_format_value(v) for v in row.values()])
+            else:
+                out.write(json.dumps(row.as_dict(), ensure_ascii=False, default=str) + '\n')
+            total += 1
+    finally:
+        if should_close:
+            out.close()
+        else:
+            out.flush()
+    return total
+
+
+def _parse_date(text):
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export laporan SIMRS ke CSV/NDJSON")
+    parser.add_argument('report', choices=list(REPORTS), help="jenis laporan")
+    parser.add_argument('-o', '--output', help="file output, '-' untuk stdout (default laporan_<jenis>_<waktu>.csv)")
+    parser.add_argument('--format', choices=FORMATS, help="format output (default dari ekstensi)")
+    parser.add_argument('--gzip', action='store_true', help="kompres output dengan gzip")
+    parser.add_argument('--dari', type=_parse_date, help="tanggal awal (YYYY-MM-DD)")
+    parser.add_argument('--sampai', type=_parse_date, help="tanggal akhir (YYYY-MM-DD)")
+    parser.add_argument('--poli', type=int, help="id poliklinik")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Pesan log ke stderr, jadi aman untuk output ke stdout
+    setup_logging()
+
+    output = args.output or f"laporan_{args.report}_{datetime.now():%Y%m%d_%H%M%S}.{args.format or 'csv'}"
+    if args.gzip and output != '-' and not output.endswith('.gz'):
+        output += '.gz'
+
+    if not db.connect():
+        return 1
+
+    started = time.perf_counter()
+    try:
+        total = export(args.report, output, args.format, args.dari, args.sampai, args.poli,
+                       compress=args.gzip or None)
+    except (ValueError, OSError) as e:
+        logger.error(f"❌ {e}")
+        return 1
+    except DB_ERRORS as e:
+        logger.error(f"❌ Gagal membaca data laporan: {e}")
+        return 1
+    finally:
+        db.disconnect()
+
+    logger.info(f"✅ {total} baris diexport ke {output} dalam {time.perf_counter() - started:.1f} detik")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import atexit
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Gateway Satu Sehat lokal yang dipakai script singkron_*
+GATEWAY_URL = os.getenv('SATUSEHAT_GATEWAY_URL', 'http://localhost:8008').rstrip('/')
+# Jumlah koneksi keep-alive per host, samakan dengan jumlah worker sinkronisasi
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+# Batas request per detik untuk seluruh proses (0 = tanpa batas) dan burst token bucket
+HTTP_RATE_LIMIT = float(os.getenv('HTTP_RATE_LIMIT', 0))
+HTTP_RATE_BURST = int(os.getenv('HTTP_RATE_BURST', 0))
+# Retry untuk 429/5xx: jumlah percobaan ulang, dasar dan batas jeda backoff (detik)
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 4))
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', 0.5))
+HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', 60))
+
+# 429 berarti request ditolak sebelum diproses, aman diulang untuk semua method.
+# 5xx (termasuk 503 dari gateway/proxy) bisa datang setelah server menyimpan data,
+# jadi hanya diulang untuk method idempotent atau request dengan header Idempotency-Key;
+# 5xx pada POST dikembalikan ke pemanggil agar tidak membuat data ganda.
+RETRY_ANY_METHOD = {429}
+RETRY_IDEMPOTENT = {500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+IDEMPOTENCY_HEADER = 'idempotency-key'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def is_throttled(status_code):
+    """True jika status berarti server sedang sibuk/membatasi (coba lagi nanti, bukan data salah)"""
+    return status_code == 429 or status_code >= 500
+
+
+class RateLimiter:
+    """Token bucket thread-safe: rata-rata `rate` request/detik dengan burst `burst`
+
+    rate <= 0 berarti tanpa batas; pause() tetap berlaku sehingga Retry-After
+    dari server menahan semua thread, bukan hanya thread yang menerimanya.
+    """
+
+    def __init__(self, rate=0, burst=0):
+        self.rate = rate
+        self.burst = max(1, burst or int(rate) or 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Menunggu sampai satu request boleh dikirim"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self.rate <= 0:
+                        return
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Menahan semua request selama `seconds` detik (misalnya dari Retry-After)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# Satu limiter untuk seluruh proses: semua session menuju API/gateway yang sama
+rate_limiter = RateLimiter(HTTP_RATE_LIMIT, HTTP_RATE_BURST)
+
+
+def retry_after(response):
+    """Jeda dari header Retry-After (detik atau tanggal HTTP), None jika tidak ada"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Exponential backoff dengan full jitter untuk percobaan ke-attempt (mulai 0)"""
+    base = HTTP_BACKOFF_BASE if base is None else base
+    cap = HTTP_BACKOFF_MAX if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class ThrottledSession(requests.Session):
+    """requests.Session yang melewati rate limiter dan mengulang 429/5xx
+
+    5xx hanya diulang untuk request idempotent (lihat RETRY_IDEMPOTENT).
+    Jika percobaan habis atau tidak diulang, response terakhir dikembalikan apa
+    adanya; pemanggil memakai is_throttled() untuk membedakannya dari
+    kegagalan data.
+    """
+
+    def __init__(self, limiter=None, max_retries=None):
+        super().__init__()
+        self.limiter = limiter or rate_limiter
+        self.max_retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+
+    def _should_retry(self, method, status_code, headers=None):
+        if status_code in RETRY_ANY_METHOD:
+            return True
+        if status_code not in RETRY_IDEMPOTENT:
+            return False
+        if method.upper() in IDEMPOTENT_METHODS:
+            return True
+        # Server yang mendukung Idempotency-Key tidak memproses ulang request yang sama
+        return any(name.lower() == IDEMPOTENCY_HEADER
+                   for name in (*self.headers, *(headers or ())))
+
+    def request(self, method, url, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            response = super().request(method, url, *args, **kwargs)
+            if attempt >= self.max_retries or not self._should_retry(method, response.status_code,
+                                                                      kwargs.get('headers')):
+                return response
+
+            delay = retry_after(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            else:
+                delay = min(delay, HTTP_BACKOFF_MAX)
+                # Server meminta jeda: tahan juga thread lain yang memakai limiter ini
+                self.limiter.pause(delay)
+            attempt += 1
+            logger.warning(f"⏳ HTTP {response.status_code} dari {url}, "
+                           f"coba lagi dalam {delay:.1f} detik ({attempt}/{self.max_retries})")
+            response.close()
+            time.sleep(delay)
+
+
+def create_session(pool_size=None):
+    """Membuat session HTTP dengan pool koneksi keep-alive, rate limit dan retry
+
+    Satu koneksi TCP/TLS dipakai ulang untuk banyak request ke host yang
+    sama. pool_block=True membuat thread menunggu koneksi bebas alih-alih
+    membuka koneksi sekali pakai saat semua koneksi di pool sedang dipakai.
+    """
+    pool_size = pool_size or HTTP_POOL_SIZE
+    session = ThrottledSession()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """Session bersama untuk seluruh proses (dibuat saat pertama dipakai)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+                atexit.register(_session.close)
+    return _session
+
+
+def gateway_url(path):
+    """URL lengkap endpoint gateway, contoh gateway_url('/api/condition')"""
+    return f"{GATEWAY_URL}/{path.lstrip('/')}"
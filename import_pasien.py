@@ -0,0 +1,271 @@
+"""Import pasien massal dari file CSV atau NDJSON
+
+Contoh:
+    python import_pasien.py data_pasien.csv
+    python import_pasien.py data_pasien.ndjson --batch 2000 --quiet
+
+File dibaca baris per baris (memori tetap datar), divalidasi, lalu disimpan
+per batch dalam satu transaksi. Baris yang ditolak ditulis ke
+<file>.rejects.ndjson beserta alasannya. Setelah setiap batch, nomor baris
+terakhir yang sudah tersimpan dicatat di <file>.checkpoint sehingga import
+yang terhenti bisa dilanjutkan dengan menjalankan perintah yang sama.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import date, datetime
+
+from database import DB_ERRORS, db
+from log_config import setup_logging
+from models import Pasien
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y')
+GENDERS = {
+    'l': 'L', 'laki-laki': 'L', 'laki laki': 'L', 'pria': 'L', 'm': 'L', 'male': 'L',
+    'p': 'P', 'perempuan': 'P', 'wanita': 'P', 'f': 'P', 'female': 'P',
+}
+NIK_PATTERN = re.compile(r"^\d{16}$")
+# Panjang maksimal kolom VARCHAR di tabel pasien
+MAX_LENGTH = {'nomor_rm': 20, 'nama_lengkap': 100, 'nik': 16, 'nomor_telepon': 15, 'ihs_number': 100}
+
+
+class RejectedRow(Exception):
+    """Baris input tidak valid, pesan berisi alasannya"""
+
+
+def parse_tanggal(value):
+    for fmt in DATE_FORMATS:
+        try:
+            tanggal = datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+        if tanggal > date.today():
+            raise RejectedRow(f"tanggal_lahir di masa depan: {value}")
+        return tanggal
+    raise RejectedRow(f"format tanggal_lahir tidak dikenal: {value}")
+
+
+def validate(raw):
+    """Memeriksa dan menormalkan satu record, RejectedRow jika tidak valid"""
+    record = {}
+    for column in Pasien.IMPORT_COLUMNS:
+        value = raw.get(column)
+        value = str(value).strip() if value is not None else ''
+        record[column] = value or None
+
+    if not record['nomor_rm']:
+        raise RejectedRow("nomor_rm kosong")
+    if not record['nama_lengkap']:
+        raise RejectedRow("nama_lengkap kosong")
+    if record['nik'] and not NIK_PATTERN.match(record['nik']):
+        raise RejectedRow(f"NIK harus 16 digit: {record['nik']}")
+    if record['tanggal_lahir']:
+        record['tanggal_lahir'] = parse_tanggal(record['tanggal_lahir'])
+    if record['jenis_kelamin']:
+        gender = GENDERS.get(record['jenis_kelamin'].lower())
+        if not gender:
+            raise RejectedRow(f"jenis_kelamin tidak dikenal: {record['jenis_kelamin']}")
+        record['jenis_kelamin'] = gender
+    for column, length in MAX_LENGTH.items():
+        if record[column] and len(record[column]) > length:
+            raise RejectedRow(f"{column} lebih dari {length} karakter")
+    return record
+
+
+def read_records(path, fmt, delimiter):
+    """Menghasilkan (nomor_baris_terakhir, record_mentah, error) per record"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f, delimiter=delimiter)
+            for raw in reader:
+                # line_num = baris fisik terakhir record ini (field multi-baris dihitung)
+                yield reader.line_num, raw, None
+            return
+
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except ValueError as e:
+                yield line_no, {'_raw': line.rstrip('\n')}, f"JSON tidak valid: {e}"
+                continue
+            if not isinstance(raw, dict):
+                yield line_no, {'_raw': raw}, "baris NDJSON harus berupa object"
+                continue
+            yield line_no, raw, None
+
+
+def load_checkpoint(path):
+    """Isi checkpoint: line (baris terakhir tersimpan) dan total sebelumnya"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def trim_rejects(path, line):
+    """Membuang catatan tolak setelah baris checkpoint (baris itu akan diproses ulang)"""
+    if not os.path.exists(path):
+        return
+    temp = path + '.tmp'
+    with open(path, encoding='utf-8') as src, open(temp, 'w', encoding='utf-8') as dst:
+        for entry in src:
+            try:
+                keep = json.loads(entry).get('line', 0) <= line
+            except ValueError:
+                keep = False
+            if keep:
+                dst.write(entry)
+    os.replace(temp, path)
+
+
+def save_checkpoint(path, line, totals):
+    """Menulis checkpoint secara atomik (file sementara lalu rename)"""
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump({'line': line, **totals}, f)
+    os.replace(temp, path)
+
+
+class Importer:
+    """Menyimpan batch record valid dan mencatat baris yang ditolak"""
+
+    def __init__(self, rejects, totals=None):
+        self.rejects = rejects
+        # Total kumulatif, termasuk run sebelumnya bila melanjutkan checkpoint
+        self.totals = {'inserted': 0, 'rejected': 0}
+        self.totals.update({k: v for k, v in (totals or {}).items() if k in self.totals})
+
+    def reject(self, line_no, raw, reason):
+        self.rejects.write(json.dumps({'line': line_no, 'reason': reason, 'data': raw},
+                                      ensure_ascii=False, default=str) + '\n')
+        self.totals['rejected'] += 1
+
+    def flush(self, batch):
+        """Menyimpan satu batch: buang nomor RM ganda lalu multi-row INSERT"""
+        if not batch:
+            return
+
+        existing = Pasien.existing_nomor_rm([record['nomor_rm'] for _, _, record in batch])
+        seen = set()
+        rows = []
+        for line_no, raw, record in batch:
+            if record['nomor_rm'] in existing:
+                self.reject(line_no, raw, f"nomor_rm {record['nomor_rm']} sudah terdaftar")
+            elif record['nomor_rm'] in seen:
+                self.reject(line_no, raw, f"nomor_rm {record['nomor_rm']} ganda di dalam file")
+            else:
+                seen.add(record['nomor_rm'])
+                rows.append((line_no, raw, record))
+
+        if not rows:
+            return
+
+        counts = Pasien.save_many([record for _, _, record in rows], chunk_size=len(rows))
+        if counts and None not in counts:
+            self.totals['inserted'] += len(rows)
+            return
+
+        # Batch gagal di database: simpan satu per satu agar baris penyebabnya ketahuan
+        logger.warning(f"⚠️  Batch {len(rows)} baris gagal, mengulang per baris")
+        for line_no, raw, record in rows:
+            counts = Pasien.save_many([record])
+            if counts and None not in counts:
+                self.totals['inserted'] += 1
+            else:
+                self.reject(line_no, raw, "ditolak database")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import pasien massal dari CSV/NDJSON")
+    parser.add_argument('file', help="file .csv, .ndjson atau .jsonl")
+    parser.add_argument('--format', choices=['csv', 'ndjson'],
+                        help="format file (default dari ekstensi)")
+    parser.add_argument('--delimiter', default=',', help="pemisah kolom CSV")
+    parser.add_argument('--batch', type=int, default=1000, help="jumlah baris per transaksi")
+    parser.add_argument('--rejects', help="file baris yang ditolak (default <file>.rejects.ndjson)")
+    parser.add_argument('--checkpoint', help="file checkpoint (default <file>.checkpoint)")
+    parser.add_argument('--restart', action='store_true', help="abaikan checkpoint, mulai dari awal")
+    parser.add_argument('--quiet', action='store_true', help="hanya tampilkan peringatan dan error")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    setup_logging(quiet=args.quiet)
+
+    fmt = args.format or ('csv' if args.file.lower().endswith('.csv') else 'ndjson')
+    rejects_path = args.rejects or args.file + '.rejects.ndjson'
+    checkpoint_path = args.checkpoint or args.file + '.checkpoint'
+
+    if not db.connect():
+        return 1
+
+    checkpoint = {} if args.restart else load_checkpoint(checkpoint_path)
+    start_line = checkpoint.get('line', 0)
+    if start_line:
+        logger.info(f"⏩ Melanjutkan dari baris {start_line} ({checkpoint_path})")
+        trim_rejects(rejects_path, start_line)
+
+    started = time.perf_counter()
+    processed = 0
+    with open(rejects_path, 'a' if start_line else 'w', encoding='utf-8') as rejects:
+        importer = Importer(rejects, checkpoint)
+        # Posisi terakhir yang benar-benar tersimpan, ditulis ulang bila import gagal di tengah
+        saved_line, saved_totals = start_line, dict(importer.totals)
+        batch = []
+        last_line = start_line
+        try:
+            for line_no, raw, error in read_records(args.file, fmt, args.delimiter):
+                if line_no <= start_line:
+                    continue
+                processed += 1
+                last_line = line_no
+                try:
+                    if error:
+                        raise RejectedRow(error)
+                    batch.append((line_no, raw, validate(raw)))
+                except RejectedRow as e:
+                    importer.reject(line_no, raw, str(e))
+
+                if len(batch) >= args.batch:
+                    importer.flush(batch)
+                    batch = []
+                    rejects.flush()
+                    save_checkpoint(checkpoint_path, last_line, importer.totals)
+                    saved_line, saved_totals = last_line, dict(importer.totals)
+                    elapsed = time.perf_counter() - started
+                    logger.info(f"📥 Baris {last_line}: {importer.totals['inserted']} tersimpan, "
+                                f"{importer.totals['rejected']} ditolak ({processed / elapsed:.0f} baris/detik)")
+
+            importer.flush(batch)
+            rejects.flush()
+            save_checkpoint(checkpoint_path, last_line, importer.totals)
+        except (RuntimeError, *DB_ERRORS) as e:
+            rejects.flush()
+            save_checkpoint(checkpoint_path, saved_line, saved_totals)
+            logger.error(f"❌ Import terhenti di baris {last_line}: {e}")
+            logger.error(f"   Checkpoint baris {saved_line} disimpan, jalankan perintah yang sama untuk melanjutkan")
+            db.disconnect()
+            return 1
+
+    elapsed = time.perf_counter() - started
+    totals = importer.totals
+    logger.info(f"✅ Import selesai: {processed} baris dalam {elapsed:.1f} detik "
+                f"({processed / elapsed if elapsed else 0:.0f} baris/detik)")
+    logger.info(f"   Total tersimpan: {totals['inserted']}, ditolak: {totals['rejected']}"
+                + (f" (lihat {rejects_path})" if totals['rejected'] else ""))
+    db.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
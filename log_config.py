@@ -0,0 +1,79 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+DEFAULT_FORMAT = "%(asctime)s %(levelname)s: %(message)s"
+DEFAULT_DATEFMT = "%Y-%m-%d %H:%M:%S"
+
+_listener = None
+
+
+def _env_flag(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'ya')
+
+
+def setup_logging(level=None, quiet=None, queued=None, fmt=DEFAULT_FORMAT, log_file=None):
+    """Mengatur logging aplikasi (level, quiet mode, handler antrian)
+
+    Nilai yang tidak diisi diambil dari environment:
+    - SIMRS_LOG_LEVEL: level log (default INFO)
+    - SIMRS_LOG_QUIET: 1 = hanya WARNING ke atas, untuk batch job
+    - SIMRS_LOG_QUEUE: 1 = tulis log lewat QueueHandler di thread terpisah
+      sehingga loop sinkronisasi tidak menunggu I/O terminal
+    - SIMRS_LOG_FILE: tambahan output ke file
+    """
+    global _listener
+
+    if quiet is None:
+        quiet = _env_flag('SIMRS_LOG_QUIET')
+    if queued is None:
+        queued = _env_flag('SIMRS_LOG_QUEUE')
+    if level is None:
+        level = os.getenv('SIMRS_LOG_LEVEL', 'INFO')
+    if quiet:
+        level = 'WARNING'
+    if log_file is None:
+        log_file = os.getenv('SIMRS_LOG_FILE')
+
+    formatter = logging.Formatter(fmt, datefmt=DEFAULT_DATEFMT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    # Panggilan ulang mengganti konfigurasi sebelumnya
+    if _listener:
+        _listener.stop()
+        _listener = None
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    if queued:
+        log_queue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        for handler in handlers:
+            root.addHandler(handler)
+
+
+def shutdown_logging():
+    """Menghentikan listener antrian log dan menulis sisa pesan"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
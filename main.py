@@ -3,9 +3,9 @@
 
 import os
 import sys
-from database import db
+from database import DB_ERRORS, db
 from crud_operations import CRUDOperations
-import requests
+from log_config import setup_logging
 from datetime import datetime
 
 class SIMRS:
@@ -123,17 +123,19 @@ class SIMRS:
             print("2. 👥 Laporan Pasien")
             print("3. 📊 Laporan Antrian Hari Ini")
             print("4. 🏆 Top Poliklinik Terpadat")
+            print("5. 🐢 Statistik Query Database")
+            print("6. 📤 Export Laporan (CSV/NDJSON)")
             print("0. Kembali ke Menu Utama")
 
-            choice = input("\nPilih menu [0-4]: ")
+            choice = input("\nPilih menu [0-6]: ")
 
             if choice == '1':
                 print("\n--- STATISTIK UMUM ---")
-                total_pasien = len(Pasien.get_all() or [])
-                total_dokter = len(Dokter.get_all() or [])
-                total_poliklinik = len(Poliklinik.get_all() or [])
-                total_antrian = len(Antrian.get_all() or [])
-                antrian_hari_ini = len(Antrian.get_today_queue() or [])
+                total_pasien = Pasien.count()
+                total_dokter = Dokter.count()
+                total_poliklinik = Poliklinik.count()
+                total_antrian = Antrian.count()
+                antrian_hari_ini = Antrian.count(tanggal=datetime.now().date())
 
                 data = [
                     ["Total Pasien", f"{total_pasien} orang"],
@@ -148,14 +150,15 @@ class SIMRS:
 
             elif choice == '2':
                 print("\n--- LAPORAN PASIEN ---")
-                pasiens = Pasien.get_all()
-                if pasiens:
-                    # Statistik jenis kelamin
-                    l = sum(1 for p in pasiens if p['jenis_kelamin'] == 'L')
-                    p = sum(1 for p in pasiens if p['jenis_kelamin'] == 'P')
+                # Statistik jenis kelamin dihitung di database
+                per_gender = Pasien.count_by('jenis_kelamin')
+                total = sum(per_gender.values())
+                if total:
+                    l = per_gender.get('L', 0)
+                    p = per_gender.get('P', 0)
 
                     print(f"\n📊 Statistik Pasien:")
-                    print(f"   Total: {len(pasiens)} pasien")
+                    print(f"   Total: {total} pasien")
                     print(f"   Laki-laki: {l} pasien")
                     print(f"   Perempuan: {p} pasien")
                 else:
@@ -163,21 +166,16 @@ class SIMRS:
 
             elif choice == '3':
                 print("\n--- LAPORAN ANTRIAN HARI INI ---")
-                antrians = Antrian.get_today_queue()
-                if antrians:
-                    # Statistik status
-                    menunggu = sum(
-                        1 for a in antrians if a['status'] == 'menunggu')
-                    dilayani = sum(
-                        1 for a in antrians if a['status'] == 'dilayani')
-                    selesai = sum(
-                        1 for a in antrians if a['status'] == 'selesai')
-
+                # Statistik status dihitung di database
+                hari_ini = datetime.now().date()
+                status = Antrian.status_breakdown(hari_ini, hari_ini)
+                total = sum(status.values())
+                if total:
                     data = [
-                        ["Menunggu", f"⏳ {menunggu} antrian"],
-                        ["Sedang Dilayani", f"👨‍⚕️ {dilayani} antrian"],
-                        ["Selesai", f"✅ {selesai} antrian"],
-                        ["Total", f"📋 {len(antrians)} antrian"]
+                        ["Menunggu", f"⏳ {status['menunggu']} antrian"],
+                        ["Sedang Dilayani", f"👨‍⚕️ {status['dilayani']} antrian"],
+                        ["Selesai", f"✅ {status['selesai']} antrian"],
+                        ["Total", f"📋 {total} antrian"]
                     ]
 
                     print("\n" + tabulate(data,
@@ -187,16 +185,15 @@ class SIMRS:
 
             elif choice == '4':
                 print("\n--- TOP POLIKLINIK TERPADAT ---")
-                # Query untuk menghitung antrian per poliklinik
-                query = """
-                SELECT p.nama_poli, COUNT(a.id) as total_antrian
-                FROM poliklinik p
-                LEFT JOIN antrian a ON p.id = a.id_poliklinik
-                GROUP BY p.id, p.nama_poli
-                ORDER BY total_antrian DESC
-                LIMIT 5
-                """
-                result = db.fetch_query(query)
+                try:
+                    dari = input("Dari tanggal (YYYY-MM-DD, kosongkan untuk semua): ").strip()
+                    sampai = input("Sampai tanggal (YYYY-MM-DD, kosongkan untuk semua): ").strip()
+                    dari = datetime.strptime(dari, "%Y-%m-%d").date() if dari else None
+                    sampai = datetime.strptime(sampai, "%Y-%m-%d").date() if sampai else None
+                except ValueError:
+                    print("\n⚠️  Format tanggal tidak valid, menampilkan semua data.")
+                    dari = sampai = None
+                result = Poliklinik.top_by_antrian(limit=5, dari=dari, sampai=sampai)
 
                 if result:
                     headers = ["Poliklinik", "Total Antrian"]
@@ -206,6 +203,21 @@ class SIMRS:
                 else:
                     print("\n📭 Belum ada data antrian.")
 
+            elif choice == '5':
+                print("\n--- STATISTIK QUERY DATABASE ---")
+                db.dump_stats()
+
+                cache_rows = []
+                for nama, model in (("Dokter", Dokter), ("Poliklinik", Poliklinik)):
+                    stats = model.cache.stats()
+                    cache_rows.append([nama, stats['hits'], stats['misses'],
+                                       f"{stats['hit_rate']:.0%}"])
+                print("\n" + tabulate(cache_rows,
+                      headers=["Cache", "Hit", "Miss", "Hit Rate"], tablefmt="grid"))
+
+            elif choice == '6':
+                self.export_laporan()
+
             elif choice == '0':
                 break
 
@@ -215,6 +227,41 @@ class SIMRS:
             if choice != '0':
                 input("\nTekan Enter untuk melanjutkan...")
 
+    def export_laporan(self):
+        """Export laporan ke file CSV/NDJSON"""
+        from export_laporan import REPORTS, export
+
+        print("\n--- EXPORT LAPORAN ---")
+        names = list(REPORTS)
+        for i, name in enumerate(names, 1):
+            print(f"{i}. {name} - {REPORTS[name][0]}")
+
+        try:
+            report = names[int(input("\nPilih laporan (nomor): ")) - 1]
+            fmt = input("Format (csv/ndjson) [csv]: ").strip().lower() or 'csv'
+            dari = input("Dari tanggal (YYYY-MM-DD, kosongkan untuk semua): ").strip()
+            sampai = input("Sampai tanggal (YYYY-MM-DD, kosongkan untuk semua): ").strip()
+            dari = datetime.strptime(dari, "%Y-%m-%d").date() if dari else None
+            sampai = datetime.strptime(sampai, "%Y-%m-%d").date() if sampai else None
+            id_poliklinik = None
+            if report != 'pasien':
+                poli = input("ID Poliklinik (kosongkan untuk semua): ").strip()
+                id_poliklinik = int(poli) if poli else None
+            compress = input("Kompres gzip? (y/N): ").strip().lower() == 'y'
+        except (ValueError, IndexError):
+            print("\n❌ Input tidak valid!")
+            return
+
+        default_path = f"laporan_{report}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}" + (".gz" if compress else "")
+        path = input(f"File output [{default_path}]: ").strip() or default_path
+
+        try:
+            total = export(report, path, fmt, dari, sampai, id_poliklinik, compress=compress)
+        except (ValueError, OSError, *DB_ERRORS) as e:
+            print(f"\n❌ Gagal export: {e}")
+            return
+        print(f"\n✅ {total} baris diexport ke {path}")
+
     def setup_connection(self):
         """Setup koneksi database"""
         self.clear_screen()
@@ -273,81 +320,13 @@ class SIMRS:
             print(f"⚠️  Gagal menyimpan konfigurasi: {e}")
 
     def singkron_pasien(self):
-        get_data = db.fetch_query("""
-        SELECT id,no_rm,nik,nama_pasien,ihs FROM pasien
-        WHERE ihs IS NULL AND nik IS NOT NULL AND nik != ''
-        ORDER BY tgldaftar DESC
-        """)
-        if not get_data:
-            print("\n📭 Tidak ada pasien yang perlu disinkronisasi.")
+        """Sinkronisasi IHS pasien ke Satu Sehat"""
+        from singkron_pasien import singkron_pasien
+        try:
+            singkron_pasien()
+        except DB_ERRORS as e:
+            print(f"\n❌ Sinkronisasi gagal: {e}")
             input("\nTekan Enter untuk melanjutkan...")
-            return
-        updated = 0
-        for row in get_data:
-            nik = row.get('nik')
-            pid = row.get('id')
-            if not nik:
-                continue
-            try:
-                url = f"http://localhost:8008/api/patient/search-by-nik/{nik}"
-                resp = requests.get(url, timeout=8)
-                if resp.status_code != 200:
-                    print(f"❌ nik={nik} -> HTTP {resp.status_code}")
-                    continue
-
-                data = resp.json()
-
-                update = db.execute_query("""
-                UPDATE pasien SET ihs=%s WHERE id=%s
-                """, (data['data']['entry'][0]['resource']['id'], pid))
-                if update:
-                    updated += 1
-
-                print(f"✅ nik={nik} -> Data ditemukan dari Satu Sehat.")
-                print(data['data']['entry'][0]['resource']['id'])
-                print(updated)
-                # Coba ekstrak nilai id/nomor IHS dari respons
-                # ihs_value = None
-                # if isinstance(data, dict):
-                #     for key in ('ihs','nomorIhs','nomorIHS','noIhs','id','patient_id','_id'):
-                #         if key in data and data[key]:
-                #             ihs_value = data[key]
-                #             break
-                #     if ihs_value is None:
-                #         for container in ('data','response','result'):
-                #             if container in data and isinstance(data[container], dict):
-                #                 for key in ('ihs','nomorIhs','nomorIHS','noIhs','id','patient_id','_id'):
-                #                     if key in data[container] and data[container][key]:
-                #                         ihs_value = data[container][key]
-                #                         break
-                #                 if ihs_value:
-                #                     break
-
-                # # Fallback: simpan seluruh JSON jika tidak ditemukan field spesifik
-                # if ihs_value is None:
-                #     ihs_value = resp.text
-
-                # # Simpan ke database
-                # try:
-                #     db.execute("UPDATE pasien SET ihs=%s WHERE id=%s", (ihs_value, pid))
-                #     updated += 1
-                #     print(f"✅ Pasien id={pid} nik={nik} diperbarui.")
-                # except Exception as e:
-                #     print(f"⚠️ Gagal menyimpan untuk nik={nik}: {e}")
-
-            except Exception as e:
-                update = db.execute_query("""
-                UPDATE pasien SET ihs=%s WHERE id=%s
-                """, (1, pid))
-                print(f"❌ nik={nik} -> {e}")
-
-        print(f"\n📌 Selesai. Total pasien diperbarui: {updated}")
-        print(f"\n📊 Ditemukan {len(get_data)} pasien yang belum tersinkronisasi.")
-        print("\n" + "="*120)
-        print(get_data)
-
-        print("="*120)
-        input("\nTekan Enter untuk melanjutkan...")
 
     def exit_application(self):
         """Keluar dari aplikasi"""
@@ -391,6 +370,8 @@ class SIMRS:
 
 def main():
     """Fungsi main untuk menjalankan aplikasi"""
+    # Aplikasi interaktif: pesan log tampil apa adanya di antara menu
+    setup_logging(fmt="%(message)s")
     app = SIMRS()
     app.run()
 
@@ -0,0 +1,329 @@
+import logging
+from text_search import normalize_nama
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationError(Exception):
+    """Error ketika satu langkah migrasi gagal dijalankan"""
+
+
+def _run(db, statement, params=None):
+    """Menjalankan statement migrasi, gagal = exception (bukan None)"""
+    result = db.execute_query(statement, params)
+    if result is None:
+        raise MigrationError(f"Statement migrasi gagal: {' '.join(statement.split())[:120]}")
+    return result
+
+
+def add_column(db, table, column, definition):
+    """Menambah kolom jika belum ada (idempotent)"""
+    if column in db.table_columns(table):
+        return False
+    _run(db, f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    logger.info(f"✅ Kolom {column} ditambahkan pada {table}")
+    return True
+
+
+def create_index(db, table, name, columns, unique=False, fulltext=False):
+    """Membuat index jika belum ada (idempotent)
+
+    Tabel yang tidak ada atau belum punya semua kolomnya dilewati, karena
+    sebagian tabel (rawat, dll) dikelola oleh aplikasi SIMRS lain. Index
+    FULLTEXT dilewati pada backend yang tidak mendukungnya.
+    """
+    if fulltext and not db.backend.fulltext:
+        logger.info(f"⏭️  Index {name} dilewati, {db.backend.label} tidak mendukung FULLTEXT")
+        return False
+    existing = db.table_columns(table)
+    if not existing:
+        logger.info(f"⏭️  Index {name} dilewati, tabel {table} tidak ada")
+        return False
+    missing = [c for c in columns if c not in existing]
+    if missing:
+        logger.info(f"⏭️  Index {name} dilewati, kolom {', '.join(missing)} tidak ada di {table}")
+        return False
+    if db.index_exists(table, name):
+        return False
+    kind = "FULLTEXT INDEX" if fulltext else "UNIQUE INDEX" if unique else "INDEX"
+    _run(db, f"CREATE {kind} {name} ON {table} ({', '.join(columns)})")
+    logger.info(f"✅ Index {name} dibuat pada {table}")
+    return True
+
+
+def drop_index(db, table, name):
+    """Menghapus index jika ada (idempotent)"""
+    if not db.index_exists(table, name):
+        return False
+    _run(db, db.backend.drop_index_statement(table, name))
+    logger.info(f"🗑️  Index {name} dihapus dari {table}")
+    return True
+
+
+# ================= DAFTAR MIGRASI =================
+
+def _001_tabel_dasar(db):
+    """Tabel pasien, dokter, poliklinik dan antrian"""
+    _run(db, """
+    CREATE TABLE IF NOT EXISTS pasien (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        nomor_rm VARCHAR(20) UNIQUE NOT NULL,
+        nama_lengkap VARCHAR(100) NOT NULL,
+        nik VARCHAR(16),
+        tanggal_lahir DATE,
+        jenis_kelamin ENUM('L', 'P'),
+        alamat TEXT,
+        nomor_telepon VARCHAR(15),
+        ihs_number VARCHAR(100),
+        sync_ihs_at TIMESTAMP NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    _run(db, """
+    CREATE TABLE IF NOT EXISTS dokter (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        nomor_sip VARCHAR(30) UNIQUE NOT NULL,
+        nama_dokter VARCHAR(100) NOT NULL,
+        spesialisasi VARCHAR(50),
+        nomor_telepon VARCHAR(15),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    _run(db, """
+    CREATE TABLE IF NOT EXISTS poliklinik (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        nama_poli VARCHAR(50) UNIQUE NOT NULL,
+        gedung VARCHAR(20),
+        lantai INT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    _run(db, """
+    CREATE TABLE IF NOT EXISTS antrian (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        nomor_antrian INT NOT NULL,
+        id_pasien INT,
+        id_dokter INT,
+        id_poliklinik INT,
+        tanggal_kunjungan DATE,
+        keluhan TEXT,
+        status ENUM('menunggu', 'dilayani', 'selesai') DEFAULT 'menunggu',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (id_pasien) REFERENCES pasien(id),
+        FOREIGN KEY (id_dokter) REFERENCES dokter(id),
+        FOREIGN KEY (id_poliklinik) REFERENCES poliklinik(id)
+    )
+    """)
+
+
+def _002_index_query_utama(db):
+    """Index untuk query antrian, pasien tanpa IHS dan sinkronisasi rawat"""
+    # get_next_queue_number / get_by_poliklinik
+    create_index(db, 'antrian', 'idx_antrian_poli_tanggal',
+                 ['id_poliklinik', 'tanggal_kunjungan', 'nomor_antrian'])
+    # get_today_queue
+    create_index(db, 'antrian', 'idx_antrian_tanggal', ['tanggal_kunjungan', 'nomor_antrian'])
+    # get_patients_without_ihs
+    create_index(db, 'pasien', 'idx_pasien_ihs_nik', ['ihs_number', 'nik'])
+    # Skema SIMRS produksi yang dipakai script singkron_*
+    create_index(db, 'pasien', 'idx_pasien_sync_ihs', ['ihs', 'nik'])
+    create_index(db, 'rawat', 'idx_rawat_sync',
+                 ['id_encounter', 'id_condition', 'tglmasuk', 'idjenisrawat'])
+
+
+def _003_index_nama_pasien(db):
+    """Index untuk daftar pasien berhalaman urut nama"""
+    # InnoDB menyimpan primary key di setiap index sekunder, jadi (nama_lengkap) = (nama_lengkap, id)
+    create_index(db, 'pasien', 'idx_pasien_nama', ['nama_lengkap'])
+
+
+def _004_index_nik_pasien(db):
+    """Index untuk pencarian pasien berdasarkan awalan NIK"""
+    create_index(db, 'pasien', 'idx_pasien_nik', ['nik'])
+
+
+def _005_nama_normal_pasien(db):
+    """Kolom nama_normal untuk pencarian nama (prefix index + FULLTEXT di MySQL)"""
+    add_column(db, 'pasien', 'nama_normal', 'VARCHAR(100)')
+
+    # Backfill per batch urut id
+    last_id = 0
+    while True:
+        rows = db.fetch_query("""
+        SELECT id, nama_lengkap FROM pasien
+        WHERE id > %s AND nama_normal IS NULL
+        ORDER BY id LIMIT 1000
+        """, (last_id,))
+        if rows is None:
+            raise MigrationError("Tidak bisa membaca pasien untuk backfill nama_normal")
+        if not rows:
+            break
+        counts = db.bulk_update('pasien', 'nama_normal',
+                                [(r['id'], normalize_nama(r['nama_lengkap'])) for r in rows])
+        if None in counts:
+            raise MigrationError("Backfill nama_normal gagal")
+        last_id = rows[-1]['id']
+
+    create_index(db, 'pasien', 'idx_pasien_nama_normal', ['nama_normal'])
+    create_index(db, 'pasien', 'ft_pasien_nama_normal', ['nama_normal'], fulltext=True)
+
+
+def _006_counter_antrian(db):
+    """Counter nomor antrian per poliklinik/tanggal dan unique nomor antrian"""
+    duplicates = db.fetch_query("""
+    SELECT id_poliklinik, tanggal_kunjungan, nomor_antrian, COUNT(*) AS jumlah
+    FROM antrian
+    GROUP BY id_poliklinik, tanggal_kunjungan, nomor_antrian
+    HAVING COUNT(*) > 1
+    LIMIT 10
+    """)
+    if duplicates is None:
+        raise MigrationError("Tidak bisa memeriksa nomor antrian ganda")
+    if duplicates:
+        contoh = ", ".join(f"poli {d['id_poliklinik']} {d['tanggal_kunjungan']} no. {d['nomor_antrian']}"
+                           for d in duplicates)
+        raise MigrationError(f"Nomor antrian ganda harus dibereskan dulu sebelum migrasi: {contoh}")
+
+    create_index(db, 'antrian', 'uq_antrian_poli_tanggal_nomor',
+                 ['id_poliklinik', 'tanggal_kunjungan', 'nomor_antrian'], unique=True)
+    # Kolomnya sama dengan unique index di atas, jadi hanya menambah biaya setiap INSERT.
+    # Dihapus setelah unique index ada agar foreign key id_poliklinik tetap punya index.
+    if db.index_exists('antrian', 'uq_antrian_poli_tanggal_nomor'):
+        drop_index(db, 'antrian', 'idx_antrian_poli_tanggal')
+
+    _run(db, """
+    CREATE TABLE IF NOT EXISTS antrian_counter (
+        id_poliklinik INT NOT NULL,
+        tanggal DATE NOT NULL,
+        last_number INT NOT NULL,
+        PRIMARY KEY (id_poliklinik, tanggal)
+    )
+    """)
+
+    # Counter awal dari antrian yang sudah ada
+    existing = db.fetch_query("SELECT COUNT(*) AS total FROM antrian_counter")
+    if existing is None:
+        raise MigrationError("Tidak bisa membaca tabel antrian_counter")
+    if existing[0]['total'] == 0:
+        _run(db, """
+        INSERT INTO antrian_counter (id_poliklinik, tanggal, last_number)
+        SELECT id_poliklinik, tanggal_kunjungan, MAX(nomor_antrian)
+        FROM antrian
+        WHERE id_poliklinik IS NOT NULL AND tanggal_kunjungan IS NOT NULL
+        GROUP BY id_poliklinik, tanggal_kunjungan
+        """)
+
+
+def _007_rollup_antrian_harian(db):
+    """Rollup harian antrian per (tanggal, poliklinik, dokter, status)"""
+    _run(db, """
+    CREATE TABLE IF NOT EXISTS antrian_harian (
+        tanggal DATE NOT NULL,
+        id_poliklinik INT NOT NULL,
+        id_dokter INT NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        jumlah INT NOT NULL,
+        PRIMARY KEY (tanggal, id_poliklinik, id_dokter, status)
+    )
+    """)
+    # High-water mark job catch-up (rollup_antrian.py)
+    _run(db, """
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name VARCHAR(50) PRIMARY KEY,
+        last_id INT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    existing = db.fetch_query("SELECT COUNT(*) AS total FROM rollup_state WHERE name = 'antrian_harian'")
+    if existing is None:
+        raise MigrationError("Tidak bisa membaca tabel rollup_state")
+    if existing[0]['total']:
+        return
+
+    # Isi awal dari seluruh riwayat antrian, high-water mark = id antrian terakhir
+    last = db.fetch_query("SELECT COALESCE(MAX(id), 0) AS last_id FROM antrian")
+    if last is None:
+        raise MigrationError("Tidak bisa membaca tabel antrian")
+    _run(db, "DELETE FROM antrian_harian")
+    _run(db, """
+    INSERT INTO antrian_harian (tanggal, id_poliklinik, id_dokter, status, jumlah)
+    SELECT tanggal_kunjungan, COALESCE(id_poliklinik, 0), COALESCE(id_dokter, 0),
+           COALESCE(status, 'menunggu'), COUNT(*)
+    FROM antrian
+    WHERE tanggal_kunjungan IS NOT NULL AND id <= %s
+    GROUP BY tanggal_kunjungan, COALESCE(id_poliklinik, 0), COALESCE(id_dokter, 0), COALESCE(status, 'menunggu')
+    """, (last[0]['last_id'],))
+    _run(db, "INSERT INTO rollup_state (name, last_id) VALUES ('antrian_harian', %s)",
+         (last[0]['last_id'],))
+
+
+# Juga dipakai nik_cache.py untuk database sinkronisasi yang tidak memakai migrasi ini
+NIK_IHS_CACHE_DDL = """
+CREATE TABLE IF NOT EXISTS nik_ihs_cache (
+    nik VARCHAR(16) PRIMARY KEY,
+    ihs_number VARCHAR(100),
+    fetched_at DATETIME NOT NULL
+)
+"""
+
+
+def _008_cache_nik_ihs(db):
+    """Cache lokal NIK -> IHS dari Satu Sehat (ihs_number NULL = tidak ditemukan)"""
+    _run(db, NIK_IHS_CACHE_DDL)
+
+
+# (versi, deskripsi, fungsi). Versi baru selalu ditambahkan di akhir,
+# migrasi yang sudah dirilis tidak boleh diubah.
+MIGRATIONS = [
+    (1, "Tabel dasar pasien, dokter, poliklinik, antrian", _001_tabel_dasar),
+    (2, "Index query antrian, pasien dan rawat", _002_index_query_utama),
+    (3, "Index nama pasien untuk pagination", _003_index_nama_pasien),
+    (4, "Index NIK pasien untuk pencarian", _004_index_nik_pasien),
+    (5, "Kolom nama_normal dan index pencarian nama pasien", _005_nama_normal_pasien),
+    (6, "Counter dan unique nomor antrian", _006_counter_antrian),
+    (7, "Rollup harian antrian", _007_rollup_antrian_harian),
+    (8, "Cache NIK ke IHS Satu Sehat", _008_cache_nik_ihs),
+]
+
+
+def current_version(db):
+    """Versi skema yang sudah terpasang (0 jika belum ada migrasi)"""
+    result = db.fetch_query("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+    if result is None:
+        raise MigrationError("Tidak bisa membaca tabel schema_version")
+    return result[0]['version']
+
+
+def run_migrations(db):
+    """Menjalankan semua migrasi yang belum terpasang, berurutan
+
+    Setiap migrasi harus idempotent (IF NOT EXISTS, cek index) karena DDL
+    MySQL tidak bisa di-rollback; migrasi yang gagal di tengah aman diulang.
+    """
+    _run(db, """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        description VARCHAR(200),
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    version = current_version(db)
+    pending = [m for m in MIGRATIONS if m[0] > version]
+    if not pending:
+        logger.info(f"✅ Skema database sudah versi terbaru ({version})")
+        return version
+
+    for number, description, migrate in pending:
+        logger.info(f"🔧 Migrasi {number}: {description}")
+        migrate(db)
+        _run(db, "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+             (number, description))
+        version = number
+
+    logger.info(f"✅ Skema database diperbarui ke versi {version}")
+    return version
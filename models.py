@@ -1,9 +1,314 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from database import db
-
-class Pasien:
+from database import DB_ERRORS, db
+from text_search import fulltext_query, normalize_nama, rank_nama
+
+
+class TTLCache:
+    """Cache read-through dengan TTL dan batas jumlah entri
+
+    Dipakai untuk tabel referensi (dokter, poliklinik) yang jarang berubah.
+    Hasil None (query gagal) tidak disimpan.
+    """
+
+    def __init__(self, ttl=300, maxsize=64):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        """Mengambil nilai dari cache, atau memanggil loader() jika tidak ada/kedaluwarsa"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+
+        value = loader()
+        if value is None or self.ttl <= 0:
+            return value
+
+        with self._lock:
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        """Mengosongkan cache (dipanggil setelah save/update/delete)"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Jumlah hit/miss dan ukuran cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._data),
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+# TTL cache tabel referensi dalam detik (0 = tanpa cache)
+REFERENCE_CACHE_TTL = float(os.getenv('REFERENCE_CACHE_TTL', 300))
+
+
+def _index_by_id(rows):
+    """Membuat dict id -> baris dari hasil query"""
+    return {row['id']: row for row in rows} if rows is not None else None
+
+
+def _copy_rows(rows):
+    """Salinan baris dari cache, agar perubahan oleh pemanggil tidak merusak isi cache"""
+    return [dict(row) for row in rows] if rows is not None else None
+
+
+def _where(filters):
+    """Menyusun klausa WHERE dari dict kolom -> nilai (nilai None diabaikan)"""
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+    if not filters:
+        return "", ()
+    clause = " AND ".join(f"{column} = %s" for column in filters)
+    return f" WHERE {clause}", tuple(filters.values())
+
+
+def _keyset_condition(columns, op):
+    """Perbandingan leksikografis (c1, c2, ..) op (v1, v2, ..) tanpa row constructor
+
+    Ditulis sebagai c1 op v1 OR (c1 = v1 AND (c2 op v2 OR ...)) agar index
+    komposit tetap dipakai oleh MySQL.
+    """
+    column = columns[0]
+    if len(columns) == 1:
+        return f"{column} {op} %s"
+    rest = _keyset_condition(columns[1:], op)
+    return f"({column} {op} %s OR ({column} = %s AND ({rest})))"
+
+
+def _keyset_params(key):
+    """Parameter untuk _keyset_condition: setiap nilai kecuali terakhir dipakai dua kali"""
+    params = []
+    for i, value in enumerate(key):
+        params.append(value)
+        if i < len(key) - 1:
+            params.append(value)
+    return params
+
+
+def _keyset_page(select, columns, after=None, before=None, limit=20, where=None):
+    """Mengambil satu halaman dengan keyset pagination
+
+    select adalah query SELECT ... FROM ... tanpa WHERE/ORDER BY. columns
+    adalah kolom urutan (unik secara gabungan, diakhiri id, tidak boleh NULL;
+    saring NULL lewat where). after/before berisi nilai key baris
+    terakhir/pertama dari halaman yang sedang tampil.
+    """
+    conditions = [where] if where else []
+    if before is not None:
+        condition = " AND ".join([*conditions, _keyset_condition(columns, '<')])
+        order = ", ".join(f"{c} DESC" for c in columns)
+        query = f"{select} WHERE {condition} ORDER BY {order} LIMIT %s"
+        rows = db.fetch_query(query, (*_keyset_params(before), limit), compact=True)
+        return list(reversed(rows)) if rows is not None else None
+
+    order = ", ".join(columns)
+    if after is not None:
+        conditions.append(_keyset_condition(columns, '>'))
+        params = (*_keyset_params(after), limit)
+    else:
+        params = (limit,)
+    condition = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return db.fetch_query(f"{select}{condition} ORDER BY {order} LIMIT %s", params, compact=True)
+
+
+def _like_prefix(text):
+    """Pola LIKE 'text%' dengan wildcard di input di-escape (pakai ESCAPE '!')"""
+    escaped = text.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+    return escaped + '%'
+
+
+def _date_range(column, dari=None, sampai=None):
+    """Kondisi rentang tanggal (inklusif) sebagai (list kondisi, list parameter)"""
+    conditions, params = [], []
+    if dari is not None:
+        conditions.append(f"{column} >= %s")
+        params.append(dari)
+    if sampai is not None:
+        conditions.append(f"{column} <= %s")
+        params.append(sampai)
+    return conditions, params
+
+
+def _count(table, filters=None):
+    """Menghitung jumlah baris di SQL (COUNT), bukan len() dari semua baris"""
+    where, params = _where(filters)
+    result = db.fetch_query(f"SELECT COUNT(*) AS total FROM {table}{where}", params)
+    return result[0]['total'] if result else 0
+
+
+def _count_by(table, column, allowed, filters=None):
+    """Menghitung jumlah baris per nilai kolom (GROUP BY) sebagai dict nilai -> jumlah"""
+    if column not in allowed:
+        raise ValueError(f"Kolom {column} tidak bisa dipakai untuk count_by pada tabel {table}")
+    where, params = _where(filters)
+    query = f"SELECT {column} AS value, COUNT(*) AS total FROM {table}{where} GROUP BY {column}"
+    result = db.fetch_query(query, params)
+    return {row['value']: row['total'] for row in result or []}
+
+# Identity map aktif untuk thread/task saat ini: (tabel, id) -> baris
+_identity_map = ContextVar('identity_map', default=None)
+
+
+@contextmanager
+def identity_scope():
+    """Scope identity map untuk satu layar atau satu batch
+
+    Di dalam blok ini get_by_id/get_many untuk (model, id) yang sama hanya
+    mengambil ke database sekali. Penulisan lewat model menghapus entri yang
+    bersangkutan. Scope bersarang memakai map yang sama.
+    """
+    current = _identity_map.get()
+    if current is not None:
+        yield current
+        return
+    token = _identity_map.set({})
+    try:
+        yield _identity_map.get()
+    finally:
+        _identity_map.reset(token)
+
+
+class Model:
+    """Basis model dengan pelacakan perubahan kolom (dirty tracking)
+
+    Objek dari from_row() mengingat nilai awal kolom UPDATE_FIELDS, sehingga
+    update() hanya menulis kolom yang berubah. Objek yang dibuat langsung
+    (bukan dari baris database) menulis semua UPDATE_FIELDS.
+    """
+
+    TABLE = None
+    # Kolom yang diisi from_row (nama parameter __init__), selain id
+    FIELDS = ()
+    # Kolom yang boleh diubah lewat update()
+    UPDATE_FIELDS = ()
+
+    _original = None
+
+    @classmethod
+    def from_row(cls, row):
+        """Membuat objek dari baris hasil query (dict atau record)"""
+        obj = cls(id=row['id'], **{field: row.get(field) for field in cls.FIELDS})
+        obj.mark_clean()
+        return obj
+
+    def mark_clean(self):
+        """Menandai nilai saat ini sebagai nilai yang tersimpan di database"""
+        self._original = {field: getattr(self, field) for field in self.UPDATE_FIELDS}
+
+    def dirty_fields(self):
+        """Kolom yang berubah sejak dimuat, sebagai dict kolom -> nilai baru"""
+        if self._original is None:
+            return {field: getattr(self, field) for field in self.UPDATE_FIELDS}
+        return {field: getattr(self, field) for field in self.UPDATE_FIELDS
+                if getattr(self, field) != self._original.get(field)}
+
+    def _with_derived(self, changes):
+        """Menambah kolom turunan dari kolom yang berubah (override di subclass)"""
+        return changes
+
+    @classmethod
+    def get_by_id(cls, id):
+        """Mengambil satu baris berdasarkan ID (dari identity map jika ada scope)"""
+        id = int(id)
+        scope = _identity_map.get()
+        if scope is not None and (cls.TABLE, id) in scope:
+            return scope[(cls.TABLE, id)]
+        result = db.fetch_query(f"SELECT * FROM {cls.TABLE} WHERE id = %s", (id,))
+        row = result[0] if result else None
+        if row is not None and scope is not None:
+            scope[(cls.TABLE, id)] = row
+        return row
+
+    @classmethod
+    def get_many(cls, ids):
+        """Mengambil banyak baris sekaligus dengan WHERE id IN (...), hasil dict id -> baris
+
+        ID yang sudah ada di identity map tidak di-query ulang; ID yang tidak
+        ditemukan tidak ada di hasil. None jika query gagal.
+        """
+        scope = _identity_map.get()
+        found = {}
+        missing = []
+        for id in {int(i) for i in ids if i is not None}:
+            if scope is not None and (cls.TABLE, id) in scope:
+                found[id] = scope[(cls.TABLE, id)]
+            else:
+                missing.append(id)
+
+        for start in range(0, len(missing), db.batch_size):
+            chunk = missing[start:start + db.batch_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            rows = db.fetch_query(f"SELECT * FROM {cls.TABLE} WHERE id IN ({placeholders})", chunk)
+            if rows is None:
+                return None
+            for row in rows:
+                found[row['id']] = row
+                if scope is not None:
+                    scope[(cls.TABLE, row['id'])] = row
+        return found
+
+    @classmethod
+    def forget(cls, id):
+        """Menghapus baris dari identity map setelah ditulis"""
+        scope = _identity_map.get()
+        if scope is not None and id is not None:
+            scope.pop((cls.TABLE, int(id)), None)
+
+    def update(self, id=None):
+        """Mengupdate kolom yang berubah saja
+
+        Mengembalikan 0 tanpa query jika tidak ada perubahan, None jika gagal.
+        """
+        id = self.id if id is None else id
+        changes = self.dirty_fields()
+        if not changes:
+            return 0
+        changes = self._with_derived(changes)
+        assignments = ", ".join(f"{column} = %s" for column in changes)
+        query = f"UPDATE {self.TABLE} SET {assignments} WHERE id = %s"
+        result = db.execute_query(query, (*changes.values(), id))
+        self.forget(id)
+        if result is not None:
+            self.mark_clean()
+        return result
+
+
+class Pasien(Model):
     """Model untuk tabel pasien"""
 
+    TABLE = 'pasien'
+    FIELDS = ('nomor_rm', 'nama_lengkap', 'nik', 'tanggal_lahir', 'jenis_kelamin',
+              'alamat', 'nomor_telepon', 'ihs_number')
+    UPDATE_FIELDS = ('nama_lengkap', 'nik', 'tanggal_lahir', 'jenis_kelamin',
+                     'alamat', 'nomor_telepon')
+    GROUPABLE_COLUMNS = {'jenis_kelamin'}
+    # Kolom yang bisa diisi dari file import (lihat import_pasien.py)
+    IMPORT_COLUMNS = FIELDS
+
     def __init__(self, nomor_rm=None, nama_lengkap=None, nik=None, tanggal_lahir=None,
                  jenis_kelamin=None, alamat=None, nomor_telepon=None, ihs_number=None, id=None):
         self.id = id
@@ -19,26 +324,44 @@ class Pasien:
     def save(self):
         """Menyimpan data pasien baru"""
         query = """
-        INSERT INTO pasien (nomor_rm, nama_lengkap, nik, tanggal_lahir, jenis_kelamin, alamat, nomor_telepon, ihs_number)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        INSERT INTO pasien (nomor_rm, nama_lengkap, nama_normal, nik, tanggal_lahir, jenis_kelamin, alamat, nomor_telepon, ihs_number)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
-        params = (self.nomor_rm, self.nama_lengkap, self.nik, self.tanggal_lahir,
-                 self.jenis_kelamin, self.alamat, self.nomor_telepon, self.ihs_number)
+        params = (self.nomor_rm, self.nama_lengkap, normalize_nama(self.nama_lengkap), self.nik,
+                 self.tanggal_lahir, self.jenis_kelamin, self.alamat, self.nomor_telepon, self.ihs_number)
         return db.execute_query(query, params)
 
+    @staticmethod
+    def save_many(records, chunk_size=None):
+        """Menyimpan banyak pasien sekaligus (multi-row INSERT per chunk)
+
+        records berisi dict dengan kolom IMPORT_COLUMNS; nama_normal diisi
+        otomatis. Mengembalikan list jumlah baris per chunk (None = gagal).
+        """
+        columns = Pasien.IMPORT_COLUMNS + ('nama_normal',)
+        query = f"INSERT INTO pasien ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        params = [tuple(r.get(c) for c in Pasien.IMPORT_COLUMNS) + (normalize_nama(r['nama_lengkap']),)
+                  for r in records]
+        return db.execute_many(query, params, chunk_size)
+
+    @staticmethod
+    def existing_nomor_rm(nomor_rms):
+        """Nomor RM dari daftar yang sudah terdaftar di database"""
+        if not nomor_rms:
+            return set()
+        placeholders = ", ".join(["%s"] * len(nomor_rms))
+        result = db.fetch_query(f"SELECT nomor_rm FROM pasien WHERE nomor_rm IN ({placeholders})",
+                                list(nomor_rms))
+        if result is None:
+            raise RuntimeError("Gagal memeriksa nomor RM yang sudah terdaftar")
+        return {r['nomor_rm'] for r in result}
+
     @staticmethod
     def get_all():
         """Mengambil semua data pasien"""
         query = "SELECT * FROM pasien ORDER BY nama_lengkap"
         return db.fetch_query(query)
 
-    @staticmethod
-    def get_by_id(id):
-        """Mengambil data pasien berdasarkan ID"""
-        query = "SELECT * FROM pasien WHERE id = %s"
-        result = db.fetch_query(query, (id,))
-        return result[0] if result else None
-
     @staticmethod
     def get_by_nomor_rm(nomor_rm):
         """Mengambil data pasien berdasarkan nomor RM"""
@@ -46,29 +369,11 @@ class Pasien:
         result = db.fetch_query(query, (nomor_rm,))
         return result[0] if result else None
 
-    def update(self, id):
-        """Mengupdate data pasien"""
-        query = """
-        UPDATE pasien
-        SET nama_lengkap = %s, tanggal_lahir = %s, jenis_kelamin = %s,
-            alamat = %s, nomor_telepon = %s
-        WHERE id = %s
-        """
-        params = (self.nama_lengkap, self.tanggal_lahir, self.jenis_kelamin,
-                 self.alamat, self.nomor_telepon, id)
-        return db.execute_query(query, params)
-
-    def update(self, id):
-        """Mengupdate data pasien"""
-        query = """
-        UPDATE pasien
-        SET nama_lengkap = %s, nik = %s, tanggal_lahir = %s, jenis_kelamin = %s,
-            alamat = %s, nomor_telepon = %s
-        WHERE id = %s
-        """
-        params = (self.nama_lengkap, self.nik, self.tanggal_lahir, self.jenis_kelamin,
-                 self.alamat, self.nomor_telepon, id)
-        return db.execute_query(query, params)
+    def _with_derived(self, changes):
+        # nama_normal (kolom pencarian) mengikuti nama_lengkap
+        if 'nama_lengkap' in changes:
+            changes['nama_normal'] = normalize_nama(changes['nama_lengkap'])
+        return changes
 
     def update_ihs(self, id, ihs_number):
         """Update IHS number dan sync timestamp"""
@@ -77,12 +382,14 @@ class Pasien:
         SET ihs_number = %s, sync_ihs_at = NOW()
         WHERE id = %s
         """
+        Pasien.forget(id)
         return db.execute_query(query, (ihs_number, id))
 
     @staticmethod
     def delete(id):
         """Menghapus data pasien"""
         query = "DELETE FROM pasien WHERE id = %s"
+        Pasien.forget(id)
         return db.execute_query(query, (id,))
 
     @staticmethod
@@ -95,6 +402,91 @@ class Pasien:
         """
         return db.fetch_query(query)
 
+    @staticmethod
+    def lookup(term, limit=10):
+        """Mencari pasien untuk picker berdasarkan awalan nomor RM, NIK atau nama
+
+        Setiap kriteria dijalankan sebagai query terpisah dengan LIMIT sehingga
+        masing-masing memakai index-nya sendiri; hasil digabung tanpa duplikat
+        dengan urutan RM, NIK, lalu nama.
+        """
+        term = term.strip()
+        if not term:
+            return []
+
+        pattern = _like_prefix(term)
+        # Nomor RM bisa berawalan huruf (mis. "RM", "A-"), jadi selalu dicari;
+        # NIK hanya angka sehingga cukup dicari jika term memuat digit
+        queries = ["SELECT * FROM pasien WHERE nomor_rm LIKE %s ESCAPE '!' ORDER BY nomor_rm LIMIT %s"]
+        if any(c.isdigit() for c in term):
+            queries.append("SELECT * FROM pasien WHERE nik LIKE %s ESCAPE '!' ORDER BY nik LIMIT %s")
+        queries.append("SELECT * FROM pasien WHERE nama_lengkap LIKE %s ESCAPE '!' ORDER BY nama_lengkap, id LIMIT %s")
+
+        found = {}
+        for query in queries:
+            for row in db.fetch_query(query, (pattern, limit)) or []:
+                found.setdefault(row['id'], row)
+            if len(found) >= limit:
+                break
+        return list(found.values())[:limit]
+
+    @staticmethod
+    def search(q, limit=20):
+        """Mencari pasien berdasarkan nama, hasil diurutkan menurut peringkat
+
+        Query dan nama dinormalkan (huruf kecil, tanpa aksen). Kandidat diambil
+        dari awalan nama_normal (index biasa) dan awalan setiap kata (FULLTEXT
+        BOOLEAN MODE di MySQL, LIKE di SQLite), lalu diurutkan: sama persis,
+        awalan nama, awalan kata, sisanya.
+        """
+        normalized = normalize_nama(q)
+        if not normalized:
+            return []
+
+        candidates = {}
+        rows = db.fetch_query(
+            "SELECT * FROM pasien WHERE nama_normal LIKE %s ESCAPE '!' ORDER BY nama_normal, id LIMIT %s",
+            (_like_prefix(normalized), limit))
+        for row in rows or []:
+            candidates[row['id']] = row
+
+        if len(candidates) < limit:
+            if db.backend.fulltext:
+                terms = fulltext_query(normalized)
+                rows = db.fetch_query(
+                    "SELECT * FROM pasien WHERE MATCH(nama_normal) AGAINST (%s IN BOOLEAN MODE) LIMIT %s",
+                    (terms, limit * 2)) if terms else []
+            else:
+                conditions = " AND ".join(["(' ' || nama_normal) LIKE %s ESCAPE '!'"] * len(normalized.split()))
+                params = ['% ' + _like_prefix(word) for word in normalized.split()]
+                rows = db.fetch_query(f"SELECT * FROM pasien WHERE {conditions} LIMIT %s", (*params, limit * 2))
+            for row in rows or []:
+                candidates.setdefault(row['id'], row)
+
+        ranked = sorted(candidates.values(),
+                        key=lambda r: (rank_nama(r['nama_normal'] or '', normalized), r['nama_normal'] or '', r['id']))
+        return ranked[:limit]
+
+    @staticmethod
+    def page(after=None, before=None, limit=20):
+        """Satu halaman pasien urut (nama_lengkap, id), lihat page_key()"""
+        return _keyset_page("SELECT * FROM pasien", ['nama_lengkap', 'id'], after, before, limit)
+
+    @staticmethod
+    def page_key(row):
+        """Key keyset pagination dari satu baris pasien"""
+        return (row['nama_lengkap'], row['id'])
+
+    @staticmethod
+    def count():
+        """Jumlah seluruh pasien"""
+        return _count('pasien')
+
+    @staticmethod
+    def count_by(column):
+        """Jumlah pasien per nilai kolom, misalnya count_by('jenis_kelamin')"""
+        return _count_by('pasien', column, Pasien.GROUPABLE_COLUMNS)
+
     @staticmethod
     def get_patients_with_nik():
         """Mengambil semua pasien yang memiliki NIK"""
@@ -106,9 +498,16 @@ class Pasien:
         return db.fetch_query(query)
 
 
-class Dokter:
+class Dokter(Model):
     """Model untuk tabel dokter"""
 
+    TABLE = 'dokter'
+    FIELDS = ('nomor_sip', 'nama_dokter', 'spesialisasi', 'nomor_telepon')
+    UPDATE_FIELDS = ('nama_dokter', 'spesialisasi', 'nomor_telepon')
+
+    # Daftar dokter jarang berubah, disimpan di cache dan dikosongkan saat ada perubahan
+    cache = TTLCache(ttl=REFERENCE_CACHE_TTL)
+
     def __init__(self, nomor_sip=None, nama_dokter=None, spesialisasi=None,
                  nomor_telepon=None, id=None):
         self.id = id
@@ -124,41 +523,76 @@ class Dokter:
         VALUES (%s, %s, %s, %s)
         """
         params = (self.nomor_sip, self.nama_dokter, self.spesialisasi, self.nomor_telepon)
-        return db.execute_query(query, params)
+        result = db.execute_query(query, params)
+        Dokter.cache.invalidate()
+        return result
 
     @staticmethod
-    def get_all():
-        """Mengambil semua data dokter"""
+    def _load_all():
         query = "SELECT * FROM dokter ORDER BY nama_dokter"
-        return db.fetch_query(query)
+        return Dokter.cache.get_or_load('all', lambda: db.fetch_query(query))
 
     @staticmethod
-    def get_by_id(id):
-        """Mengambil data dokter berdasarkan ID"""
-        query = "SELECT * FROM dokter WHERE id = %s"
-        result = db.fetch_query(query, (id,))
-        return result[0] if result else None
+    def get_all():
+        """Mengambil semua data dokter (dari cache jika masih berlaku, berupa salinan)"""
+        return _copy_rows(Dokter._load_all())
+
+    @classmethod
+    def get_by_id(cls, id):
+        """Mengambil data dokter berdasarkan ID (dari cache jika masih berlaku)"""
+        index = Dokter.cache.get_or_load('by_id', lambda: _index_by_id(Dokter._load_all()))
+        if index and int(id) in index:
+            return dict(index[int(id)])
+
+        # Belum ada di cache, misalnya baru ditambahkan dari proses lain
+        return super().get_by_id(id)
+
+    @classmethod
+    def get_many(cls, ids):
+        """Mengambil banyak dokter berdasarkan ID (dari cache, sisanya dengan satu query IN)"""
+        index = Dokter.cache.get_or_load('by_id', lambda: _index_by_id(Dokter._load_all())) or {}
+        ids = {int(i) for i in ids if i is not None}
+        found = {id: dict(index[id]) for id in ids if id in index}
+        missing = ids - found.keys()
+        if missing:
+            rows = super().get_many(missing)
+            if rows is None:
+                return None
+            found.update(rows)
+        return found
+
+    def update(self, id=None):
+        """Mengupdate kolom dokter yang berubah"""
+        result = super().update(id)
+        if result:
+            Dokter.cache.invalidate()
+        return result
 
-    def update(self, id):
-        """Mengupdate data dokter"""
-        query = """
-        UPDATE dokter
-        SET nama_dokter = %s, spesialisasi = %s, nomor_telepon = %s
-        WHERE id = %s
-        """
-        params = (self.nama_dokter, self.spesialisasi, self.nomor_telepon, id)
-        return db.execute_query(query, params)
+    @staticmethod
+    def count():
+        """Jumlah seluruh dokter"""
+        return _count('dokter')
 
     @staticmethod
     def delete(id):
         """Menghapus data dokter"""
         query = "DELETE FROM dokter WHERE id = %s"
-        return db.execute_query(query, (id,))
+        Dokter.forget(id)
+        result = db.execute_query(query, (id,))
+        Dokter.cache.invalidate()
+        return result
 
 
-class Poliklinik:
+class Poliklinik(Model):
     """Model untuk tabel poliklinik"""
 
+    TABLE = 'poliklinik'
+    FIELDS = ('nama_poli', 'gedung', 'lantai')
+    UPDATE_FIELDS = ('nama_poli', 'gedung', 'lantai')
+
+    # Daftar poliklinik jarang berubah, disimpan di cache dan dikosongkan saat ada perubahan
+    cache = TTLCache(ttl=REFERENCE_CACHE_TTL)
+
     def __init__(self, nama_poli=None, gedung=None, lantai=None, id=None):
         self.id = id
         self.nama_poli = nama_poli
@@ -172,41 +606,91 @@ class Poliklinik:
         VALUES (%s, %s, %s)
         """
         params = (self.nama_poli, self.gedung, self.lantai)
-        return db.execute_query(query, params)
+        result = db.execute_query(query, params)
+        Poliklinik.cache.invalidate()
+        return result
 
     @staticmethod
-    def get_all():
-        """Mengambil semua data poliklinik"""
+    def _load_all():
         query = "SELECT * FROM poliklinik ORDER BY nama_poli"
-        return db.fetch_query(query)
+        return Poliklinik.cache.get_or_load('all', lambda: db.fetch_query(query))
 
     @staticmethod
-    def get_by_id(id):
-        """Mengambil data poliklinik berdasarkan ID"""
-        query = "SELECT * FROM poliklinik WHERE id = %s"
-        result = db.fetch_query(query, (id,))
-        return result[0] if result else None
+    def get_all():
+        """Mengambil semua data poliklinik (dari cache jika masih berlaku, berupa salinan)"""
+        return _copy_rows(Poliklinik._load_all())
+
+    @classmethod
+    def get_by_id(cls, id):
+        """Mengambil data poliklinik berdasarkan ID (dari cache jika masih berlaku)"""
+        index = Poliklinik.cache.get_or_load('by_id', lambda: _index_by_id(Poliklinik._load_all()))
+        if index and int(id) in index:
+            return dict(index[int(id)])
+
+        # Belum ada di cache, misalnya baru ditambahkan dari proses lain
+        return super().get_by_id(id)
+
+    @classmethod
+    def get_many(cls, ids):
+        """Mengambil banyak poliklinik berdasarkan ID (dari cache, sisanya dengan satu query IN)"""
+        index = Poliklinik.cache.get_or_load('by_id', lambda: _index_by_id(Poliklinik._load_all())) or {}
+        ids = {int(i) for i in ids if i is not None}
+        found = {id: dict(index[id]) for id in ids if id in index}
+        missing = ids - found.keys()
+        if missing:
+            rows = super().get_many(missing)
+            if rows is None:
+                return None
+            found.update(rows)
+        return found
+
+    def update(self, id=None):
+        """Mengupdate kolom poliklinik yang berubah"""
+        result = super().update(id)
+        if result:
+            Poliklinik.cache.invalidate()
+        return result
 
-    def update(self, id):
-        """Mengupdate data poliklinik"""
-        query = """
-        UPDATE poliklinik
-        SET nama_poli = %s, gedung = %s, lantai = %s
-        WHERE id = %s
+    @staticmethod
+    def count():
+        """Jumlah seluruh poliklinik"""
+        return _count('poliklinik')
+
+    @staticmethod
+    def top_by_antrian(limit=5, dari=None, sampai=None):
+        """Poliklinik dengan jumlah antrian terbanyak dalam rentang tanggal (dari rollup harian)"""
+        conditions, params = _date_range('tanggal', dari, sampai)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+        SELECT p.nama_poli, COALESCE(h.total, 0) as total_antrian
+        FROM poliklinik p
+        LEFT JOIN (
+            SELECT id_poliklinik, SUM(jumlah) AS total
+            FROM antrian_harian{where}
+            GROUP BY id_poliklinik
+        ) h ON p.id = h.id_poliklinik
+        ORDER BY total_antrian DESC, p.nama_poli
+        LIMIT %s
         """
-        params = (self.nama_poli, self.gedung, self.lantai, id)
-        return db.execute_query(query, params)
+        return db.fetch_query(query, (*params, limit))
 
     @staticmethod
     def delete(id):
         """Menghapus data poliklinik"""
         query = "DELETE FROM poliklinik WHERE id = %s"
-        return db.execute_query(query, (id,))
+        Poliklinik.forget(id)
+        result = db.execute_query(query, (id,))
+        Poliklinik.cache.invalidate()
+        return result
 
 
 class Antrian:
     """Model untuk tabel antrian"""
 
+    STATUSES = ('menunggu', 'dilayani', 'selesai')
+    ROLLUP_COLUMNS = {'status', 'id_poliklinik', 'id_dokter', 'tanggal'}
+    GROUPABLE_COLUMNS = {'status', 'id_poliklinik', 'id_dokter', 'tanggal_kunjungan'}
+
     def __init__(self, nomor_antrian=None, id_pasien=None, id_dokter=None,
                  id_poliklinik=None, tanggal_kunjungan=None, keluhan=None,
                  status='menunggu', id=None):
@@ -219,43 +703,107 @@ class Antrian:
         self.keluhan = keluhan
         self.status = status
 
+    @staticmethod
+    def _rollup(tanggal, id_poliklinik, id_dokter, status, delta):
+        """Menyesuaikan jumlah di rollup antrian_harian (dipanggil di dalam transaksi)"""
+        if tanggal is None:
+            # Sama dengan isi awal rollup: antrian tanpa tanggal tidak dihitung
+            return
+        keys = {
+            'tanggal': tanggal,
+            'id_poliklinik': id_poliklinik or 0,
+            'id_dokter': id_dokter or 0,
+            'status': status or 'menunggu',
+        }
+        db.increment('antrian_harian', keys, 'jumlah', delta)
+
     def save(self):
-        """Menyimpan data antrian baru"""
+        """Menyimpan data antrian baru
+
+        Jika nomor_antrian kosong, nomor diambil dari counter di transaksi yang
+        sama dengan INSERT, sehingga nomor tidak terpakai bila penyimpanan gagal.
+        Rollup antrian_harian ikut diperbarui di transaksi yang sama.
+        """
         query = """
         INSERT INTO antrian (nomor_antrian, id_pasien, id_dokter, id_poliklinik,
                            tanggal_kunjungan, keluhan, status)
         VALUES (%s, %s, %s, %s, %s, %s, %s)
         """
-        params = (self.nomor_antrian, self.id_pasien, self.id_dokter,
-                 self.id_poliklinik, self.tanggal_kunjungan, self.keluhan, self.status)
-        return db.execute_query(query, params)
+        allocated = self.nomor_antrian is None
+        try:
+            with db.transaction():
+                if allocated:
+                    self.nomor_antrian = Antrian.get_next_queue_number(self.id_poliklinik, self.tanggal_kunjungan)
+                params = (self.nomor_antrian, self.id_pasien, self.id_dokter,
+                         self.id_poliklinik, self.tanggal_kunjungan, self.keluhan, self.status)
+                result = db.execute_query(query, params)
+                Antrian._rollup(self.tanggal_kunjungan, self.id_poliklinik, self.id_dokter, self.status, 1)
+                return result
+        except DB_ERRORS:
+            if allocated:
+                self.nomor_antrian = None
+            if db.in_transaction():
+                raise
+            return None
+
+    @staticmethod
+    def _lock_row(id):
+        """Membaca kolom rollup satu antrian dan menguncinya sampai transaksi selesai"""
+        query = """
+        SELECT tanggal_kunjungan, id_poliklinik, id_dokter, status
+        FROM antrian WHERE id = %s FOR UPDATE
+        """
+        result = db.fetch_query(query, (id,))
+        if result is None:
+            raise RuntimeError(f"Gagal membaca antrian {id}")
+        return result[0] if result else None
+
+    @staticmethod
+    def _with_names(rows):
+        """Melengkapi baris antrian dengan nomor_rm, nama_lengkap, nama_dokter dan nama_poli
+
+        Pasien, dokter dan poliklinik yang sama berulang di banyak antrian,
+        jadi diambil per id lewat get_many: di dalam identity_scope id yang
+        sudah pernah tampil (misalnya di halaman sebelumnya) tidak di-query
+        ulang. None jika salah satu query gagal.
+        """
+        if not rows:
+            return rows
+        pasiens = Pasien.get_many(row['id_pasien'] for row in rows)
+        dokters = Dokter.get_many(row['id_dokter'] for row in rows)
+        polikliniks = Poliklinik.get_many(row['id_poliklinik'] for row in rows)
+        if pasiens is None or dokters is None or polikliniks is None:
+            return None
+
+        result = []
+        for row in rows:
+            row = row.as_dict() if hasattr(row, 'as_dict') else dict(row)
+            pasien = pasiens.get(row['id_pasien']) or {}
+            row['nomor_rm'] = pasien.get('nomor_rm')
+            row['nama_lengkap'] = pasien.get('nama_lengkap', '-')
+            row['nama_dokter'] = (dokters.get(row['id_dokter']) or {}).get('nama_dokter', '-')
+            row['nama_poli'] = (polikliniks.get(row['id_poliklinik']) or {}).get('nama_poli', '-')
+            result.append(row)
+        return result
 
     @staticmethod
     def get_all():
-        """Mengambil semua data antrian dengan join ke tabel lain"""
+        """Mengambil semua data antrian beserta nama pasien, dokter dan poliklinik"""
         query = """
-        SELECT a.*, p.nama_lengkap, d.nama_dokter, pol.nama_poli
-        FROM antrian a
-        JOIN pasien p ON a.id_pasien = p.id
-        JOIN dokter d ON a.id_dokter = d.id
-        JOIN poliklinik pol ON a.id_poliklinik = pol.id
+        SELECT a.* FROM antrian a
         ORDER BY a.tanggal_kunjungan, a.nomor_antrian
         """
-        return db.fetch_query(query)
+        return Antrian._with_names(db.fetch_query(query))
 
     @staticmethod
     def get_today_queue():
         """Mengambil data antrian hari ini"""
         query = """
-        SELECT a.*, p.nama_lengkap, d.nama_dokter, pol.nama_poli
-        FROM antrian a
-        JOIN pasien p ON a.id_pasien = p.id
-        JOIN dokter d ON a.id_dokter = d.id
-        JOIN poliklinik pol ON a.id_poliklinik = pol.id
+        SELECT a.* FROM antrian a
         WHERE a.tanggal_kunjungan = CURDATE()
         ORDER BY a.nomor_antrian
         """
-        return db.fetch_query(query)
+        return Antrian._with_names(db.fetch_query(query))
 
     @staticmethod
     def get_by_poliklinik(id_poliklinik, tanggal=None):
@@ -264,37 +812,140 @@ class Antrian:
             tanggal = datetime.now().date()
 
         query = """
-        SELECT a.*, p.nama_lengkap, d.nama_dokter, pol.nama_poli
-        FROM antrian a
-        JOIN pasien p ON a.id_pasien = p.id
-        JOIN dokter d ON a.id_dokter = d.id
-        JOIN poliklinik pol ON a.id_poliklinik = pol.id
+        SELECT a.* FROM antrian a
         WHERE a.id_poliklinik = %s AND a.tanggal_kunjungan = %s
         ORDER BY a.nomor_antrian
         """
-        return db.fetch_query(query, (id_poliklinik, tanggal))
+        return Antrian._with_names(db.fetch_query(query, (id_poliklinik, tanggal)))
 
     def update_status(self, id, status):
-        """Mengupdate status antrian"""
+        """Mengupdate status antrian (rollup harian dipindah ke status baru)"""
         query = "UPDATE antrian SET status = %s WHERE id = %s"
-        return db.execute_query(query, (status, id))
+        try:
+            with db.transaction():
+                old = Antrian._lock_row(id)
+                if old is None:
+                    return 0
+                result = db.execute_query(query, (status, id))
+                if old['status'] != status:
+                    Antrian._rollup(old['tanggal_kunjungan'], old['id_poliklinik'], old['id_dokter'], old['status'], -1)
+                    Antrian._rollup(old['tanggal_kunjungan'], old['id_poliklinik'], old['id_dokter'], status, 1)
+                return result
+        except (*DB_ERRORS, RuntimeError):
+            if db.in_transaction():
+                raise
+            return None
 
     @staticmethod
     def get_next_queue_number(id_poliklinik, tanggal=None):
-        """Mengambil nomor antrian selanjutnya untuk poliklinik tertentu"""
+        """Mengalokasikan nomor antrian berikutnya untuk poliklinik tertentu
+
+        Nomor diambil dari baris antrian_counter (poliklinik, tanggal) yang
+        dinaikkan secara atomik, jadi setiap pemanggilan mendapat nomor unik.
+        Panggil di dalam db.transaction() bersama INSERT antrian agar nomor
+        ikut di-rollback jika penyimpanan gagal.
+        """
         if not tanggal:
             tanggal = datetime.now().date()
 
-        query = """
-        SELECT COALESCE(MAX(nomor_antrian), 0) + 1 as next_number
-        FROM antrian
-        WHERE id_poliklinik = %s AND tanggal_kunjungan = %s
+        return db.increment('antrian_counter', {'id_poliklinik': id_poliklinik, 'tanggal': tanggal},
+                            'last_number')
+
+    # Antrian tanpa tanggal (ditulis proses lain) tidak bisa jadi key halaman: `> NULL` tidak pernah benar
+    PAGE_WHERE = "a.tanggal_kunjungan IS NOT NULL"
+
+    @staticmethod
+    def page(after=None, before=None, limit=20):
+        """Satu halaman antrian urut (tanggal_kunjungan, nomor_antrian, id), lihat page_key()"""
+        select = """
+        SELECT a.* FROM antrian a
         """
-        result = db.fetch_query(query, (id_poliklinik, tanggal))
-        return result[0]['next_number'] if result else 1
+        columns = ['a.tanggal_kunjungan', 'a.nomor_antrian', 'a.id']
+        return Antrian._with_names(_keyset_page(select, columns, after, before, limit, Antrian.PAGE_WHERE))
+
+    @staticmethod
+    def page_count():
+        """Jumlah antrian yang bisa tampil di page() (filter yang sama)"""
+        result = db.fetch_query(f"SELECT COUNT(*) AS total FROM antrian a WHERE {Antrian.PAGE_WHERE}")
+        return result[0]['total'] if result else 0
+
+    @staticmethod
+    def page_key(row):
+        """Key keyset pagination dari satu baris antrian"""
+        return (row['tanggal_kunjungan'], row['nomor_antrian'], row['id'])
+
+    @staticmethod
+    def count(tanggal=None, id_poliklinik=None):
+        """Jumlah antrian, opsional per tanggal kunjungan dan/atau poliklinik"""
+        return _count('antrian', {'tanggal_kunjungan': tanggal, 'id_poliklinik': id_poliklinik})
+
+    @staticmethod
+    def count_by(column, tanggal=None, id_poliklinik=None):
+        """Jumlah antrian per nilai kolom, misalnya count_by('status')"""
+        return _count_by('antrian', column, Antrian.GROUPABLE_COLUMNS,
+                         {'tanggal_kunjungan': tanggal, 'id_poliklinik': id_poliklinik})
+
+    @staticmethod
+    def rollup(by, dari=None, sampai=None, id_poliklinik=None):
+        """Jumlah antrian per nilai kolom `by` dari rollup antrian_harian
+
+        Biaya query sebanding dengan jumlah hari x poli x dokter x status di
+        rentang tanggal, bukan jumlah baris antrian.
+        """
+        if by not in Antrian.ROLLUP_COLUMNS:
+            raise ValueError(f"Kolom {by} tidak ada di rollup antrian_harian")
+        conditions, params = _date_range('tanggal', dari, sampai)
+        if id_poliklinik is not None:
+            conditions.append("id_poliklinik = %s")
+            params.append(id_poliklinik)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT {by} AS value, SUM(jumlah) AS total FROM antrian_harian{where} GROUP BY {by}"
+        result = db.fetch_query(query, params)
+        return {row['value']: int(row['total']) for row in result or [] if row['total']}
+
+    @staticmethod
+    def status_breakdown(dari=None, sampai=None, id_poliklinik=None):
+        """Jumlah antrian per status dalam rentang tanggal (semua status selalu ada, default 0)"""
+        counts = Antrian.rollup('status', dari, sampai, id_poliklinik)
+        return {status: counts.get(status, 0) for status in Antrian.STATUSES}
+
+    @staticmethod
+    def rebuild_rollup(tanggal_list):
+        """Menghitung ulang rollup antrian_harian untuk tanggal-tanggal tertentu dari tabel antrian"""
+        tanggal_list = list(tanggal_list)
+        if not tanggal_list:
+            return 0
+        rebuilt = 0
+        for start in range(0, len(tanggal_list), db.batch_size):
+            chunk = tanggal_list[start:start + db.batch_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            with db.transaction():
+                db.execute_query(f"DELETE FROM antrian_harian WHERE tanggal IN ({placeholders})", chunk)
+                db.execute_query(f"""
+                INSERT INTO antrian_harian (tanggal, id_poliklinik, id_dokter, status, jumlah)
+                SELECT tanggal_kunjungan, COALESCE(id_poliklinik, 0), COALESCE(id_dokter, 0),
+                       COALESCE(status, 'menunggu'), COUNT(*)
+                FROM antrian
+                WHERE tanggal_kunjungan IN ({placeholders})
+                GROUP BY tanggal_kunjungan, COALESCE(id_poliklinik, 0), COALESCE(id_dokter, 0),
+                         COALESCE(status, 'menunggu')
+                """, chunk)
+            rebuilt += len(chunk)
+        return rebuilt
 
     @staticmethod
     def delete(id):
-        """Menghapus data antrian"""
+        """Menghapus data antrian (dan mengurangi rollup harian)"""
         query = "DELETE FROM antrian WHERE id = %s"
-        return db.execute_query(query, (id,))
\ No newline at end of file
+        try:
+            with db.transaction():
+                old = Antrian._lock_row(id)
+                if old is None:
+                    return 0
+                result = db.execute_query(query, (id,))
+                Antrian._rollup(old['tanggal_kunjungan'], old['id_poliklinik'], old['id_dokter'], old['status'], -1)
+                return result
+        except (*DB_ERRORS, RuntimeError):
+            if db.in_transaction():
+                raise
+            return None
\ No newline at end of file
@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from database import db
+from migrations import NIK_IHS_CACHE_DDL
+
+logger = logging.getLogger(__name__)
+
+# Umur maksimal entri NIK -> IHS (detik) dan entri "tidak ditemukan"
+NIK_CACHE_TTL = float(os.getenv('NIK_CACHE_TTL', 30 * 24 * 3600))
+NIK_CACHE_NEGATIVE_TTL = float(os.getenv('NIK_CACHE_NEGATIVE_TTL', 24 * 3600))
+
+# Penanda NIK yang tidak ada di cache (beda dengan None = tercatat tidak ditemukan)
+MISS = object()
+
+
+class NikCache:
+    """Cache persisten NIK -> IHS di tabel nik_ihs_cache
+
+    Entri positif menyimpan nomor IHS, entri negatif (ihs_number NULL)
+    mencatat NIK yang tidak ditemukan di Satu Sehat; keduanya punya TTL
+    sendiri. Penulisan ditampung lalu dikirim per batch dengan REPLACE
+    (didukung MySQL dan SQLite). Kegagalan database diperlakukan sebagai
+    cache miss sehingga sinkronisasi tetap berjalan lewat jaringan.
+    """
+
+    def __init__(self, database=None, ttl=None, negative_ttl=None, chunk_size=None):
+        self.database = database or db
+        self.ttl = NIK_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = NIK_CACHE_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.chunk_size = chunk_size or self.database.batch_size
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.pending = []
+        self._ready = None
+        self._lock = threading.Lock()
+
+    def _ensure_table(self):
+        """Membuat tabel cache bila belum ada (database sinkronisasi tidak menjalankan migrasi)
+
+        Jika tabel tetap tidak bisa dipakai, cache dinonaktifkan untuk instance ini.
+        """
+        if self._ready is None:
+            # Dicek ulang di dalam lock: thread lain mungkin sudah selesai memeriksa
+            with self._lock:
+                if self._ready is None:
+                    if not self.database.table_columns('nik_ihs_cache'):
+                        self.database.execute_query(NIK_IHS_CACHE_DDL)
+                    ready = bool(self.database.table_columns('nik_ihs_cache'))
+                    if not ready:
+                        logger.warning("⚠️  Tabel nik_ihs_cache tidak tersedia, cache NIK dinonaktifkan")
+                    self._ready = ready
+        return self._ready
+
+    def _valid(self, ihs_number, fetched_at, now):
+        if isinstance(fetched_at, str):
+            fetched_at = datetime.fromisoformat(fetched_at)
+        ttl = self.ttl if ihs_number is not None else self.negative_ttl
+        return ttl > 0 and fetched_at is not None and now - fetched_at < timedelta(seconds=ttl)
+
+    def get_many(self, niks):
+        """Entri cache yang masih berlaku: dict nik -> ihs_number (None = tidak ditemukan)
+
+        NIK yang tidak ada di hasil berarti cache miss.
+        """
+        niks = list(dict.fromkeys(n for n in niks if n))
+        found = {}
+        now = datetime.now()
+        for start in range(0, len(niks) if self._ensure_table() else 0, self.chunk_size):
+            chunk = niks[start:start + self.chunk_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            rows = self.database.fetch_query(
+                f"SELECT nik, ihs_number, fetched_at FROM nik_ihs_cache WHERE nik IN ({placeholders})", chunk)
+            for row in rows or []:
+                if self._valid(row['ihs_number'], row['fetched_at'], now):
+                    found[row['nik']] = row['ihs_number']
+
+        with self._lock:
+            for nik in niks:
+                if nik not in found:
+                    self.misses += 1
+                elif found[nik] is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+        return found
+
+    def get(self, nik):
+        """ihs_number, None jika tercatat tidak ditemukan, atau MISS"""
+        return self.get_many([nik]).get(nik, MISS)
+
+    def put(self, nik, ihs_number):
+        """Mencatat hasil lookup (ihs_number None = tidak ditemukan), ditulis saat flush"""
+        if not nik:
+            return
+        with self._lock:
+            self.pending.append((nik, ihs_number, datetime.now().replace(microsecond=0)))
+            full = len(self.pending) >= self.chunk_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Menulis semua entri yang masih tertunda"""
+        with self._lock:
+            rows, self.pending = self.pending, []
+        if not rows or not self._ensure_table():
+            return
+        counts = self.database.execute_many(
+            "REPLACE INTO nik_ihs_cache (nik, ihs_number, fetched_at) VALUES (%s, %s, %s)",
+            rows, chunk_size=self.chunk_size)
+        with self._lock:
+            self.stored += sum(len(rows[i * self.chunk_size:(i + 1) * self.chunk_size])
+                               for i, count in enumerate(counts) if count is not None)
+
+    @property
+    def lookups(self):
+        return self.hits + self.negative_hits + self.misses
+
+    def hit_rate(self):
+        """Persentase lookup yang terjawab cache (positif maupun negatif)"""
+        return 100.0 * (self.hits + self.negative_hits) / self.lookups if self.lookups else 0.0
+
+    def summary(self):
+        return (f"{self.lookups} lookup, {self.hits} hit, {self.negative_hits} hit negatif, "
+                f"{self.misses} miss ({self.hit_rate():.1f}% hit), {self.stored} entri disimpan")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+
+# Cache bersama untuk SatuSehatClient
+nik_cache = NikCache()
@@ -0,0 +1,173 @@
+import functools
+import logging
+import os
+import random
+import re
+import threading
+from tabulate import tabulate
+
+logger = logging.getLogger(__name__)
+
+# Pola untuk menormalkan SQL menjadi fingerprint
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUE_ROWS = re.compile(r"(\(\?\+\))(?:\s*,\s*\(\?\+\))+")
+_WHEN_THEN = re.compile(r"(when \? then \?)(?:\s+when \? then \?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+# Query aplikasi memakai teks SQL yang sama berulang kali, jadi hasil normalisasi di-cache
+@functools.lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Menormalkan SQL: literal dan placeholder menjadi ?, daftar nilai diringkas"""
+    fp = _STRING.sub("?", sql)
+    fp = _NUMBER.sub("?", fp)
+    fp = _PLACEHOLDER.sub("?", fp)
+    fp = _WHITESPACE.sub(" ", fp).strip().lower()
+    fp = _VALUE_LIST.sub("(?+)", fp)
+    fp = _VALUE_ROWS.sub(r"\1...", fp)
+    fp = _WHEN_THEN.sub(r"\1...", fp)
+    return fp
+
+
+def redact_params(params):
+    """Menyamarkan parameter query, hanya tipe datanya yang dicatat"""
+    if not params:
+        return "()"
+    if len(params) > 10:
+        return f"({len(params)} parameter)"
+    return "(" + ", ".join(type(p).__name__ for p in params) + ")"
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class QueryEvent:
+    """Satu eksekusi query yang sudah selesai"""
+
+    def __init__(self, sql, params, elapsed, rows):
+        self.sql = sql
+        self.params = params
+        self.elapsed = elapsed
+        self.rows = rows
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.sql)
+        return self._fingerprint
+
+    @property
+    def elapsed_ms(self):
+        return self.elapsed * 1000
+
+
+class _FingerprintStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = []
+
+
+class QueryStats:
+    """Statistik agregat per fingerprint (jumlah, total waktu, p50/p95/p99)
+
+    Persentil dihitung dari reservoir sample berukuran tetap per fingerprint
+    sehingga memori tidak bertambah selama proses berjalan.
+    """
+
+    def __init__(self, max_samples=1000):
+        self.max_samples = max_samples
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        self.record(event)
+
+    def record(self, event):
+        """Mencatat satu QueryEvent"""
+        # Dihitung sebelum lock agar regex tidak berjalan bergiliran antar thread
+        fp = event.fingerprint
+        with self._lock:
+            stats = self._stats.get(fp)
+            if stats is None:
+                stats = self._stats[fp] = _FingerprintStats()
+            stats.count += 1
+            stats.total += event.elapsed
+            stats.max = max(stats.max, event.elapsed)
+            stats.rows += event.rows or 0
+            if len(stats.samples) < self.max_samples:
+                stats.samples.append(event.elapsed)
+            else:
+                slot = random.randrange(stats.count)
+                if slot < self.max_samples:
+                    stats.samples[slot] = event.elapsed
+
+    def snapshot(self):
+        """Mengembalikan statistik per fingerprint, diurutkan dari total waktu terbesar"""
+        with self._lock:
+            items = [(fp, s.count, s.total, s.max, s.rows, sorted(s.samples))
+                     for fp, s in self._stats.items()]
+        result = []
+        for fp, count, total, max_elapsed, rows, samples in items:
+            result.append({
+                'fingerprint': fp,
+                'count': count,
+                'total_ms': total * 1000,
+                'p50_ms': _percentile(samples, 50) * 1000,
+                'p95_ms': _percentile(samples, 95) * 1000,
+                'p99_ms': _percentile(samples, 99) * 1000,
+                'max_ms': max_elapsed * 1000,
+                'rows': rows,
+            })
+        result.sort(key=lambda r: r['total_ms'], reverse=True)
+        return result
+
+    def report(self, limit=20, width=80):
+        """Membuat tabel ringkasan statistik query"""
+        rows = []
+        for s in self.snapshot()[:limit]:
+            fp = s['fingerprint']
+            rows.append([
+                fp if len(fp) <= width else fp[:width - 3] + "...",
+                s['count'],
+                f"{s['total_ms']:.1f}",
+                f"{s['p50_ms']:.1f}",
+                f"{s['p95_ms']:.1f}",
+                f"{s['p99_ms']:.1f}",
+                s['rows'],
+            ])
+        if not rows:
+            return "Belum ada query yang tercatat."
+        headers = ['Query', 'Jumlah', 'Total ms', 'p50 ms', 'p95 ms', 'p99 ms', 'Baris']
+        return tabulate(rows, headers=headers, tablefmt='grid', disable_numparse=True)
+
+    def reset(self):
+        """Menghapus semua statistik"""
+        with self._lock:
+            self._stats.clear()
+
+
+class SlowQueryLog:
+    """Mencatat query yang lebih lambat dari threshold, parameter disamarkan"""
+
+    def __init__(self, threshold_ms=None):
+        if threshold_ms is None:
+            threshold_ms = float(os.getenv('DB_SLOW_QUERY_MS', 500))
+        self.threshold_ms = threshold_ms
+
+    def __call__(self, event):
+        if self.threshold_ms <= 0 or event.elapsed_ms < self.threshold_ms:
+            return
+        logger.warning("🐢 Query lambat %.1f ms, %s baris: %s params=%s",
+                       event.elapsed_ms, event.rows if event.rows is not None else '-',
+                       event.fingerprint, redact_params(event.params))
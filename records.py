@@ -0,0 +1,52 @@
+from collections import namedtuple
+from functools import lru_cache
+
+
+@lru_cache(maxsize=256)
+def record_class(columns):
+    """Class record berbasis tuple untuk satu bentuk kolom hasil query
+
+    Instance jauh lebih kecil dari dict karena nama kolom disimpan sekali di
+    class, bukan di setiap baris. Akses tetap bisa lewat row['kolom'],
+    row.get('kolom'), row.kolom (jika nama kolom identifier valid) maupun
+    indeks posisi, sehingga kode yang memakai baris dict tidak perlu diubah.
+    """
+    index = {name: i for i, name in enumerate(columns)}
+
+    class Record(namedtuple('Record', columns, rename=True)):
+        __slots__ = ()
+
+        def __getitem__(self, key):
+            if isinstance(key, str):
+                try:
+                    key = index[key]
+                except KeyError:
+                    raise KeyError(key) from None
+            return tuple.__getitem__(self, key)
+
+        def get(self, key, default=None):
+            position = index.get(key)
+            return default if position is None else tuple.__getitem__(self, position)
+
+        def __contains__(self, key):
+            return key in index
+
+        def keys(self):
+            return columns
+
+        def values(self):
+            return tuple(self)
+
+        def items(self):
+            return zip(columns, self)
+
+        def as_dict(self):
+            return dict(zip(columns, self))
+
+    return Record
+
+
+def compact_rows(cursor, rows):
+    """Mengubah baris tuple dari cursor menjadi instance record_class"""
+    make = record_class(tuple(col[0] for col in cursor.description))._make
+    return [make(row) for row in rows]
@@ -0,0 +1,125 @@
+"""Job catch-up rollup harian antrian (tabel antrian_harian)
+
+Antrian yang dibuat lewat aplikasi ini langsung tercatat di rollup. Job ini
+menyusul antrian yang ditulis oleh proses lain: tanggal kunjungan dari
+antrian dengan id di atas high-water mark dihitung ulang, lalu mark dimajukan.
+Perubahan pada antrian lama (status, tanggal, hapus) tidak menggeser id, jadi
+setiap run juga menghitung ulang jendela ROLLUP_WINDOW_DAYS hari terakhir.
+Perubahan yang lebih lama dari jendela itu disusul dengan --dari/--sampai.
+
+Contoh:
+    python rollup_antrian.py                                 # catch-up dari high-water mark + jendela harian
+    python rollup_antrian.py --window 30                     # jendela 30 hari terakhir
+    python rollup_antrian.py --dari 2024-01-01 --sampai 2024-12-31   # hitung ulang rentang tanggal
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from database import DB_ERRORS, db
+from log_config import setup_logging
+from models import Antrian
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = 'antrian_harian'
+# Jumlah hari terakhir yang selalu dihitung ulang setiap run (0 = hanya high-water mark)
+ROLLUP_WINDOW_DAYS = int(os.getenv('ROLLUP_WINDOW_DAYS', 7))
+
+
+def _dates_in_range(dari, sampai):
+    """Tanggal di antrian maupun di rollup dalam rentang (termasuk tanggal yang antriannya sudah dihapus)"""
+    rows = db.fetch_query("""
+    SELECT DISTINCT tanggal_kunjungan AS tanggal FROM antrian
+    WHERE tanggal_kunjungan BETWEEN %s AND %s
+    UNION
+    SELECT DISTINCT tanggal FROM antrian_harian
+    WHERE tanggal BETWEEN %s AND %s
+    """, (dari, sampai, dari, sampai))
+    if rows is None:
+        raise RuntimeError("Gagal membaca tanggal untuk dihitung ulang")
+    return {r['tanggal'] for r in rows}
+
+
+def catch_up(window_days=None):
+    """Menghitung ulang tanggal yang punya antrian baru sejak high-water mark
+    ditambah window_days hari terakhir (default ROLLUP_WINDOW_DAYS)
+    """
+    window_days = ROLLUP_WINDOW_DAYS if window_days is None else window_days
+    state = db.fetch_query("SELECT last_id FROM rollup_state WHERE name = %s", (STATE_NAME,))
+    latest = db.fetch_query("SELECT COALESCE(MAX(id), 0) AS max_id FROM antrian")
+    if state is None or latest is None:
+        raise RuntimeError("Gagal membaca high-water mark rollup")
+    last_id = state[0]['last_id'] if state else 0
+    max_id = latest[0]['max_id']
+
+    dates = set()
+    if max_id > last_id:
+        rows = db.fetch_query("""
+        SELECT DISTINCT tanggal_kunjungan FROM antrian
+        WHERE id > %s AND id <= %s AND tanggal_kunjungan IS NOT NULL
+        """, (last_id, max_id))
+        if rows is None:
+            raise RuntimeError("Gagal membaca antrian baru")
+        dates.update(r['tanggal_kunjungan'] for r in rows)
+    if window_days > 0:
+        # Antrian lama yang diubah/dihapus proses lain tidak terlihat dari high-water mark
+        today = date.today()
+        dates |= _dates_in_range(today - timedelta(days=window_days - 1), today)
+
+    rebuilt = Antrian.rebuild_rollup(dates)
+
+    if max_id > last_id:
+        if state:
+            db.execute_query("UPDATE rollup_state SET last_id = %s, updated_at = NOW() WHERE name = %s",
+                             (max_id, STATE_NAME))
+        else:
+            db.execute_query("INSERT INTO rollup_state (name, last_id) VALUES (%s, %s)", (STATE_NAME, max_id))
+    logger.info(f"✅ Rollup {rebuilt} tanggal dihitung ulang (jendela {window_days} hari), "
+                f"high-water mark {last_id} -> {max(max_id, last_id)}")
+    return rebuilt
+
+
+def rebuild_range(dari, sampai):
+    """Menghitung ulang semua tanggal dalam rentang (termasuk tanggal yang antriannya sudah dihapus)"""
+    rebuilt = Antrian.rebuild_rollup(_dates_in_range(dari, sampai))
+    logger.info(f"✅ Rollup {rebuilt} tanggal ({dari} s/d {sampai}) dihitung ulang")
+    return rebuilt
+
+
+def _parse_date(text):
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Catch-up rollup harian antrian")
+    parser.add_argument('--dari', type=_parse_date, help="hitung ulang mulai tanggal (YYYY-MM-DD)")
+    parser.add_argument('--sampai', type=_parse_date, help="hitung ulang sampai tanggal (YYYY-MM-DD)")
+    parser.add_argument('--window', type=int, default=ROLLUP_WINDOW_DAYS,
+                        help=f"jumlah hari terakhir yang selalu dihitung ulang (default {ROLLUP_WINDOW_DAYS})")
+    parser.add_argument('--quiet', action='store_true', help="hanya tampilkan peringatan dan error")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    setup_logging(quiet=args.quiet)
+    if not db.connect():
+        return 1
+    try:
+        if args.dari or args.sampai:
+            rebuild_range(args.dari or args.sampai, args.sampai or args.dari)
+        else:
+            catch_up(args.window)
+    except (RuntimeError, *DB_ERRORS) as e:
+        logger.error(f"❌ {e}")
+        return 1
+    finally:
+        db.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
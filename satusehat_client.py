@@ -1,11 +1,123 @@
 import requests
 import json
-from datetime import datetime
+import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from http_client import create_session
+from nik_cache import nik_cache
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Token diperbarui sekian detik sebelum expired
+TOKEN_REFRESH_MARGIN = 300
+
+
+class TokenManager:
+    """Menyimpan access token OAuth2 dan memperbaruinya sebelum expired
+
+    Hanya satu thread yang meminta token baru pada satu waktu (single-flight).
+    Selama masa margin, token lama masih dipakai thread lain sementara satu
+    thread memperbarui; setelah benar-benar expired, thread lain menunggu
+    hasil refresh tersebut. Jika cache_path diisi, token disimpan ke file
+    (mode 0600) sehingga proses sinkronisasi berikutnya tidak perlu login ulang.
+    """
+
+    def __init__(self, fetch, cache_path=None, cache_key=None, margin=TOKEN_REFRESH_MARGIN):
+        # fetch() -> (access_token, expires_in_detik) atau None jika gagal
+        self.fetch = fetch
+        self.cache_path = cache_path
+        self.cache_key = cache_key
+        self.margin = margin
+        self.token = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self, now):
+        return self.token is not None and now < self.expires_at - self.margin
+
+    def get(self):
+        """Access token yang masih berlaku, None jika gagal mendapatkan token"""
+        now = time.time()
+        if self._fresh(now):
+            return self.token
+
+        # Masih berlaku tapi masuk margin: cukup satu thread yang refresh, sisanya pakai token lama
+        if self.token is not None and now < self.expires_at:
+            if not self._lock.acquire(blocking=False):
+                return self.token
+        else:
+            self._lock.acquire()
+        try:
+            # Thread lain mungkin sudah selesai refresh selama kita menunggu lock
+            if self._fresh(time.time()):
+                return self.token
+            if self._load_cache():
+                return self.token
+
+            result = self.fetch()
+            if not result:
+                # Gagal refresh: token lama tetap dipakai selama belum expired
+                return self.token if self.token is not None and time.time() < self.expires_at else None
+            token, expires_in = result
+            self.token = token
+            self.expires_at = time.time() + float(expires_in)
+            self._save_cache()
+            return self.token
+        finally:
+            self._lock.release()
+
+    def invalidate(self, token=None):
+        """Membuang token yang ditolak server (401)
+
+        Jika token diisi, hanya dibuang bila masih sama dengan token saat ini,
+        agar token yang baru saja diperbarui thread lain tidak ikut terbuang.
+        """
+        with self._lock:
+            if token is None or token == self.token:
+                self.token = None
+                self.expires_at = 0.0
+                if self.cache_path:
+                    try:
+                        os.remove(self.cache_path)
+                    except OSError:
+                        pass
+
+    def _load_cache(self):
+        if not self.cache_path:
+            return False
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+            token = cached['access_token']
+            expires_at = float(cached['expires_at'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if cached.get('key') != self.cache_key or time.time() >= expires_at - self.margin:
+            return False
+        self.token = token
+        self.expires_at = expires_at
+        logger.debug(f"🔑 Access token diambil dari cache {self.cache_path}")
+        return True
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        temp = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'key': self.cache_key, 'access_token': self.token,
+                           'expires_at': self.expires_at}, f)
+            os.replace(temp, self.cache_path)
+        except OSError as e:
+            logger.warning(f"⚠️  Gagal menyimpan cache token {self.cache_path}: {e}")
+
+
 class SatuSehatClient:
     """Client untuk mengakses API Satu Sehat"""
 
@@ -16,18 +128,16 @@ class SatuSehatClient:
         self.client_secret = os.getenv('SATUSEHAT_CLIENT_SECRET')
         self.organization_id = os.getenv('SATUSEHAT_ORGANIZATION_ID')
 
-        self.access_token = None
-        self.token_expires_at = None
+        # Cache token hanya berlaku untuk client_id dan endpoint auth yang sama
+        self.tokens = TokenManager(self._request_token,
+                                   cache_path=os.getenv('SATUSEHAT_TOKEN_CACHE') or None,
+                                   cache_key=f"{self.auth_url}|{self.client_id}")
 
-    def get_access_token(self):
-        """Mendapatkan access token dari OAuth2 Satu Sehat"""
-        # Check if current token is still valid
-        if self.access_token and self.token_expires_at and datetime.now() < self.token_expires_at:
-            return self.access_token
-
-        if not self.client_id or not self.client_secret:
-            raise ValueError("SATUSEHAT_CLIENT_ID dan SATUSEHAT_CLIENT_SECRET harus diisi di file .env")
+        # Koneksi keep-alive dipakai ulang untuk semua request client ini
+        self.session = create_session()
 
+    def _request_token(self):
+        """Meminta token baru ke OAuth2 Satu Sehat, (token, expires_in) atau None"""
         try:
             # Request token
             auth_data = {
@@ -40,7 +150,7 @@ class SatuSehatClient:
                 'Content-Type': 'application/x-www-form-urlencoded'
             }
 
-            response = requests.post(
+            response = self.session.post(
                 f"{self.auth_url}/accesstoken?grant_type=client_credentials",
                 data=auth_data,
                 headers=headers,
@@ -49,26 +159,26 @@ class SatuSehatClient:
 
             if response.status_code == 200:
                 token_data = response.json()
-                self.access_token = token_data.get('access_token')
-                expires_in = token_data.get('expires_in', 3600)
-
-                # Set expiry time (dengan buffer 5 menit sebelum expired)
-                self.token_expires_at = datetime.now().timestamp() + expires_in - 300
-
-                print("✅ Berhasil mendapatkan access token Satu Sehat")
-                return self.access_token
+                logger.info("✅ Berhasil mendapatkan access token Satu Sehat")
+                return token_data.get('access_token'), token_data.get('expires_in', 3600)
             else:
-                print(f"❌ Gagal mendapatkan token: {response.status_code}")
-                print(f"Response: {response.text}")
+                logger.error(f"❌ Gagal mendapatkan token: {response.status_code}")
+                logger.error(f"Response: {response.text}")
                 return None
 
         except requests.exceptions.RequestException as e:
-            print(f"❌ Error saat request token: {e}")
+            logger.error(f"❌ Error saat request token: {e}")
             return None
         except Exception as e:
-            print(f"❌ Error mendapatkan access token: {e}")
+            logger.error(f"❌ Error mendapatkan access token: {e}")
             return None
 
+    def get_access_token(self):
+        """Mendapatkan access token dari OAuth2 Satu Sehat (dari cache jika masih berlaku)"""
+        if not self.client_id or not self.client_secret:
+            raise ValueError("SATUSEHAT_CLIENT_ID dan SATUSEHAT_CLIENT_SECRET harus diisi di file .env")
+        return self.tokens.get()
+
     def get_headers(self):
         """Mendapatkan headers untuk API request"""
         token = self.get_access_token()
@@ -80,10 +190,27 @@ class SatuSehatClient:
             'Content-Type': 'application/json'
         }
 
-    def get_patient_by_nik(self, nik):
-        """Mendapatkan data pasien dari Satu Sehat berdasarkan NIK"""
+    @staticmethod
+    def _cache_ihs(nik, ihs_number):
+        """Mencatat hasil lookup ke nik_ihs_cache (ihs_number None = tidak ditemukan)
+
+        Best-effort: kegagalan cache tidak boleh membuat hasil API yang sukses
+        dianggap gagal (pemanggil bisa membuat pasien ganda).
+        """
+        try:
+            nik_cache.put(nik, ihs_number)
+            nik_cache.flush()
+        except Exception as e:
+            logger.warning(f"⚠️  Gagal mencatat NIK {nik} ke cache: {e}")
+
+    def get_patient_by_nik(self, nik, retry_auth=True):
+        """Mendapatkan data pasien dari Satu Sehat berdasarkan NIK
+
+        Selalu bertanya ke Satu Sehat agar nama, tanggal lahir dan gender
+        lengkap; hasil IHS dicatat di nik_ihs_cache (dipakai singkron_pasien).
+        """
         if not nik or len(nik) != 16:
-            print(f"❌ NIK tidak valid: {nik}")
+            logger.warning(f"❌ NIK tidak valid: {nik}")
             return None
 
         try:
@@ -92,9 +219,9 @@ class SatuSehatClient:
             # Endpoint untuk mencari pasien berdasarkan NIK
             url = f"{self.base_url}/fhir-r4/v1/Patient?identifier=https://fhir.kemkes.go.id/id/nik|{nik}"
 
-            print(f"🔍 Mencari pasien dengan NIK: {nik}")
+            logger.debug(f"🔍 Mencari pasien dengan NIK: {nik}")
 
-            response = requests.get(url, headers=headers, timeout=30)
+            response = self.session.get(url, headers=headers, timeout=30)
 
             if response.status_code == 200:
                 data = response.json()
@@ -123,31 +250,33 @@ class SatuSehatClient:
                             given_names = ' '.join(name_data['given'])
                             patient_data['name'] = f"{given_names} {name_data['family']}"
 
-                    print(f"✅ Ditemukan pasien: {patient_data['name']} (IHS: {ihs_number})")
+                    logger.info(f"✅ Ditemukan pasien: {patient_data['name']} (IHS: {ihs_number})")
+                    self._cache_ihs(nik, ihs_number)
                     return patient_data
                 else:
-                    print(f"❌ Pasien dengan NIK {nik} tidak ditemukan di Satu Sehat")
+                    logger.info(f"❌ Pasien dengan NIK {nik} tidak ditemukan di Satu Sehat")
+                    self._cache_ihs(nik, None)
                     return None
 
             elif response.status_code == 404:
-                print(f"❌ Pasien dengan NIK {nik} tidak ditemukan (404)")
+                logger.info(f"❌ Pasien dengan NIK {nik} tidak ditemukan (404)")
+                self._cache_ihs(nik, None)
                 return None
-            elif response.status_code == 401:
-                print("❌ Token tidak valid, refresh token...")
-                self.access_token = None
-                self.token_expires_at = None
-                # Retry dengan token baru
-                return self.get_patient_by_nik(nik)
+            elif response.status_code == 401 and retry_auth:
+                logger.warning("❌ Token tidak valid, refresh token...")
+                self.tokens.invalidate(headers['Authorization'][len('Bearer '):])
+                # Retry sekali dengan token baru
+                return self.get_patient_by_nik(nik, retry_auth=False)
             else:
-                print(f"❌ Error API: {response.status_code}")
-                print(f"Response: {response.text}")
+                logger.error(f"❌ Error API: {response.status_code}")
+                logger.error(f"Response: {response.text}")
                 return None
 
         except requests.exceptions.RequestException as e:
-            print(f"❌ Error saat request ke API: {e}")
+            logger.error(f"❌ Error saat request ke API: {e}")
             return None
         except Exception as e:
-            print(f"❌ Error mendapatkan data pasien: {e}")
+            logger.error(f"❌ Error mendapatkan data pasien: {e}")
             return None
 
     def create_patient(self, patient_data):
@@ -179,12 +308,13 @@ class SatuSehatClient:
 
             url = f"{self.base_url}/fhir-r4/v1/Patient"
 
-            response = requests.post(url, headers=headers, json=fhir_patient, timeout=30)
+            response = self.session.post(url, headers=headers, json=fhir_patient, timeout=30)
 
             if response.status_code == 201:  # Created
                 created_patient = response.json()
                 ihs_number = created_patient.get('id')
-                print(f"✅ Berhasil membuat pasien di Satu Sehat (IHS: {ihs_number})")
+                logger.info(f"✅ Berhasil membuat pasien di Satu Sehat (IHS: {ihs_number})")
+                self._cache_ihs(patient_data['nik'], ihs_number)
                 return {
                     'ihs_number': ihs_number,
                     'name': patient_data['nama_lengkap'],
@@ -193,12 +323,12 @@ class SatuSehatClient:
                     'gender': fhir_patient['gender']
                 }
             else:
-                print(f"❌ Gagal membuat pasien: {response.status_code}")
-                print(f"Response: {response.text}")
+                logger.error(f"❌ Gagal membuat pasien: {response.status_code}")
+                logger.error(f"Response: {response.text}")
                 return None
 
         except Exception as e:
-            print(f"❌ Error membuat pasien: {e}")
+            logger.error(f"❌ Error membuat pasien: {e}")
             return None
 
 # Global instance
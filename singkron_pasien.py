@@ -1,68 +1,182 @@
+import argparse
+import logging
 import os
-import sys
-from database import db
-import requests
-from datetime import datetime
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from database import DB_ERRORS, db, UpdateBuffer
+from log_config import setup_logging
+from http_client import HTTP_POOL_SIZE, create_session, get_session, gateway_url
+from nik_cache import NikCache
 
+logger = logging.getLogger(__name__)
+
+# Jumlah request NIK -> IHS yang berjalan bersamaan
+SYNC_WORKERS = int(os.getenv('SYNC_WORKERS', 8))
+# Interval laporan progres (detik)
+PROGRESS_INTERVAL = 10
+
+
+def cari_ihs(session, nik):
+    """Mencari IHS satu NIK lewat gateway (dijalankan di thread worker)
+
+    Mengembalikan ('ok', ihs), ('notfound', pesan) bila gateway menjawab 404
+    atau 200 tanpa entry (dicatat di cache negatif, sama seperti SatuSehatClient), ('skip', pesan) bila gateway tidak menjawab
+    200 (termasuk 429/5xx setelah retry habis; pasien dicoba lagi di run
+    berikutnya), atau ('error', pesan) bila request/response gagal (pasien
+    ditandai ihs=1).
+    """
+    try:
+        resp = session.get(gateway_url(f"/api/patient/search-by-nik/{nik}"), timeout=8)
+        if resp.status_code == 404:
+            return 'notfound', "HTTP 404"
+        if resp.status_code != 200:
+            return 'skip', f"HTTP {resp.status_code}"
+        data = resp.json()
+        entries = data['data'].get('entry')
+        if not entries:
+            return 'notfound', "tidak ditemukan (entry kosong)"
+        return 'ok', entries[0]['resource']['id']
+    except Exception as e:
+        return 'error', str(e)
+
+
+def singkron_pasien(workers=None):
+    workers = max(1, workers or SYNC_WORKERS)
 
-def singkron_pasien():
     # Pastikan database terkoneksi
-    if not db.connection or not db.connection.is_connected():
-        print("🔄 Menghubungkan ke database...")
+    if not db.is_connected():
+        logger.info("🔄 Menghubungkan ke database...")
         if not db.connect():
-            print("❌ Gagal terkoneksi ke database!")
+            logger.error("❌ Gagal terkoneksi ke database!")
             input("\nTekan Enter untuk melanjutkan...")
             return
 
-    get_data = db.fetch_query("""
+    # Dibaca per chunk id (keyset): tidak ada cursor terbuka selama request HTTP berjalan
+    get_data = db.keyset_query("""
         SELECT id,no_rm,nik,nama_pasien,ihs FROM pasien
         WHERE ihs IS NULL AND nik IS NOT NULL AND nik != ''
-        ORDER BY tgldaftar DESC
-        """)
-    if not get_data:
-        print("\n📭 Tidak ada pasien yang perlu disinkronisasi.")
-        input("\nTekan Enter untuk melanjutkan...")
-        return
-    
+        """, compact=True)
+
+    # Pool koneksi HTTP minimal sebanyak worker agar tidak ada yang menunggu koneksi
+    session = get_session() if workers <= HTTP_POOL_SIZE else create_session(workers)
+    # Jendela request yang sedang berjalan dibatasi, jadi baris dari stream tidak menumpuk di memori
+    window = workers * 4
+
+    found = 0
+    processed = 0
     updated = 0
-    for row in get_data:
-        nik = row.get('nik')
-        pid = row.get('id')
-        if not nik:
-            continue
-        try:
-            url = f"http://localhost:8008/api/patient/search-by-nik/{nik}"
-            resp = requests.get(url, timeout=8)
-            if resp.status_code != 200:
-                print(f"❌ nik={nik} -> HTTP {resp.status_code}")
-                continue
-
-            data = resp.json()
-            print(data['data']['entry'][0]['resource']['id'])
-            update = db.execute_query("""
-            UPDATE pasien SET ihs=%s WHERE id=%s
-            """, (data['data']['entry'][
-                0]['resource']['id'], pid))
-            if update:
+    duplicates = 0
+    started = last_report = time.perf_counter()
+    # Hasil NIK yang sudah diketahui di run ini (NIK yang sama dipakai beberapa nomor RM)
+    resolved = {}
+    # NIK yang sedang diminta ke gateway -> id pasien yang menunggu hasilnya
+    inflight = {}
+    pending = {}
+
+    def apply(nik, pids, status, value, source="Satu Sehat"):
+        # Dipanggil di thread utama: satu-satunya penulis ke database
+        nonlocal processed, updated
+        for pid in pids:
+            processed += 1
+            if status == 'ok':
+                ihs_updates.add(pid, value)
                 updated += 1
+                logger.info(f"✅ nik={nik} -> Data ditemukan dari {source}: {value}")
+            elif status == 'error':
+                ihs_updates.add(pid, 1)
+                logger.warning(f"❌ nik={nik} -> {value}")
+            else:
+                logger.warning(f"❌ nik={nik} -> {value}")
 
-            print(f"✅ nik={nik} -> Data ditemukan dari Satu Sehat.")
-            print(data['data']['entry'][0]['resource']['id'])
-            print(updated)
-        except Exception as e:
-            update = db.execute_query("""
-                UPDATE pasien SET ihs=%s WHERE id=%s
-                """, (1, pid))
-            print(f"❌ nik={nik} -> {e}")
-
-    print(f"\n📌 Selesai. Total pasien diperbarui: {updated}")
-    print(f"\n📊 Ditemukan {len(get_data)} pasien yang belum tersinkronisasi.")
-    print("\n" + "="*120)
-    print(get_data)
-
-    print("="*120)
+    def drain():
+        nonlocal last_report
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            nik = pending.pop(future)
+            status, value = future.result()
+            if status == 'ok':
+                cache.put(nik, value)
+            elif status == 'notfound':
+                cache.put(nik, None)
+            if status != 'skip':
+                resolved[nik] = (status, value)
+            apply(nik, inflight.pop(nik), status, value)
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            logger.info(f"📈 {processed}/{found} pasien diproses, {updated} diperbarui "
+                        f"({processed / (now - started):.1f} pasien/detik, cache {cache.hit_rate():.0f}% hit)")
+
+    def dispatch(batch):
+        # Cache dibaca per batch (satu query IN), hanya NIK yang miss dikirim ke gateway
+        nonlocal duplicates
+        fresh = [nik for _, nik in batch if nik not in resolved and nik not in inflight]
+        cached = cache.get_many(fresh)
+        for pid, nik in batch:
+            if nik in resolved:
+                duplicates += 1
+                apply(nik, [pid], *resolved[nik], source="NIK ganda")
+            elif nik in inflight:
+                duplicates += 1
+                inflight[nik].append(pid)
+            elif nik in cached:
+                ihs = cached[nik]
+                resolved[nik] = ('ok', ihs) if ihs is not None else ('notfound', "tidak ditemukan (cache)")
+                apply(nik, [pid], *resolved[nik], source="cache")
+            else:
+                inflight[nik] = [pid]
+                pending[executor.submit(cari_ihs, session, nik)] = nik
+                while len(pending) >= window:
+                    drain()
+
+    try:
+        with UpdateBuffer(db, 'pasien', 'ihs') as ihs_updates, NikCache(db) as cache, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix='singkron') as executor:
+            batch = []
+            for row in get_data:
+                found += 1
+                nik = row.get('nik')
+                if not nik:
+                    continue
+                batch.append((row.get('id'), nik))
+                if len(batch) >= window:
+                    dispatch(batch)
+                    batch = []
+            dispatch(batch)
+            while pending:
+                drain()
+    except DB_ERRORS as e:
+        logger.error(f"❌ Gagal membaca data pasien: {e}")
+        input("\nTekan Enter untuk melanjutkan...")
+        return
+    finally:
+        if session is not get_session():
+            session.close()
+
+    if not found:
+        logger.info("📭 Tidak ada pasien yang perlu disinkronisasi.")
+        input("\nTekan Enter untuk melanjutkan...")
+        return
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"📌 Selesai. Total pasien diperbarui: {updated} ({ihs_updates.written} baris ditulis)")
+    logger.info(f"📦 Cache NIK: {cache.summary()}, {duplicates} NIK ganda tanpa request")
+    logger.info(f"📊 Ditemukan {found} pasien yang belum tersinkronisasi. "
+                f"{processed} diproses dalam {elapsed:.1f} detik ({processed / elapsed if elapsed else 0:.1f} pasien/detik, "
+                f"{workers} worker)")
     input("\nTekan Enter untuk melanjutkan...")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sinkronisasi IHS pasien dari Satu Sehat berdasarkan NIK")
+    parser.add_argument('--workers', type=int, default=SYNC_WORKERS,
+                        help=f"jumlah request bersamaan (default {SYNC_WORKERS}, 1 = berurutan)")
+    parser.add_argument('--quiet', action='store_true', help="hanya tampilkan peringatan dan error")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    singkron_pasien()
\ No newline at end of file
+    args = parse_args()
+    # Batch job: log lewat antrian agar loop tidak menunggu I/O terminal
+    setup_logging(quiet=args.quiet, queued=True)
+    singkron_pasien(args.workers)
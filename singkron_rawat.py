@@ -1,10 +1,13 @@
+import logging
 import os
 import sys
-from database import db
-import requests
+from database import DB_ERRORS, db
+from log_config import setup_logging
+from http_client import get_session, gateway_url
 from datetime import datetime, timedelta, timezone
 import json
-import traceback
+
+logger = logging.getLogger(__name__)
 
 def parse_number_string(s):
     if s is None:
@@ -69,14 +72,15 @@ def to_utc_iso(dt):
 
 
 def singkron_rawat():
-    if not db.connection or not db.connection.is_connected():
-        print("🔄 Menghubungkan ke database...")
+    if not db.is_connected():
+        logger.info("🔄 Menghubungkan ke database...")
         if not db.connect():
-            print("❌ Gagal terkoneksi ke database!")
+            logger.error("❌ Gagal terkoneksi ke database!")
             input("\nTekan Enter untuk melanjutkan...")
             return
 
-    get_data = db.fetch_query("""
+    # Dibaca per chunk id (keyset): tidak ada cursor terbuka selama request HTTP berjalan
+    get_data = db.keyset_query("""
     SELECT 
         rawat.id,
         rawat.idrawat,
@@ -99,251 +103,268 @@ def singkron_rawat():
     INNER JOIN dokter ON dokter.id = rawat.iddokter
     INNER JOIN poli ON poli.id = rawat.idpoli
     INNER JOIN organisasi_satusehat ON organisasi_satusehat.id_ruangan = poli.kode
-    INNER JOIN demo_rekap_medis on demo_rekap_medis.idrawat = rawat.id
-    INNER JOIN demo_detail_rekap_medis on demo_detail_rekap_medis.idrekapmedis = demo_rekap_medis.id
+    -- Satu baris per rawat (key keyset harus unik): detail rekap medis terbaru saja
+    INNER JOIN demo_detail_rekap_medis ON demo_detail_rekap_medis.id = (
+        SELECT MAX(detail.id) FROM demo_rekap_medis rekap
+        INNER JOIN demo_detail_rekap_medis detail ON detail.idrekapmedis = rekap.id
+        WHERE rekap.idrawat = rawat.id
+    )
     WHERE pasien.ihs IS NOT NULL 
     AND pasien.ihs != '1'
     AND (rawat.id_encounter IS NULL OR rawat.id_encounter = '')
     AND rawat.tglmasuk IS NOT NULL
     AND YEAR(rawat.tglmasuk) BETWEEN 2024 AND 2025
     AND rawat.idjenisrawat = 1
-    ORDER BY rawat.tglmasuk DESC
-    """)
-
-    if not get_data:
-        print("\n📭 Tidak ada pasien yang perlu disinkronisasi.")
-        input("\nTekan Enter untuk melanjutkan...")
-        return
+    """, compact=True)
 
+    session = get_session()
+    found = 0
     updated = 0
-    for row in get_data:
-        try:
-            patient_id = row.get('ihs')
-            patient_name = row.get('nama_pasien')
-            practitioner_id = row.get('kode_ihs')
-            practitioner_name = row.get('nama_dokter')
-            organization_id = '100026488'
-            encounter_identifier_system = 'http://sys-ids.kemkes.go.id/encounter/100026488'
-            encounter_identifier_value = row.get('idrawat')
-            encounter_class_code = 'AMB'
-            encounter_class_display = 'ambulatory'
-
-            # tglmasuk / tglpulang kemungkinan datetime dari DB (naive)
-            tglmasuk_raw = row.get('tglmasuk')
-            tglpulang_raw = row.get('tglpulang')
-
-            # Buat period_start / period_end sebagai ISO UTC dengan Z, clamp ke rentang yang diperbolehkan
-            period_start = to_utc_iso(tglmasuk_raw)
-            if not period_start:
-                # jika tidak bisa parse, gunakan now sebagai fallback (dan catat)
-                period_start = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
-                print(f"⚠️ idrawat={encounter_identifier_value}: tglmasuk tidak valid, menggunakan NOW.")
-
-            # period_end: jika ada tglpulang gunakan, kalau tidak set 3 jam setelah tglmasuk
-            if tglpulang_raw:
-                period_end = to_utc_iso(tglpulang_raw)
-            else:
-                # buat dari tglmasuk_raw (cari object datetime)
-                if isinstance(tglmasuk_raw, datetime):
-                    pe = (tglmasuk_raw.replace(tzinfo=timezone.utc) if tglmasuk_raw.tzinfo is None else tglmasuk_raw) + timedelta(hours=3)
-                    period_end = to_utc_iso(pe)
-                else:
-                    period_end = to_utc_iso(datetime.now(timezone.utc) + timedelta(hours=3))
-
-            # safety: pastikan period_end >= period_start
+    try:
+        for row in get_data:
+            found += 1
             try:
-                ps_dt = datetime.fromisoformat(period_start.replace("Z", "+00:00"))
-                pe_dt = datetime.fromisoformat(period_end.replace("Z", "+00:00"))
-                if pe_dt < ps_dt:
-                    pe_dt = ps_dt + timedelta(hours=3)
-                    period_end = pe_dt.isoformat().replace("+00:00", "Z")
-            except Exception:
-                # jika parse gagal, biarkan apa adanya
-                pass
+                patient_id = row.get('ihs')
+                patient_name = row.get('nama_pasien')
+                practitioner_id = row.get('kode_ihs')
+                practitioner_name = row.get('nama_dokter')
+                organization_id = '100026488'
+                encounter_identifier_system = 'http://sys-ids.kemkes.go.id/encounter/100026488'
+                encounter_identifier_value = row.get('idrawat')
+                encounter_class_code = 'AMB'
+                encounter_class_display = 'ambulatory'
+
+                # tglmasuk / tglpulang kemungkinan datetime dari DB (naive)
+                tglmasuk_raw = row.get('tglmasuk')
+                tglpulang_raw = row.get('tglpulang')
 
-            location_id = row.get('id_location') or row.get('id_location')
-            location_display = row.get('nama_organisasi')
+                # Buat period_start / period_end sebagai ISO UTC dengan Z, clamp ke rentang yang diperbolehkan
+                period_start = to_utc_iso(tglmasuk_raw)
+                if not period_start:
+                    # jika tidak bisa parse, gunakan now sebagai fallback (dan catat)
+                    period_start = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+                    logger.warning(f"⚠️ idrawat={encounter_identifier_value}: tglmasuk tidak valid, menggunakan NOW.")
+
+                # period_end: jika ada tglpulang gunakan, kalau tidak set 3 jam setelah tglmasuk
+                if tglpulang_raw:
+                    period_end = to_utc_iso(tglpulang_raw)
+                else:
+                    # buat dari tglmasuk_raw (cari object datetime)
+                    if isinstance(tglmasuk_raw, datetime):
+                        pe = (tglmasuk_raw.replace(tzinfo=timezone.utc) if tglmasuk_raw.tzinfo is None else tglmasuk_raw) + timedelta(hours=3)
+                        period_end = to_utc_iso(pe)
+                    else:
+                        period_end = to_utc_iso(datetime.now(timezone.utc) + timedelta(hours=3))
 
-            # parsing pemeriksaan_fisik (bisa string JSON atau dict)
-            pemeriksaan_fisik = row.get('pemeriksaan_fisik')
-            if isinstance(pemeriksaan_fisik, str):
+                # safety: pastikan period_end >= period_start
                 try:
-                    pemeriksaan_fisik = json.loads(pemeriksaan_fisik)
+                    ps_dt = datetime.fromisoformat(period_start.replace("Z", "+00:00"))
+                    pe_dt = datetime.fromisoformat(period_end.replace("Z", "+00:00"))
+                    if pe_dt < ps_dt:
+                        pe_dt = ps_dt + timedelta(hours=3)
+                        period_end = pe_dt.isoformat().replace("+00:00", "Z")
                 except Exception:
-                    # jika JSON invalid, coba eval aman (tidak dianjurkan), atau set None
-                    try:
-                        pemeriksaan_fisik = json.loads(pemeriksaan_fisik.replace("'", '"'))
-                    except Exception:
-                        print(f"⚠️ idrawat={encounter_identifier_value}: pemeriksaan_fisik tidak dapat di-parse, nilai asli: {row.get('pemeriksaan_fisik')}")
-                        pemeriksaan_fisik = {}
+                    # jika parse gagal, biarkan apa adanya
+                    pass
 
-            if pemeriksaan_fisik is None:
-                pemeriksaan_fisik = {}
+                location_id = row.get('id_location') or row.get('id_location')
+                location_display = row.get('nama_organisasi')
 
-            # Pisah tekanan darah
-            td = pemeriksaan_fisik.get('tekanan_darah') or pemeriksaan_fisik.get('tekanan-darah') or pemeriksaan_fisik.get('blood_pressure')
-            if isinstance(td, str) and '/' in td:
-                try:
-                    systolic_s, diastolic_s = td.split('/', 1)
-                    systolic = parse_number_string(systolic_s)
-                    diastolic = parse_number_string(diastolic_s)
-                    # pastikan int jika memungkinkan
+                # parsing pemeriksaan_fisik (bisa string JSON atau dict)
+                pemeriksaan_fisik = row.get('pemeriksaan_fisik')
+                if isinstance(pemeriksaan_fisik, str):
                     try:
-                        systolic = int(systolic)
+                        pemeriksaan_fisik = json.loads(pemeriksaan_fisik)
                     except Exception:
-                        pass
+                        # jika JSON invalid, coba eval aman (tidak dianjurkan), atau set None
+                        try:
+                            pemeriksaan_fisik = json.loads(pemeriksaan_fisik.replace("'", '"'))
+                        except Exception:
+                            logger.warning(f"⚠️ idrawat={encounter_identifier_value}: pemeriksaan_fisik tidak dapat di-parse, nilai asli: {row.get('pemeriksaan_fisik')}")
+                            pemeriksaan_fisik = {}
+
+                if pemeriksaan_fisik is None:
+                    pemeriksaan_fisik = {}
+
+                # Pisah tekanan darah
+                td = pemeriksaan_fisik.get('tekanan_darah') or pemeriksaan_fisik.get('tekanan-darah') or pemeriksaan_fisik.get('blood_pressure')
+                if isinstance(td, str) and '/' in td:
                     try:
-                        diastolic = int(diastolic)
+                        systolic_s, diastolic_s = td.split('/', 1)
+                        systolic = parse_number_string(systolic_s)
+                        diastolic = parse_number_string(diastolic_s)
+                        # pastikan int jika memungkinkan
+                        try:
+                            systolic = int(systolic)
+                        except Exception:
+                            pass
+                        try:
+                            diastolic = int(diastolic)
+                        except Exception:
+                            pass
+                        pemeriksaan_fisik['sistolik'] = systolic
+                        pemeriksaan_fisik['diastolik'] = diastolic
                     except Exception:
-                        pass
-                    pemeriksaan_fisik['sistolik'] = systolic
-                    pemeriksaan_fisik['diastolik'] = diastolic
-                except Exception:
-                    pemeriksaan_fisik['sistolik'] = None
-                    pemeriksaan_fisik['diastolik'] = None
+                        pemeriksaan_fisik['sistolik'] = None
+                        pemeriksaan_fisik['diastolik'] = None
+
+                # Konversi field numeric lainnya dengan normalisasi koma->titik dulu
+                int_fields = ['nadi', 'pernapasan', 'berat_badan', 'tinggi_badan', 'spo2']
+                float_fields = ['suhu', 'bmi']
+
+                for k in int_fields:
+                    if k in pemeriksaan_fisik:
+                        val = parse_number_string(pemeriksaan_fisik.get(k))
+                        try:
+                            pemeriksaan_fisik[k] = int(val) if val is not None else None
+                        except Exception:
+                            pemeriksaan_fisik[k] = val  # tinggalkan apa adanya jika tidak bisa cast
 
-            # Konversi field numeric lainnya dengan normalisasi koma->titik dulu
-            int_fields = ['nadi', 'pernapasan', 'berat_badan', 'tinggi_badan', 'spo2']
-            float_fields = ['suhu', 'bmi']
+                for k in float_fields:
+                    if k in pemeriksaan_fisik:
+                        val = parse_number_string(pemeriksaan_fisik.get(k))
+                        try:
+                            pemeriksaan_fisik[k] = float(val) if val is not None else None
+                        except Exception:
+                            pemeriksaan_fisik[k] = val
 
-            for k in int_fields:
-                if k in pemeriksaan_fisik:
-                    val = parse_number_string(pemeriksaan_fisik.get(k))
+                # Ambil nilai yang diperlukan untuk payload
+                temperature = pemeriksaan_fisik.get('suhu') if pemeriksaan_fisik.get('suhu') is not None else 36
+                heart_rate = pemeriksaan_fisik.get('nadi') if pemeriksaan_fisik.get('nadi') is not None else 80
+                respiratory_rate = pemeriksaan_fisik.get('pernapasan') if pemeriksaan_fisik.get('pernapasan') is not None else 20
+                systolic_bp = pemeriksaan_fisik.get('sistolik') if pemeriksaan_fisik.get('sistolik') is not None else 120
+                diastolic_bp = pemeriksaan_fisik.get('diastolik')   if pemeriksaan_fisik.get('diastolik') is not None else 80
+                data_payload = {
+                    patient_id,
+                    patient_name,
+                    practitioner_id,
+                    practitioner_name,
+                    organization_id,
+                    encounter_identifier_system,
+                    encounter_identifier_value,
+                    encounter_class_code,
+                    encounter_class_display,
+                    period_start,
+                    period_end,
+                    location_id,
+                    location_display,
+                    temperature,
+                    heart_rate,
+                    respiratory_rate,
+                    systolic_bp,
+                    diastolic_bp                
+                }
+                # print(f"ℹ️ idrawat={encounter_identifier_value} payload vital signs:", data_payload)
+                # continue
+                consent_action = 'OPTIN'
+                consent_agent = 'System'
+                skip_consent = False
+                skip_vital_signs = False
+                skip_conditions = False
+                auto_finish_encounter = False
+                diagnosis_list = []
+                # tetap kosong kecuali ada mapping ICDX
+
+                url = gateway_url("/api/workflow/complete-visit")
+                resp = session.post(url, json={
+                    "patient_id": patient_id,
+                    "patient_name": patient_name,
+                    "practitioner_id": practitioner_id,
+                    "practitioner_name": practitioner_name,
+                    "organization_id": organization_id,
+                    "encounter_identifier_system": encounter_identifier_system,
+                    "encounter_identifier_value": encounter_identifier_value,
+                    "encounter_class_code": encounter_class_code,
+                    "encounter_class_display": encounter_class_display,
+                    "period_start": period_start,
+                    "period_end": period_end,
+                    "location_id": location_id,
+                    "location_display": location_display,
+                    "diagnosis_list": diagnosis_list,
+                    "temperature": temperature,
+                    "heart_rate": heart_rate,
+                    "respiratory_rate": respiratory_rate,
+                    "systolic_bp": systolic_bp,
+                    "diastolic_80p": diastolic_bp,   # menjaga nama field lama jika API mengharapkannya
+                    "consent_action": consent_action,
+                    "consent_agent": consent_agent,
+                    "skip_consent": skip_consent,
+                    "skip_vital_signs": skip_vital_signs,
+                    "skip_conditions": skip_conditions,
+                    "auto_finish_encounter": auto_finish_encounter
+                }, timeout=15)
+
+                if resp.status_code != 200:
+                    body = None
                     try:
-                        pemeriksaan_fisik[k] = int(val) if val is not None else None
+                        body = resp.text
                     except Exception:
-                        pemeriksaan_fisik[k] = val  # tinggalkan apa adanya jika tidak bisa cast
-
-            for k in float_fields:
-                if k in pemeriksaan_fisik:
-                    val = parse_number_string(pemeriksaan_fisik.get(k))
+                        body = "<unable to read response body>"
+                    logger.error(f"❌ idrawat={encounter_identifier_value} -> HTTP {resp.status_code} {getattr(resp, 'reason', '')}\nResponse body: {body}")
+                    # jika server mengembalikan OperationOutcome di body, coba tampilkan issue-nya
                     try:
-                        pemeriksaan_fisik[k] = float(val) if val is not None else None
+                        parsed = resp.json()
+                        if isinstance(parsed, dict) and parsed.get('resourceType') == 'OperationOutcome':
+                            issues = parsed.get('issue', [])
+                            for issue in issues:
+                                logger.error("  OperationOutcome: %s expr: %s", issue.get('details', {}).get('text'), issue.get('expression'))
                     except Exception:
-                        pemeriksaan_fisik[k] = val
-
-            # Ambil nilai yang diperlukan untuk payload
-            temperature = pemeriksaan_fisik.get('suhu') if pemeriksaan_fisik.get('suhu') is not None else 36
-            heart_rate = pemeriksaan_fisik.get('nadi') if pemeriksaan_fisik.get('nadi') is not None else 80
-            respiratory_rate = pemeriksaan_fisik.get('pernapasan') if pemeriksaan_fisik.get('pernapasan') is not None else 20
-            systolic_bp = pemeriksaan_fisik.get('sistolik') if pemeriksaan_fisik.get('sistolik') is not None else 120
-            diastolic_bp = pemeriksaan_fisik.get('diastolik')   if pemeriksaan_fisik.get('diastolik') is not None else 80
-            data_payload = {
-                patient_id,
-                patient_name,
-                practitioner_id,
-                practitioner_name,
-                organization_id,
-                encounter_identifier_system,
-                encounter_identifier_value,
-                encounter_class_code,
-                encounter_class_display,
-                period_start,
-                period_end,
-                location_id,
-                location_display,
-                temperature,
-                heart_rate,
-                respiratory_rate,
-                systolic_bp,
-                diastolic_bp                
-            }
-            # print(f"ℹ️ idrawat={encounter_identifier_value} payload vital signs:", data_payload)
-            # continue
-            consent_action = 'OPTIN'
-            consent_agent = 'System'
-            skip_consent = False
-            skip_vital_signs = False
-            skip_conditions = False
-            auto_finish_encounter = False
-            diagnosis_list = []
-            # tetap kosong kecuali ada mapping ICDX
-
-            url = f"http://localhost:8008/api/workflow/complete-visit"
-            resp = requests.post(url, json={
-                "patient_id": patient_id,
-                "patient_name": patient_name,
-                "practitioner_id": practitioner_id,
-                "practitioner_name": practitioner_name,
-                "organization_id": organization_id,
-                "encounter_identifier_system": encounter_identifier_system,
-                "encounter_identifier_value": encounter_identifier_value,
-                "encounter_class_code": encounter_class_code,
-                "encounter_class_display": encounter_class_display,
-                "period_start": period_start,
-                "period_end": period_end,
-                "location_id": location_id,
-                "location_display": location_display,
-                "diagnosis_list": diagnosis_list,
-                "temperature": temperature,
-                "heart_rate": heart_rate,
-                "respiratory_rate": respiratory_rate,
-                "systolic_bp": systolic_bp,
-                "diastolic_80p": diastolic_bp,   # menjaga nama field lama jika API mengharapkannya
-                "consent_action": consent_action,
-                "consent_agent": consent_agent,
-                "skip_consent": skip_consent,
-                "skip_vital_signs": skip_vital_signs,
-                "skip_conditions": skip_conditions,
-                "auto_finish_encounter": auto_finish_encounter
-            }, timeout=15)
-
-            if resp.status_code != 200:
-                body = None
+                        pass
+                    continue
+
                 try:
-                    body = resp.text
-                except Exception:
-                    body = "<unable to read response body>"
-                print(f"❌ idrawat={encounter_identifier_value} -> HTTP {resp.status_code} {getattr(resp, 'reason', '')}\nResponse body: {body}")
-                # jika server mengembalikan OperationOutcome di body, coba tampilkan issue-nya
+                    data = resp.json()
+                except ValueError:
+                    logger.warning(f"⚠️ idrawat={encounter_identifier_value} -> Response is not valid JSON, body: {resp.text}")
+                    continue
+
+                # Extract encounter id defensively from multiple possible response shapes
+                id_encounter = None
                 try:
-                    parsed = resp.json()
-                    if isinstance(parsed, dict) and parsed.get('resourceType') == 'OperationOutcome':
-                        issues = parsed.get('issue', [])
-                        for issue in issues:
-                            print("  OperationOutcome:", issue.get('details', {}).get('text'), "expr:", issue.get('expression'))
+                    if isinstance(data, dict):
+                        top = data
+                        inner = top.get('data') or {}
+                        # primary expected path
+                        id_encounter = inner.get('consent', {}).get('data', {}).get('id')
+                        # fallback to encounter path
+                        if not id_encounter:
+                            id_encounter = inner.get('encounter', {}).get('encounter_id')
+                        # other possible shapes: consent/encounter at top level
+                        if not id_encounter:
+                            id_encounter = top.get('consent', {}).get('data', {}).get('id') or top.get('encounter', {}).get('encounter_id')
+                        # last resort: any top-level id
+                        if not id_encounter:
+                            id_encounter = top.get('id')
                 except Exception:
-                    pass
-                continue
+                    id_encounter = None
 
-            try:
-                data = resp.json()
-            except ValueError:
-                print(f"⚠️ idrawat={encounter_identifier_value} -> Response is not valid JSON, body: {resp.text}")
-                continue
+                logger.info(f"✅ idrawat={encounter_identifier_value} -> sukses: {id_encounter}")
 
-            # Extract encounter id defensively from multiple possible response shapes
-            id_encounter = None
-            try:
-                if isinstance(data, dict):
-                    top = data
-                    inner = top.get('data') or {}
-                    # primary expected path
-                    id_encounter = inner.get('consent', {}).get('data', {}).get('id')
-                    # fallback to encounter path
-                    if not id_encounter:
-                        id_encounter = inner.get('encounter', {}).get('encounter_id')
-                    # other possible shapes: consent/encounter at top level
-                    if not id_encounter:
-                        id_encounter = top.get('consent', {}).get('data', {}).get('id') or top.get('encounter', {}).get('encounter_id')
-                    # last resort: any top-level id
-                    if not id_encounter:
-                        id_encounter = top.get('id')
-            except Exception:
-                id_encounter = None
+                # POST di atas membuat encounter baru (tidak idempotent): id langsung ditulis,
+                # bukan ditampung, agar crash tidak membuat encounter ganda di run berikutnya
+                if db.execute_query("UPDATE rawat SET id_encounter = %s WHERE id = %s",
+                                    (id_encounter, row.get('id'))) is None:
+                    logger.error(f"❌ idrawat={encounter_identifier_value} -> encounter {id_encounter} "
+                                 f"sudah dibuat tapi gagal disimpan ke database")
+                    continue
+                updated += 1
 
-            print(f"    id_encounter: {id_encounter}")  
-            print(f"✅ idrawat={encounter_identifier_value} -> sukses:", id_encounter)
-           
-            db.execute_query("""
-            UPDATE rawat SET id_encounter=%s WHERE id=%s
-            """, (id_encounter if id_encounter is not None else None, row.get('id')))
-            updated += 1
+            except Exception:
+                logger.exception("❌ Gagal memproses baris rawat")
+                continue
+    except DB_ERRORS as e:
+        logger.error(f"❌ Gagal membaca data rawat: {e}")
+        input("\nTekan Enter untuk melanjutkan...")
+        return
 
-        except Exception:
-            traceback.print_exc()
-            continue
+    if not found:
+        logger.info("📭 Tidak ada pasien yang perlu disinkronisasi.")
+        input("\nTekan Enter untuk melanjutkan...")
+        return
 
-    print(f"\n📊 Ditemukan {len(get_data)} pasien yang belum tersinkronisasi. Berhasil dikirim: {updated}")
+    logger.info(f"📊 Ditemukan {found} pasien yang belum tersinkronisasi. Berhasil dikirim: {updated}")
 
-singkron_rawat()
\ No newline at end of file
+if __name__ == "__main__":
+    # Batch job: log lewat antrian agar loop tidak menunggu I/O terminal
+    setup_logging(quiet='--quiet' in sys.argv, queued=True)
+    singkron_rawat()
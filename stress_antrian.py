@@ -0,0 +1,92 @@
+"""Uji beban alokasi nomor antrian: banyak thread mengambil antrian bersamaan
+
+Contoh (database sementara SQLite):
+    DB_BACKEND=sqlite DB_SQLITE_PATH=stress.db python stress_antrian.py --threads 16 --tiket 200
+
+Data uji (poliklinik, dokter, pasien dan antriannya) dihapus kembali di akhir
+kecuali --keep dipakai.
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Uji beban alokasi nomor antrian")
+    parser.add_argument('--threads', type=int, default=16, help="jumlah loket bersamaan")
+    parser.add_argument('--tiket', type=int, default=100, help="jumlah tiket per thread")
+    parser.add_argument('--keep', action='store_true', help="jangan hapus data uji")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Setiap thread butuh koneksinya sendiri; harus di-set sebelum database diimport
+    os.environ.setdefault('DB_POOL_SIZE', str(args.threads))
+
+    from database import db
+    from log_config import setup_logging
+    from models import Antrian
+
+    setup_logging()
+    if not db.create_database_and_tables():
+        return 1
+
+    label = f"STRESS-{int(time.time())}"
+    id_poli = db.execute_query("INSERT INTO poliklinik (nama_poli) VALUES (%s)", (label,))
+    id_dokter = db.execute_query("INSERT INTO dokter (nomor_sip, nama_dokter) VALUES (%s, %s)", (label, label))
+    id_pasien = db.execute_query("INSERT INTO pasien (nomor_rm, nama_lengkap) VALUES (%s, %s)", (label, label))
+    tanggal = date.today()
+
+    failures = []
+    start = threading.Barrier(args.threads)
+
+    def loket():
+        start.wait()
+        for _ in range(args.tiket):
+            antrian = Antrian(id_pasien=id_pasien, id_dokter=id_dokter,
+                              id_poliklinik=id_poli, tanggal_kunjungan=tanggal)
+            if not antrian.save():
+                failures.append(antrian)
+
+    threads = [threading.Thread(target=loket) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    rows = db.fetch_query(
+        "SELECT nomor_antrian FROM antrian WHERE id_poliklinik = %s AND tanggal_kunjungan = %s",
+        (id_poli, tanggal)) or []
+    numbers = [r['nomor_antrian'] for r in rows]
+    expected = args.threads * args.tiket
+    duplicates = len(numbers) - len(set(numbers))
+    gaps = len(set(range(1, len(numbers) + 1)) - set(numbers))
+
+    logger.info(f"🎫 {len(numbers)}/{expected} tiket dalam {elapsed:.2f} detik "
+                f"({len(numbers) / elapsed:.0f} tiket/detik)")
+    logger.info(f"   Gagal: {len(failures)}, nomor ganda: {duplicates}, nomor terlewat: {gaps}")
+
+    if not args.keep:
+        db.execute_query("DELETE FROM antrian WHERE id_poliklinik = %s", (id_poli,))
+        db.execute_query("DELETE FROM antrian_counter WHERE id_poliklinik = %s", (id_poli,))
+        db.execute_query("DELETE FROM pasien WHERE id = %s", (id_pasien,))
+        db.execute_query("DELETE FROM dokter WHERE id = %s", (id_dokter,))
+        db.execute_query("DELETE FROM poliklinik WHERE id = %s", (id_poli,))
+    db.disconnect()
+
+    ok = duplicates == 0 and gaps == 0 and not failures and len(numbers) == expected
+    logger.info("✅ Tidak ada nomor ganda" if ok else "❌ Uji beban gagal")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
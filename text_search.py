@@ -0,0 +1,56 @@
+import re
+import unicodedata
+
+# Apostrof/titik di tengah nama dihapus (Nur'aini -> nuraini, M.Rizki -> mrizki)
+_JOINERS = re.compile(r"['`’.]")
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+# Panjang token minimal FULLTEXT InnoDB (innodb_ft_min_token_size)
+FULLTEXT_MIN_TOKEN = 3
+
+
+def normalize_nama(text):
+    """Menormalkan nama untuk pencarian: huruf kecil, tanpa aksen, spasi tunggal
+
+    "Siti  Nurhaliza", "SİTİ NURHALİZA" dan "Sití Nurhalíza" semuanya menjadi
+    "siti nurhaliza".
+    """
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    ascii_text = ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    ascii_text = _JOINERS.sub('', ascii_text)
+    return _NON_WORD.sub(' ', ascii_text).strip()
+
+
+def fulltext_query(normalized):
+    """Query BOOLEAN MODE: setiap kata wajib ada sebagai awalan kata (+kata*)
+
+    Kata yang lebih pendek dari FULLTEXT_MIN_TOKEN tidak terindeks sehingga
+    dilewati; None jika tidak ada kata yang bisa dipakai.
+    """
+    words = [w for w in normalized.split() if len(w) >= FULLTEXT_MIN_TOKEN]
+    if not words:
+        return None
+    return ' '.join(f"+{w}*" for w in words)
+
+
+def rank_nama(normalized_name, normalized_query):
+    """Peringkat kecocokan (lebih kecil lebih baik)
+
+    0 = sama persis, 1 = awalan nama, 2 = setiap kata query awalan kata nama
+    berurutan, 3 = cocok sebagian (hasil full-text).
+    """
+    if normalized_name == normalized_query:
+        return 0
+    if normalized_name.startswith(normalized_query):
+        return 1
+    words = normalized_name.split()
+    position = 0
+    for term in normalized_query.split():
+        while position < len(words) and not words[position].startswith(term):
+            position += 1
+        if position == len(words):
+            return 3
+        position += 1
+    return 2